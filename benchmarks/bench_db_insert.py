@@ -0,0 +1,122 @@
+import datetime
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import click
+
+from tidal.db import TidalDatabase
+from tidal.tide_dto import (AreaID, DailyTideRecord, PortID, Tide,
+                            TideLocation, TideType)
+
+# average gap between two extremes of a semi-diurnal tide
+TIDE_INTERVAL = datetime.timedelta(hours=6, minutes=12, seconds=30)
+
+
+def synthetic_year(
+    num_ports: int, seed: int = 0, num_days: int = 365
+) -> List[List[DailyTideRecord]]:
+    """a year (or `num_days`) of tides for each port, one list of daily records per port"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    end = start + datetime.timedelta(days=num_days)
+    ports = list()
+    for i in range(num_ports):
+        location = TideLocation(
+            region_name=f"Region {i % 12}",
+            name=f"Port {i}",
+            area_id=AreaID(str(i % 12)),
+            port_id=PortID(f"{i:04d}"),
+        )
+        days = dict()
+        when = start + datetime.timedelta(minutes=rng.randint(0, 360))
+        tide_type = rng.choice([TideType.LOW, TideType.HIGH])
+        while when < end:
+            height = rng.uniform(0.1, 2.0) if tide_type == TideType.LOW else rng.uniform(3.0, 6.5)
+            days.setdefault(when.date(), list()).append(
+                Tide(tide_type, utc_datetime=when, height=round(height, 1))
+            )
+            when += TIDE_INTERVAL
+            tide_type = TideType.HIGH if tide_type == TideType.LOW else TideType.LOW
+        ports.append([DailyTideRecord(location=location, tides=tides) for tides in days.values()])
+    return ports
+
+
+def legacy_ingest(database_file: Path, ports: List[List[DailyTideRecord]]) -> None:
+    """the original path: REPLACE table, one execute per row, commit per port"""
+    con = sqlite3.connect(database_file)
+    cursor = con.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS tidal (location TEXT, area_id TEXT, port_id TEXT,"
+        "utc_datetime TEXT, tide_type TEXT, height REAL,"
+        "UNIQUE (port_id, utc_datetime) ON CONFLICT REPLACE )"
+    )
+    insert_sql = (
+        "INSERT INTO tidal (location, area_id, port_id, utc_datetime, tide_type, height) "
+        "VALUES(?,?,?,?,?,?) "
+    )
+    for records in ports:
+        for daily_tides in records:
+            for tide in daily_tides.tides:
+                cursor.execute(
+                    insert_sql,
+                    (
+                        daily_tides.location.name,
+                        daily_tides.location.area_id,
+                        daily_tides.location.port_id,
+                        tide.utc_datetime.isoformat(),
+                        tide.type.value,
+                        tide.height,
+                    ),
+                )
+        con.commit()
+    con.close()
+
+
+def bulk_ingest(database_file: Path, ports: List[List[DailyTideRecord]], batch_size: int) -> None:
+    tide_database = TidalDatabase(database_file, "tidal")
+    tide_database.create_table()
+    for i in range(0, len(ports), batch_size):
+        tide_database.insert_many(ports[i: i + batch_size])
+    tide_database.close()
+
+
+def timed(name: str, num_rows: int, func: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    click.echo(f"{name:>32}: {elapsed:7.2f} s  {num_rows / elapsed:10.0f} rows/s")
+    return elapsed
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=553, help="num of synthetic ports")
+@click.option(
+    "-b", "--batch-size", type=int, default=50, help="ports per transaction for bulk ingest"
+)
+def main(num_ports: int, batch_size: int):
+    ports = synthetic_year(num_ports)
+    num_rows = sum(len(daily.tides) for records in ports for daily in records)
+    click.echo(f"{num_ports} ports, {num_rows} tides")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_file = Path(tmp_dir) / "legacy.db"
+        bulk_file = Path(tmp_dir) / "bulk.db"
+        before = timed("legacy (first load)", num_rows, lambda: legacy_ingest(legacy_file, ports))
+        timed("legacy (reload, unchanged)", num_rows, lambda: legacy_ingest(legacy_file, ports))
+        after = timed("bulk (first load)", num_rows, lambda: bulk_ingest(bulk_file, ports, batch_size))
+        timed("bulk (reload, unchanged)", num_rows, lambda: bulk_ingest(bulk_file, ports, batch_size))
+        click.echo(f"first load speedup x{before / after:.1f}")
+        for name, path in (("legacy", legacy_file), ("bulk", bulk_file)):
+            # fold the WAL back in so the file size is comparable
+            con = sqlite3.connect(path)
+            con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            con.close()
+            click.echo(f"{name:>32}: {path.stat().st_size / 1024 / 1024:7.1f} MiB on disk")
+
+
+if __name__ == "__main__":
+    main()
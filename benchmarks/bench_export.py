@@ -0,0 +1,98 @@
+import datetime
+import itertools
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from bench_db_insert import synthetic_year
+from tidal.db import TidalDatabase
+from tidal.export import TideExport, export_tides
+from tidal.utils.store import JSONStore
+
+
+def dir_size_mib(path: Path) -> float:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 1024 / 1024
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=553, help="num of synthetic ports")
+@click.option(
+    "-w", "--num-workers", default="1,4", help="comma separated num of export processes"
+)
+@click.option("-r", "--repeat", type=int, default=200, help="slice reads of each export")
+def main(num_ports: int, num_workers: str, repeat: int):
+    year = synthetic_year(num_ports)
+    num_tides = sum(len(record.tides) for port in year for record in port)
+    rng = random.Random(1)
+    slices = list()
+    for _ in range(repeat):
+        start = datetime.datetime(2024, 1, 1) + datetime.timedelta(days=rng.randrange(358))
+        slices.append(
+            (
+                [f"{rng.randrange(num_ports):04d}" for _ in range(5)],
+                start,
+                start + datetime.timedelta(days=7),
+            )
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        database_file = tmp / "tidal.db"
+        tide_database = TidalDatabase(database_file, "tidal")
+        tide_database.create_table()
+        tide_database.insert_many(year)
+
+        click.echo(
+            f"{num_ports} ports, {num_tides} tides\n"
+            f"{'export':>22} {'workers':>8} {'seconds':>8} {'tides/s':>10} {'MiB':>7} "
+            f"{'5 ports x 7 days ms':>20}"
+        )
+        for suffix in ("jsonl", "jsonl.gz"):
+            start = time.perf_counter()
+            path = tmp / f"tides.{suffix}"
+            JSONStore.save_lines(itertools.chain.from_iterable(year), path)
+            elapsed = time.perf_counter() - start
+            click.echo(
+                f"{'JSONStore ' + suffix:>22} {1:>8} {elapsed:>8.2f} {num_tides / elapsed:>10.0f} "
+                f"{path.stat().st_size / 1024 / 1024:>7.1f} {'':>20}"
+            )
+
+        start = time.perf_counter()
+        for port_ids, start_date, end_date in slices:
+            tide_database.query_tides_columnar(port_ids, start_date, end_date)
+        click.echo(
+            f"{'sqlite':>22} {'':>8} {'':>8} {'':>10} "
+            f"{database_file.stat().st_size / 1024 / 1024:>7.1f} "
+            f"{(time.perf_counter() - start) / repeat * 1000:>20.3f}"
+        )
+        tide_database.close()
+
+        for shard_by, fmt in (("port", "npy"), ("port", "npz"), ("month", "npz")):
+            for workers in map(int, num_workers.split(",")):
+                directory = tmp / f"{shard_by}-{fmt}-{workers}"
+                start = time.perf_counter()
+                export_tides(
+                    database_file,
+                    "tidal",
+                    directory,
+                    shard_by=shard_by,
+                    fmt=fmt,
+                    num_workers=workers,
+                )
+                elapsed = time.perf_counter() - start
+                export = TideExport(directory)
+                start = time.perf_counter()
+                for port_ids, start_date, end_date in slices:
+                    export.query(port_ids, start_date, end_date)
+                read_ms = (time.perf_counter() - start) / repeat * 1000
+                click.echo(
+                    f"{shard_by + ' ' + fmt:>22} {workers:>8} {elapsed:>8.2f} "
+                    f"{num_tides / elapsed:>10.0f} {dir_size_mib(directory):>7.1f} {read_ms:>20.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import datetime
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+
+from bench_db_insert import synthetic_year
+from tidal.db import TidalDatabase
+from tidal.interpolate import METHODS, CurveCache, TideCurve
+from tidal.reader import TidalReader
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=100, help="num of synthetic ports")
+@click.option(
+    "-s", "--num-samples", type=int, default=5_000_000, help="num of points to evaluate"
+)
+@click.option("-d", "--num-days", type=int, default=2000, help="num of cached day requests")
+def main(num_ports: int, num_samples: int, num_days: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_file = Path(tmp_dir) / "tidal.db"
+        tide_database = TidalDatabase(database_file, "tidal")
+        tide_database.create_table()
+        tide_database.insert_many(synthetic_year(num_ports))
+        start = datetime.datetime(2024, 1, 1)
+        end = datetime.datetime(2025, 1, 1)
+        columns = tide_database.query_tides_columnar(None, start, end)
+        click.echo(f"{num_ports} ports, {len(columns)} extremes")
+
+        rng = np.random.default_rng(0)
+        port = rng.integers(0, num_ports, num_samples)
+        ts = rng.integers(columns.ts.min(), columns.ts.max(), num_samples)
+        for method in METHODS:
+            curve = TideCurve(columns, method=method)
+            began = time.perf_counter()
+            curve.heights(ts, port)
+            elapsed = time.perf_counter() - began
+            click.echo(f"{method + ' heights':>28}: {num_samples / elapsed / 1e6:8.2f} M points/s")
+            began = time.perf_counter()
+            windows = curve.windows_below(1.0)
+            elapsed = time.perf_counter() - began
+            click.echo(
+                f"{method + ' windows below 1m':>28}: {elapsed * 1000:8.2f} ms, "
+                f"{len(windows)} windows"
+            )
+
+        # a dashboard asking for whole days of one port at a time
+        reader = TidalReader(database_file, "tidal")
+        days = [start.date() + datetime.timedelta(days=int(d)) for d in rng.integers(0, 7, num_days)]
+        port_ids = [columns.port_ids[int(p)] for p in rng.integers(0, num_ports, num_days)]
+        for label, cache_size in (("uncached", 0), ("cached", num_ports * 7)):
+            cache = CurveCache(reader, cache_size=cache_size)
+            began = time.perf_counter()
+            for port_id, day in zip(port_ids, days):
+                cache.sample_day(port_id, day, num_points=288)
+            elapsed = time.perf_counter() - began
+            click.echo(
+                f"{'days of 288 points, ' + label:>28}: {num_days / elapsed:8.0f} days/s, "
+                f"{num_days * 288 / elapsed:10.0f} points/s"
+            )
+        reader.close()
+        tide_database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import datetime
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import click
+
+from tidal.tide_dto import (AreaID, DailyTideRecord, PortID, Tide,
+                            TideLocation, TideType)
+from tidal.utils.serialization import SERIALIZERS
+from tidal.utils.store import JSONStore
+
+TIDES_PER_RECORD = 4
+
+
+def synthetic_records(num_tides: int) -> Iterator[DailyTideRecord]:
+    """daily records of 4 tides each, cycling over 553 ports"""
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(num_tides // TIDES_PER_RECORD):
+        port, day = i % 553, i // 553
+        location = TideLocation(
+            region_name=f"Region {port % 12}",
+            name=f"Port {port}",
+            area_id=AreaID(str(port % 12)),
+            port_id=PortID(f"{port:04d}"),
+        )
+        when = start + datetime.timedelta(days=day, minutes=port)
+        yield DailyTideRecord(
+            location=location,
+            tides=[
+                Tide(
+                    TideType.LOW if j % 2 else TideType.HIGH,
+                    utc_datetime=when + datetime.timedelta(minutes=372 * j),
+                    height=round(0.5 + (i * 7 + j) % 55 / 10, 1),
+                )
+                for j in range(TIDES_PER_RECORD)
+            ],
+        )
+
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_save(path: str, num_tides: int, serializer: str) -> Tuple[float, float]:
+    start = time.perf_counter()
+    JSONStore.save_lines(synthetic_records(num_tides), Path(path), serializer=serializer)
+    return time.perf_counter() - start, _peak_rss_mib()
+
+
+def run_load(
+    path: str, serializer: str, batch_size: int, threaded_gzip: bool
+) -> Tuple[float, float]:
+    start = time.perf_counter()
+    count = 0
+    for batch in JSONStore.load_batches(
+        Path(path),
+        DailyTideRecord,
+        serializer=serializer,
+        batch_size=batch_size,
+        threaded_gzip=threaded_gzip,
+    ):
+        count += sum(len(record.tides) for record in batch)
+    return time.perf_counter() - start, _peak_rss_mib()
+
+
+def in_subprocess(func, *args) -> Tuple[float, float]:
+    # a fresh process per scenario, so peak RSS is not inherited
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+@click.command()
+@click.option(
+    "-n", "--num-tides", type=int, default=2_000_000, help="num of tide records"
+)
+@click.option(
+    "-d",
+    "--work-dir",
+    type=Path,
+    default=None,
+    help="where to write the export, a temporary directory by default",
+)
+def main(num_tides: int, work_dir: Path):
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        path = str(Path(tmp_dir) / "tides.jsonl.gz")
+        click.echo(f"{num_tides} tides in {num_tides // TIDES_PER_RECORD} lines")
+
+        for serializer in SERIALIZERS:
+            elapsed, rss = in_subprocess(run_save, path, num_tides, serializer)
+            click.echo(
+                f"{'save ' + serializer:>34}: {num_tides / elapsed:10.0f} tides/s  "
+                f"peak RSS {rss:6.0f} MiB"
+            )
+        click.echo(f"{'file size':>34}: {Path(path).stat().st_size / 1024 / 1024:10.1f} MiB")
+
+        scenarios = [
+            ("load pyserde, line by line", "pyserde", 1, False),
+        ]
+        if "orjson" in SERIALIZERS:
+            scenarios += [
+                ("load orjson, batched", "orjson", 4096, False),
+                ("load orjson, batched + gz thread", "orjson", 4096, True),
+            ]
+        for name, serializer, batch_size, threaded_gzip in scenarios:
+            elapsed, rss = in_subprocess(run_load, path, serializer, batch_size, threaded_gzip)
+            click.echo(
+                f"{name:>34}: {num_tides / elapsed:10.0f} tides/s  peak RSS {rss:6.0f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
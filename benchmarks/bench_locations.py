@@ -0,0 +1,81 @@
+import random
+import time
+from typing import Callable, Dict, List
+
+import click
+
+from tidal.locations import Coordinates, LocationSearch, distance_km
+from tidal.tide_dto import AreaID, PortID, TideLocation
+
+
+def synthetic_catalogue(num_ports: int, seed: int = 0):
+    """ports spread around the coasts of the world, with made up names"""
+    rng = random.Random(seed)
+    consonants, vowels = "bcdfghklmnprstvwy", "aeiou"
+    # a vocabulary that grows with the catalogue, like real place names
+    words = [
+        "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4)))
+        for _ in range(max(num_ports // 5, 100))
+    ]
+    locations: List[TideLocation] = list()
+    coordinates: Dict[PortID, Coordinates] = dict()
+    for i in range(num_ports):
+        name = " ".join(rng.choice(words).capitalize() for _ in range(rng.randint(1, 3)))
+        port_id = PortID(f"{i:07d}")
+        locations.append(TideLocation(f"Region {i % 50}", name, AreaID(str(i % 50)), port_id))
+        coordinates[port_id] = Coordinates(rng.uniform(-70, 75), rng.uniform(-180, 180))
+    return locations, coordinates
+
+
+def per_call_us(func: Callable[[], object], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+@click.command()
+@click.option(
+    "-s", "--sizes", default="553,10000,100000", help="comma separated catalogue sizes"
+)
+@click.option("-r", "--repeat", type=int, default=200, help="queries of each kind")
+def main(sizes: str, repeat: int):
+    rng = random.Random(1)
+    click.echo(
+        f"{'ports':>8} {'build ms':>9} {'radius 50km':>12} {'nearest 5':>10} "
+        f"{'name':>8} {'fuzzy':>8} {'scan':>9}  (us per query)"
+    )
+    for num_ports in map(int, sizes.split(",")):
+        locations, coordinates = synthetic_catalogue(num_ports)
+        start = time.perf_counter()
+        search = LocationSearch(locations, coordinates)
+        build_ms = (time.perf_counter() - start) * 1000
+        points = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(repeat)]
+        names = [rng.choice(locations).name for _ in range(repeat)]
+        queries = iter(range(10**9))
+
+        def point():
+            return points[next(queries) % repeat]
+
+        radius = per_call_us(lambda: search.within(*point(), 50), repeat)
+        nearest = per_call_us(lambda: search.nearest(*point(), 5), repeat)
+        prefix = per_call_us(lambda: search.search(names[next(queries) % repeat][:5]), repeat)
+        # a typo in the name
+        fuzzy = per_call_us(lambda: search.search(names[next(queries) % repeat][1:]), repeat)
+
+        def scan():
+            center = Coordinates(*point())
+            return sorted(
+                (distance_km(center, coordinates[location.port_id]), location.port_id)
+                for location in locations
+            )[:5]
+
+        scan_us = per_call_us(scan, max(repeat // 20, 3))
+        click.echo(
+            f"{num_ports:>8} {build_ms:>9.0f} {radius:>12.1f} {nearest:>10.1f} "
+            f"{prefix:>8.1f} {fuzzy:>8.1f} {scan_us:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
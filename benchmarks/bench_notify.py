@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+import click
+import requests
+
+from tidal.webhook import WebhookDispatcher
+
+
+class StubWebhook(BaseHTTPRequestHandler):
+    """accepts slack style posts after `latency` seconds, fails `error_rate` of them"""
+
+    # keep-alive, so the dispatcher's pooled connections are reused
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.05
+    error_rate = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with StubWebhook.lock:
+            StubWebhook.received += 1
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections from a busy dispatcher
+    request_queue_size = 128
+
+
+def start_server() -> Tuple[ThreadingHTTPServer, str]:
+    server = StubServer(("127.0.0.1", 0), StubWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/hook"
+
+
+def serial(url: str, num_messages: int) -> int:
+    # what notify.py used to do: one requests.post per message, no session
+    sent = 0
+    for i in range(num_messages):
+        for attempt in range(5):
+            r = requests.post(url, json={"text": f"alert {i}"})
+            if r.status_code == 200:
+                sent += 1
+                break
+            time.sleep(min(300, 2 ** attempt) * 0.01)
+    return sent
+
+
+@click.command()
+@click.option("-n", "--num-messages", type=int, default=500, help="num of alerts")
+@click.option("-w", "--num-workers", type=int, default=16, help="dispatcher threads")
+@click.option("-l", "--latency", type=float, default=0.05, help="webhook latency in seconds")
+@click.option(
+    "-e", "--error-rate", type=float, default=0.05, help="share of posts answered with 503"
+)
+@click.option(
+    "-r",
+    "--rate",
+    type=float,
+    default=1000.0,
+    help="per webhook rate limit of the dispatcher, posts/s",
+)
+def main(num_messages: int, num_workers: int, latency: float, error_rate: float, rate: float):
+    StubWebhook.latency = latency
+    StubWebhook.error_rate = error_rate
+    server, url = start_server()
+
+    start = time.perf_counter()
+    sent = serial(url, num_messages)
+    elapsed = time.perf_counter() - start
+    click.echo(f"{'serial requests.post':>24}: {sent} sent in {elapsed:6.2f}s")
+
+    start = time.perf_counter()
+    with WebhookDispatcher(
+        num_workers=num_workers, rate=rate, burst=rate, max_backoff=0.1
+    ) as dispatcher:
+        for i in range(num_messages):
+            dispatcher.submit(url, {"text": f"alert {i}"})
+    elapsed = time.perf_counter() - start
+    summary = dispatcher.summary
+    click.echo(
+        f"{'WebhookDispatcher':>24}: {summary.sent} sent in {elapsed:6.2f}s, "
+        f"{summary.retried} retries, {summary.failed} failed"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import logging
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import click
+
+from tidal.providers.bbc import PARSERS
+from tidal.scraper import URL, BBCTideScraper
+from tidal.tide_dto import AreaID, PortID, TideLocation
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+LOCATION = TideLocation(
+    region_name="Benchmark", name="Fixture", area_id=AreaID("0"), port_id=PortID("0")
+)
+
+
+def time_parse(scraper: BBCTideScraper, html: str, repeat: int) -> list:
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scraper.parse_tidal_info(html, LOCATION)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def peak_allocation(scraper: BBCTideScraper, html: str) -> int:
+    tracemalloc.start()
+    scraper.parse_tidal_info(html, LOCATION)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@click.command()
+@click.option(
+    "-f",
+    "--fixture-dir",
+    type=Path,
+    default=FIXTURE_DIR,
+    help="directory of saved BBC tide table pages (*.html)",
+)
+@click.option("-r", "--repeat", type=int, default=50, help="parses per page")
+def main(fixture_dir: Path, repeat: int):
+    # the scrapers log every page, keep that out of the timings
+    logging.disable(logging.CRITICAL)
+    pages = {path.name: path.read_text("utf-8") for path in sorted(fixture_dir.glob("*.html"))}
+    if not pages:
+        raise click.ClickException(f"no *.html fixtures in {fixture_dir}")
+    scrapers = {name: BBCTideScraper(URL(""), parser=name) for name in PARSERS}
+
+    for page_name, html in pages.items():
+        results = {name: s.parse_tidal_info(html, LOCATION) for name, s in scrapers.items()}
+        if results["fast"] != results["bs4"]:
+            raise click.ClickException(f"parsers disagree on {page_name}")
+
+        click.echo(f"{page_name} ({len(html) / 1024:.0f} KiB, "
+                   f"{sum(len(r.tides) for r in results['fast'])} tides)")
+        baseline = None
+        for name in ("bs4", "fast"):
+            timings = time_parse(scrapers[name], html, repeat)
+            median = statistics.median(timings)
+            peak = peak_allocation(scrapers[name], html)
+            speedup = "" if baseline is None else f"  x{baseline / median:.1f}"
+            baseline = baseline or median
+            click.echo(
+                f"  {name:>5}: median {median * 1e3:8.3f} ms  "
+                f"min {min(timings) * 1e3:8.3f} ms  "
+                f"peak alloc {peak / 1024:8.1f} KiB{speedup}"
+            )
+
+
+if __name__ == "__main__":
+    main()
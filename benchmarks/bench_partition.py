@@ -0,0 +1,130 @@
+import datetime
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import click
+
+from bench_db_insert import synthetic_year
+from tidal.db import TidalDatabase
+from tidal.partition import (add_months, compact, drop_before,
+                             enable_partitioning, month_bounds, month_of)
+from tidal.tide_dto import DailyTideRecord, PortID, Tide
+from tidal.utils.epoch import to_epoch
+
+
+def shifted(ports: List[List[DailyTideRecord]], days: int) -> List[List[DailyTideRecord]]:
+    """the same tides, `days` earlier"""
+    delta = datetime.timedelta(days=days)
+    return [
+        [
+            DailyTideRecord(
+                location=daily.location,
+                tides=[
+                    Tide(t.type, utc_datetime=t.utc_datetime - delta, height=t.height)
+                    for t in daily.tides
+                ],
+            )
+            for daily in records
+        ]
+        for records in ports
+    ]
+
+
+def median_ms(func: Callable[[], object], repeat: int) -> float:
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def size_mib(database_file: Path) -> float:
+    tide_database = TidalDatabase(database_file, "tidal")
+    tide_database.con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    tide_database.close()
+    archive_dir = database_file.with_name(f"{database_file.name}.archive")
+    archived = sum(p.stat().st_size for p in archive_dir.iterdir()) if archive_dir.exists() else 0
+    return (database_file.stat().st_size + archived) / 1024 / 1024
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=100, help="num of synthetic ports")
+@click.option("-y", "--max-years", type=int, default=8, help="years of history at the end")
+@click.option("-r", "--repeat", type=int, default=20, help="runs of each query")
+@click.option(
+    "--compact-after-months", type=int, default=2, help="months kept in tables when partitioned"
+)
+def main(num_ports: int, max_years: int, repeat: int, compact_after_months: int):
+    year = synthetic_year(num_ports)
+    port_ids = [PortID(f"{i:04d}") for i in range(num_ports)]
+    rng = random.Random(0)
+    # the last week of the newest year
+    end = datetime.datetime(2024, 12, 31)
+    start = end - datetime.timedelta(days=7)
+    before_month = add_months(month_of(to_epoch(end)), -compact_after_months)
+    click.echo(
+        f"{num_ports} ports, 7 day window, median of {repeat} runs\n"
+        f"{'years':>5} {'layout':>12} {'one port ms':>12} {'all ports ms':>13} {'MiB':>7}"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        layouts = {
+            "single table": Path(tmp_dir) / "single.db",
+            "partitioned": Path(tmp_dir) / "partitioned.db",
+        }
+        for database_file in layouts.values():
+            tide_database = TidalDatabase(database_file, "tidal")
+            tide_database.create_table()
+            if database_file.name == "partitioned.db":
+                enable_partitioning(tide_database.con, tide_database.partitions)
+            tide_database.close()
+
+        years = 0
+        while years < max_years:
+            # older history is added a year at a time, until there is max_years
+            for database_file in layouts.values():
+                tide_database = TidalDatabase(database_file, "tidal")
+                tide_database.insert_many(shifted(year, 364 * years))
+                if database_file.name == "partitioned.db":
+                    compact(tide_database.con, tide_database.partitions, before_month)
+                tide_database.close()
+            years += 1
+            if years & (years - 1):
+                # report at 1, 2, 4, 8... years
+                continue
+            for name, database_file in layouts.items():
+                tide_database = TidalDatabase(database_file, "tidal")
+                one_port = median_ms(
+                    lambda: list(tide_database.query_tide(rng.choice(port_ids), start, end)), repeat
+                )
+                all_ports = median_ms(
+                    lambda: list(tide_database.query_tides_by_location(None, start, end)), repeat
+                )
+                tide_database.close()
+                size = size_mib(database_file)
+                click.echo(f"{years:>5} {name:>12} {one_port:>12.2f} {all_ports:>13.2f} {size:>7.1f}")
+
+        # retention: forget the oldest year
+        oldest = add_months(month_of(to_epoch(end)), -12 * (max_years - 1))
+        for name, database_file in layouts.items():
+            tide_database = TidalDatabase(database_file, "tidal")
+            start_time = time.perf_counter()
+            if database_file.name == "partitioned.db":
+                drop_before(tide_database.con, tide_database.partitions, oldest)
+            else:
+                with tide_database.con:
+                    tide_database.con.execute(
+                        "DELETE FROM tidal WHERE ts < ?", (month_bounds(oldest)[0],)
+                    )
+            elapsed = (time.perf_counter() - start_time) * 1000
+            tide_database.close()
+            click.echo(f"drop the oldest year, {name}: {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import click
+
+from tidal.async_scraper import AsyncTideScraper
+from tidal.db import TidalDatabase
+from tidal.metrics import Metrics
+from tidal.providers import TideProvider, provider_name_of
+from tidal.providers.bbc import BBCProvider
+from tidal.providers.fake import FakeProvider, FixtureServer, fake_locations
+from tidal.scheduler import AIMDLimiter, FetchHistory, SweepScheduler
+from tidal.tide_dto import AreaID, PortID, TideLocation
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+
+def start_server(port: int, latency: float, error_rate: float) -> FixtureServer:
+    server = FixtureServer(
+        ("127.0.0.1", port),
+        bbc_pages=[path.read_text("utf-8") for path in sorted(FIXTURE_DIR.glob("*.html"))],
+        latency=latency,
+        error_rate=error_rate,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def sweep(scraper: AsyncTideScraper, scheduler: SweepScheduler) -> Dict[str, List[float]]:
+    """seconds from the start at which each port of each provider was done"""
+    done_at: Dict[str, List[float]] = dict()
+    start = time.perf_counter()
+    in_flight = set()
+    async with scraper:
+        while not scheduler.finished:
+            location = scheduler.next_location()
+            while location is not None:
+                in_flight.add(
+                    asyncio.ensure_future(scraper.fetch_location(location, retry=False))
+                )
+                location = scheduler.next_location()
+            if not in_flight:
+                await asyncio.sleep(scheduler.wait_time())
+                continue
+            done, in_flight = await asyncio.wait(
+                in_flight, timeout=scheduler.wait_time(), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                result = task.result()
+                if scheduler.done(result):
+                    name = provider_name_of(result.location.port_id)
+                    done_at.setdefault(name, list()).append(time.perf_counter() - start)
+    return done_at
+
+
+def run(
+    providers: Sequence[TideProvider],
+    locations: Sequence[TideLocation],
+    concurrency: int,
+    per_host: bool,
+    con,
+) -> Dict[str, List[float]]:
+    metrics = Metrics()
+    provider_of = {provider.name: provider for provider in providers}
+    if per_host:
+        limiter = AIMDLimiter(maximum=concurrency, minimum=concurrency)
+        host_limiters: Optional[Dict[str, AIMDLimiter]] = {
+            provider.host: AIMDLimiter(
+                maximum=provider.max_concurrency or concurrency,
+                initial=min(4, provider.max_concurrency or concurrency),
+            )
+            for provider in providers
+        }
+    else:
+        limiter = AIMDLimiter(maximum=concurrency, initial=min(4, concurrency))
+        host_limiters = None
+    # every sweep starts from no history
+    con.execute("DELETE FROM fetch_history")
+    scheduler = SweepScheduler(
+        FetchHistory(con),
+        limiter,
+        metrics=metrics,
+        host_of=lambda location: provider_of[provider_name_of(location.port_id)].host,
+        host_limiters=host_limiters,
+    )
+    scheduler.plan(locations)
+    scraper = AsyncTideScraper(providers, concurrency=concurrency, metrics=metrics)
+    return asyncio.run(sweep(scraper, scheduler))
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=200, help="num of ports of each provider")
+@click.option("-k", "--concurrency", type=int, default=16, help="max in-flight requests")
+@click.option("--latency", type=float, default=0.05, help="seconds each page takes to serve")
+@click.option(
+    "--slow-latency", type=float, default=0.5, help="seconds a page of the slow fake host takes"
+)
+@click.option("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+@click.option("--port", type=int, default=8791, help="first of the two ports to serve on")
+@click.option(
+    "--serve",
+    is_flag=True,
+    help="only serve the fixture pages, bbc on --port and fake on the next one, "
+    "for runs of collect_tides_info.py",
+)
+def main(
+    num_ports: int,
+    concurrency: int,
+    latency: float,
+    slow_latency: float,
+    error_rate: float,
+    port: int,
+    serve: bool,
+):
+    if serve:
+        start_server(port, latency, error_rate)
+        start_server(port + 1, latency, error_rate)
+        click.echo(
+            f"BASE_URL = http://127.0.0.1:{port}/bbc/\n"
+            f"FAKE_BASE_URL = http://127.0.0.1:{port + 1}/fake/"
+        )
+        threading.Event().wait()
+
+    # the scrapers log every page, keep that out of the timings
+    logging.disable(logging.CRITICAL)
+    bbc_server = start_server(port, latency, error_rate)
+    fake_server = start_server(port + 1, latency, error_rate)
+    bbc = BBCProvider(f"http://127.0.0.1:{port}/bbc/")
+    fake = FakeProvider(f"http://127.0.0.1:{port + 1}/fake/", num_ports=num_ports)
+    bbc_ports = [
+        TideLocation("Benchmark", f"Port {i}", AreaID(str(i % 10)), PortID(f"{i:04d}"))
+        for i in range(num_ports)
+    ]
+    fake_ports = fake_locations(num_ports)
+    scenarios = [
+        ("bbc", [bbc], bbc_ports, False, None),
+        ("fake", [fake], fake_ports, False, None),
+        ("mixed, one limit", [bbc, fake], bbc_ports + fake_ports, False, None),
+        ("mixed, per host", [bbc, fake], bbc_ports + fake_ports, True, None),
+        ("slow fake, one limit", [bbc, fake], bbc_ports + fake_ports, False, slow_latency),
+        ("slow fake, per host", [bbc, fake], bbc_ports + fake_ports, True, slow_latency),
+    ]
+    click.echo(
+        f"{num_ports} ports a provider, {concurrency} in flight, {latency * 1000:.0f} ms a page\n"
+        f"{'sweep':>22} {'ports/s':>8} {'bbc done s':>11} {'fake done s':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tide_database = TidalDatabase(Path(tmp_dir) / "tidal.db", "tidal")
+        tide_database.create_table()
+        for name, providers, locations, per_host, fake_latency in scenarios:
+            fake_server.latency = latency if fake_latency is None else fake_latency
+            done_at = run(providers, locations, concurrency, per_host, tide_database.con)
+            elapsed = max(max(times) for times in done_at.values())
+            finished = {provider: f"{max(times):.2f}" for provider, times in done_at.items()}
+            click.echo(
+                f"{name:>22} {len(locations) / elapsed:>8.0f} "
+                f"{finished.get('bbc', '-'):>11} {finished.get('fake', '-'):>12}"
+            )
+        tide_database.close()
+    click.echo(
+        f"pages served: bbc {sum(bbc_server.requests.values())}, "
+        f"fake {sum(fake_server.requests.values())}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import datetime
+import http.client
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import click
+
+from bench_db_insert import synthetic_year
+from bench_partition import shifted
+from tidal.db import TidalDatabase
+from tidal.reader import TidalReader
+from tidal.service import TideServer, TideService
+
+# name -> request targets, {port} and {day} are filled in at random
+SCENARIOS = {
+    "location": ["/locations/{port}"],
+    "tides today": ["/tides/{port}"],
+    "tides hot days": ["/tides/{port}?start={day}&end={day}T23:59"],
+    "next low": ["/next/{port}?type=low"],
+    "batch of 20": ["/tides?port_id={ports}"],
+    "tides last year": ["/tides/{port}?start={old_day}&end={old_day}T23:59"],
+    "mixed": [
+        "/tides/{port}",
+        "/tides/{port}",
+        "/next/{port}?type=low",
+        "/next/{port}?type=high",
+        "/locations/{port}",
+        "/tides?port_id={ports}",
+    ],
+}
+
+
+def serve(database_file: Path, port: int, ready) -> None:
+    reader = TidalReader(database_file, "tidal", pool_size=8)
+    service = TideService(reader)
+    service.hot_window()
+    server = TideServer(("127.0.0.1", port), service)
+    ready.set()
+    server.serve_forever()
+
+
+def client(args: Tuple[int, List[str], float, int, bool]) -> Tuple[int, List[float], int]:
+    """requests on one keep-alive connection for `duration` seconds"""
+    port, targets, duration, seed, revalidate = args
+    rng = random.Random(seed)
+    con = http.client.HTTPConnection("127.0.0.1", port)
+    etags: Dict[str, str] = dict()
+    latencies = list()
+    num_bytes = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        target = rng.choice(targets)
+        headers = {"Accept-Encoding": "gzip"}
+        if revalidate and target in etags:
+            headers["If-None-Match"] = etags[target]
+        start = time.perf_counter()
+        con.request("GET", target, headers=headers)
+        response = con.getresponse()
+        body = response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status not in (200, 304):
+            raise RuntimeError(f"{target}: {response.status} {body[:200]}")
+        etags[target] = response.getheader("ETag", "")
+        num_bytes += len(body)
+    con.close()
+    return len(latencies), latencies, num_bytes
+
+
+def targets_for(templates: List[str], num_ports: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    targets = list()
+    for _ in range(2000):
+        template = rng.choice(templates)
+        targets.append(
+            template.format(
+                port=f"{rng.randrange(num_ports):04d}",
+                ports=",".join(f"{rng.randrange(num_ports):04d}" for _ in range(20)),
+                day=today + datetime.timedelta(days=rng.randrange(6)),
+                old_day=today - datetime.timedelta(days=rng.randrange(200, 300)),
+            )
+        )
+    return targets
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=553, help="num of synthetic ports")
+@click.option("-c", "--num-clients", type=int, default=8, help="num of client processes")
+@click.option("-d", "--duration", type=float, default=5.0, help="seconds per scenario")
+@click.option("--port", type=int, default=8799, help="port of the service")
+@click.option(
+    "--revalidate/--no-revalidate",
+    default=False,
+    help="send If-None-Match with the last ETag of each target",
+)
+def main(num_ports: int, num_clients: int, duration: float, port: int, revalidate: bool):
+    # a year of history up to three months ahead of today
+    year = synthetic_year(num_ports)
+    last_day = datetime.datetime.utcnow() + datetime.timedelta(days=90)
+    year = shifted(year, -(last_day - datetime.datetime(2025, 1, 1)).days)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_file = Path(tmp_dir) / "tidal.db"
+        tide_database = TidalDatabase(database_file, "tidal")
+        tide_database.create_table()
+        tide_database.insert_many(year)
+        tide_database.close()
+
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(database_file, port, ready), daemon=True)
+        server.start()
+        ready.wait()
+        click.echo(
+            f"{num_ports} ports, {num_clients} clients, {duration:.0f}s per scenario\n"
+            f"{'scenario':>16} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'KiB/req':>8}"
+        )
+        with multiprocessing.Pool(num_clients) as pool:
+            for name, templates in SCENARIOS.items():
+                targets = targets_for(templates, num_ports, seed=len(name))
+                start = time.perf_counter()
+                results = pool.map(
+                    client,
+                    [(port, targets, duration, seed, revalidate) for seed in range(num_clients)],
+                )
+                elapsed = time.perf_counter() - start
+                num_requests = sum(result[0] for result in results)
+                latencies = sorted(latency for result in results for latency in result[1])
+                num_bytes = sum(result[2] for result in results)
+                p50 = statistics.median(latencies) * 1000
+                p99 = latencies[int(len(latencies) * 0.99)] * 1000
+                click.echo(
+                    f"{name:>16} {num_requests / elapsed:>8.0f} {p50:>8.2f} {p99:>8.2f} "
+                    f"{num_bytes / num_requests / 1024:>8.2f}"
+                )
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
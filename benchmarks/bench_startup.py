@@ -0,0 +1,70 @@
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import click
+
+from tidal.locations import load_locations_map
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = ("collect_tides_info", "notify", "migrate_db")
+
+
+def wall_times(args: List[str], repeat: int) -> List[float]:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name: str, times: List[float]) -> None:
+    click.echo(
+        f"{name:>34}: median {statistics.median(times) * 1000:7.1f} ms  "
+        f"min {min(times) * 1000:7.1f} ms"
+    )
+
+
+@click.command()
+@click.option("-r", "--repeat", type=int, default=10, help="runs per measurement")
+@click.option(
+    "-l",
+    "--location-file",
+    type=Path,
+    default=ROOT / "locations.jsonl.gz",
+    help="locations file for the lookup benchmark",
+)
+def main(repeat: int, location_file: Path):
+    # each run is a fresh interpreter, the OS page cache is warm after the first
+    report("python -c pass", wall_times([sys.executable, "-c", "pass"], repeat))
+    for module in ENTRY_POINTS:
+        report(
+            f"import {module}",
+            wall_times([sys.executable, "-c", f"import {module}"], repeat),
+        )
+        report(f"{module}.py --help", wall_times([sys.executable, f"{module}.py", "--help"], repeat))
+
+    # one port looked up by a fresh interpreter, as a cron job would
+    port_id = next(iter(load_locations_map(location_file)))
+    decode = (
+        "from tidal.locations import load_locations_map; "
+        f"load_locations_map({str(location_file)!r})[{port_id!r}]"
+    )
+    report("lookup, decode locations file", wall_times([sys.executable, "-c", decode], repeat))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = Path(tmp_dir) / "locations.index.db"
+        lookup = (
+            "from tidal.locations import LocationIndex; "
+            f"LocationIndex({str(location_file)!r}, {str(index_file)!r}).get({port_id!r})"
+        )
+        report("build location index", wall_times([sys.executable, "-c", lookup], 1))
+        report("lookup, location index", wall_times([sys.executable, "-c", lookup], repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import datetime
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+import click
+
+from bench_db_insert import synthetic_year
+from tidal.db import TidalDatabase
+from tidal.tide_dto import DailyTideRecord, Tide, TideType
+
+
+def per_call_ms(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+@click.command()
+@click.option("-n", "--num-ports", type=int, default=553, help="num of synthetic ports")
+@click.option("-b", "--batch-size", type=int, default=50, help="ports per transaction")
+@click.option("-r", "--repeat", type=int, default=20, help="runs of each query")
+def main(num_ports: int, batch_size: int, repeat: int):
+    year = synthetic_year(num_ports)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tide_database = TidalDatabase(Path(tmp_dir) / "tidal.db", "tidal")
+        tide_database.create_table()
+        start = time.perf_counter()
+        for i in range(0, num_ports, batch_size):
+            tide_database.insert_many(year[i: i + batch_size])
+        elapsed = time.perf_counter() - start
+        stages = {
+            histogram["labels"]["stage"]: histogram["sum"]
+            for histogram in tide_database.metrics.report()["histograms"]
+            if histogram["name"] == "stage_seconds"
+        }
+        click.echo(
+            f"{num_ports} ports, a year loaded in {elapsed:.2f}s, "
+            f"{stages.get('stats', 0):.2f}s of it computing daily statistics"
+        )
+
+        # a week's sweep: every port again, with a changed height a day
+        week = [
+            [
+                DailyTideRecord(
+                    location=record.location,
+                    tides=[
+                        Tide(tide.type, tide.utc_datetime, round(tide.height + 0.1, 1))
+                        for tide in record.tides
+                    ],
+                )
+                for record in port[200:207]
+            ]
+            for port in year
+        ]
+        before = stages.get("stats", 0)
+        start = time.perf_counter()
+        for i in range(0, num_ports, batch_size):
+            tide_database.insert_many(week[i: i + batch_size])
+        elapsed = time.perf_counter() - start
+        stages = {
+            histogram["labels"]["stage"]: histogram["sum"]
+            for histogram in tide_database.metrics.report()["histograms"]
+            if histogram["name"] == "stage_seconds"
+        }
+        click.echo(
+            f"a 7 day sweep stored in {elapsed * 1000:.0f}ms, "
+            f"{(stages['stats'] - before) * 1000:.0f}ms of it computing daily statistics\n"
+        )
+
+        first_day = datetime.date(2024, 6, 1)
+        last_day = first_day + datetime.timedelta(days=6)
+        start_date = datetime.datetime.combine(first_day, datetime.time())
+        end_date = datetime.datetime.combine(last_day, datetime.time(23, 59, 59))
+        con = tide_database.con
+
+        def best_from_tides():
+            best: Dict[str, Tuple[float, datetime.date]] = dict()
+            for location, tide in tide_database.query_tides_by_location(None, start_date, end_date):
+                if tide.type == TideType.LOW:
+                    key = (tide.height, tide.utc_datetime.date())
+                    if location.port_id not in best or key < best[location.port_id]:
+                        best[location.port_id] = key
+            return best
+
+        def below_from_tides():
+            return {
+                (location.port_id, tide.utc_datetime.date())
+                for location, tide in tide_database.query_tides_by_location(
+                    None, start_date, end_date
+                )
+                if tide.type == TideType.LOW and tide.height <= 0.3
+            }
+
+        assert len(best_from_tides()) == len(tide_database.stats.best_days(con, first_day, last_day))
+        assert below_from_tides() == {
+            (day.port_id, day.day)
+            for day in tide_database.stats.matching_days(con, first_day, last_day, low_at_most=0.3)
+        }
+        click.echo(f"{'all ports, 7 days':>28} {'raw tides ms':>13} {'daily stats ms':>15}")
+        for name, raw, stats in (
+            (
+                "best day (lowest low)",
+                best_from_tides,
+                lambda: tide_database.stats.best_days(con, first_day, last_day),
+            ),
+            (
+                "days with a low <= 0.3m",
+                below_from_tides,
+                lambda: tide_database.stats.matching_days(con, first_day, last_day, low_at_most=0.3),
+            ),
+        ):
+            click.echo(
+                f"{name:>28} {per_call_ms(raw, repeat):>13.2f} {per_call_ms(stats, repeat):>15.2f}"
+            )
+        tide_database.close()
+
+
+if __name__ == "__main__":
+    main()
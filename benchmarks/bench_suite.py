@@ -0,0 +1,435 @@
+import configparser
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import click
+
+from bench_db_insert import synthetic_year
+from bench_locations import synthetic_catalogue
+from tidal.alerts import TideRule, coalesce, evaluate
+from tidal.db import TidalDatabase
+from tidal.providers.fake import FixtureServer
+from tidal.tide_dto import DailyTideRecord, TideType
+from tidal.utils.store import JSONStore
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+SCENARIOS = ("sweep", "ingest", "query", "query-batch", "notify", "jsonstore")
+# days of tides each port has in the ingest, query and notify scenarios, a sweep's worth
+SWEEP_DAYS = 7
+
+
+def recorded_pages(path: Path) -> List[str]:
+    """the *.html pages in `path`, or the bodies kept by a `ResponseCache` there"""
+    files = sorted(path.glob("*.html")) or sorted(path.glob("objects/*/*"))
+    return [f.read_text("utf-8") for f in files if f.is_file()]
+
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on linux, children are the sweep and its pool workers
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    ) / 1024
+
+
+def _percentile_ms(latencies: Sequence[float], q: float) -> Optional[float]:
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000
+
+
+def result(
+    scenario: str,
+    num_ports: int,
+    unit: str,
+    ops: int,
+    seconds: float,
+    latencies: Sequence[float],
+    **extra,
+) -> dict:
+    return {
+        "scenario": scenario,
+        "num_ports": num_ports,
+        "unit": unit,
+        "ops": ops,
+        "seconds": round(seconds, 4),
+        "throughput": round(ops / seconds, 1),
+        "p50_ms": _percentile_ms(latencies, 0.5),
+        "p99_ms": _percentile_ms(latencies, 0.99),
+        "peak_rss_mib": round(_peak_rss_mib(), 1),
+        **extra,
+    }
+
+
+def run_sweep(work_dir: str, num_ports: int, engine: str, options: List[str]) -> dict:
+    """a full sweep by collect_tides_info.py, as cron runs it"""
+    metrics_file = Path(work_dir) / f"sweep_{engine}.json"
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            "collect_tides_info.py",
+            "-c",
+            str(Path(work_dir) / "config.cfg"),
+            "--engine",
+            engine,
+            "--metrics-file",
+            str(metrics_file),
+            *options,
+        ],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    elapsed = time.perf_counter() - start
+    report = json.loads(metrics_file.read_text())
+    fetch = next(
+        histogram
+        for histogram in report["histograms"]
+        if histogram["name"] == "stage_seconds" and histogram["labels"] == {"stage": "fetch"}
+    )
+    row = result(
+        f"sweep-{engine}",
+        num_ports,
+        "ports",
+        report["num_locations"],
+        elapsed,
+        [],
+        failed=len(report["failed_port_ids"]),
+    )
+    # bucketed by the metrics histogram, to within 10%
+    row["p50_ms"] = fetch["p50"] * 1000
+    row["p99_ms"] = fetch["p99"] * 1000
+    return row
+
+
+def run_ingest(database_file: str, num_ports: int, batch_size: int) -> dict:
+    ports = synthetic_year(num_ports, num_days=SWEEP_DAYS)
+    num_tides = sum(len(daily.tides) for records in ports for daily in records)
+    tide_database = TidalDatabase(Path(database_file), "tidal")
+    tide_database.create_table()
+    latencies = list()
+    start = time.perf_counter()
+    for i in range(0, num_ports, batch_size):
+        batch_start = time.perf_counter()
+        tide_database.insert_many(ports[i: i + batch_size])
+        latencies.append(time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start
+    tide_database.close()
+    return result("ingest", num_ports, "tides", num_tides, elapsed, latencies)
+
+
+def run_queries(
+    name: str, num_ports: int, repeat: int, query: Callable[[random.Random], int]
+) -> dict:
+    rng = random.Random(0)
+    latencies = list()
+    num_tides = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        query_start = time.perf_counter()
+        num_tides += query(rng)
+        latencies.append(time.perf_counter() - query_start)
+    elapsed = time.perf_counter() - start
+    return result(name, num_ports, "queries", repeat, elapsed, latencies, tides=num_tides)
+
+
+def run_query(database_file: str, num_ports: int, repeat: int) -> dict:
+    """a day of one port at a time, as `notify.py -p` or the service ask"""
+    tide_database = TidalDatabase(Path(database_file), "tidal")
+    first_day = datetime.datetime(2024, 1, 1)
+
+    def query(rng: random.Random) -> int:
+        start = first_day + datetime.timedelta(days=rng.randrange(SWEEP_DAYS))
+        port_id = f"{rng.randrange(num_ports):04d}"
+        end = start + datetime.timedelta(days=1)
+        return len(list(tide_database.query_tide(port_id, start, end)))
+
+    row = run_queries("query", num_ports, repeat, query)
+    tide_database.close()
+    return row
+
+
+def run_query_batch(database_file: str, num_ports: int, repeat: int) -> dict:
+    """the whole week of 20 ports at a time"""
+    tide_database = TidalDatabase(Path(database_file), "tidal")
+    start = datetime.datetime(2024, 1, 1)
+    end = start + datetime.timedelta(days=SWEEP_DAYS)
+
+    def query(rng: random.Random) -> int:
+        port_ids = [f"{rng.randrange(num_ports):04d}" for _ in range(20)]
+        return sum(1 for _ in tide_database.query_tides_by_location(port_ids, start, end))
+
+    row = run_queries("query-batch", num_ports, repeat, query)
+    tide_database.close()
+    return row
+
+
+def run_notify(database_file: str, num_ports: int, repeat: int) -> dict:
+    """what notify.py does before sending: every port's week against two rules"""
+    tide_database = TidalDatabase(Path(database_file), "tidal")
+    start = datetime.datetime(2024, 1, 1)
+    end = start + datetime.timedelta(days=SWEEP_DAYS)
+    rules = [TideRule(TideType.LOW, 0.5), TideRule(TideType.HIGH, 6.3)]
+    latencies = list()
+    num_tides = 0
+    num_messages = 0
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        run_start = time.perf_counter()
+        counted = [0]
+
+        def tides():
+            # streamed into the rules like notify.py does, only counted on the way
+            for row in tide_database.query_tides_by_location(None, start, end):
+                counted[0] += 1
+                yield row
+
+        digests = coalesce(evaluate(tides(), rules))
+        tide_database.stats.phases(
+            tide_database.con, [(digest.location.port_id, digest.day) for digest in digests]
+        )
+        latencies.append(time.perf_counter() - run_start)
+        num_tides += counted[0]
+        num_messages = len(digests)
+    elapsed = time.perf_counter() - begin
+    tide_database.close()
+    return result(
+        "notify", num_ports, "tides", num_tides, elapsed, latencies, messages=num_messages
+    )
+
+
+def run_jsonstore(work_dir: str, num_ports: int, batch_size: int) -> dict:
+    """a week of every port saved to, and loaded back from, JSON lines"""
+    path = Path(work_dir) / "tides.jsonl.gz"
+    records: List[DailyTideRecord] = [
+        record for port in synthetic_year(num_ports, num_days=SWEEP_DAYS) for record in port
+    ]
+    num_tides = sum(len(record.tides) for record in records)
+    start = time.perf_counter()
+    JSONStore.save_lines(records, path)
+    latencies = list()
+    batch_start = time.perf_counter()
+    for _ in JSONStore.load_batches(path, DailyTideRecord, batch_size=batch_size):
+        latencies.append(time.perf_counter() - batch_start)
+        batch_start = time.perf_counter()
+    elapsed = time.perf_counter() - start
+    path.unlink()
+    # saved then loaded
+    return result("jsonstore", num_ports, "tides", num_tides * 2, elapsed, latencies)
+
+
+def in_subprocess(func, *args) -> dict:
+    # a fresh process per scenario, so peak RSS is not inherited
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def write_config(work_dir: Path, num_ports: int, base_url: str) -> None:
+    locations, _ = synthetic_catalogue(num_ports)
+    location_file = work_dir / "locations.jsonl.gz"
+    JSONStore.save_lines(locations, location_file)
+    config = configparser.ConfigParser()
+    config["DEFAULT"] = {
+        "BASE_URL": base_url,
+        "TIDE_LOCATION_FILE": str(location_file),
+        "LOCATION_INDEX_FILE": str(work_dir / "locations.index.db"),
+        "DATABASE_NAME": str(work_dir / "sweep.db"),
+        "DATABASE_TIDE_TABLE_NAME": "tidal",
+        "HTTP_CACHE_DIR": "",
+        "WEBHOOK": "",
+    }
+    with open(work_dir / "config.cfg", "w") as f:
+        config.write(f)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def echo_results(results: Sequence[dict], baseline: Optional[Dict[tuple, dict]]) -> None:
+    header = (
+        f"{'scenario':>14} {'ports':>7} {'throughput':>18} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'RSS MiB':>8}"
+    )
+    click.echo(header + ("  change vs baseline" if baseline is not None else ""))
+    for row in results:
+        line = (
+            f"{row['scenario']:>14} {row['num_ports']:>7} "
+            f"{row['throughput']:>10.0f} {row['unit'] + '/s':<7} "
+            f"{_format_ms(row['p50_ms']):>9} {_format_ms(row['p99_ms']):>9} "
+            f"{row['peak_rss_mib']:>8.0f}"
+        )
+        old = None if baseline is None else baseline.get((row["scenario"], row["num_ports"]))
+        if old is not None:
+            line += f"  throughput {row['throughput'] / old['throughput'] - 1:+.0%}"
+            if row["p99_ms"] and old["p99_ms"]:
+                line += f", p99 {row['p99_ms'] / old['p99_ms'] - 1:+.0%}"
+            line += f", RSS {row['peak_rss_mib'] / old['peak_rss_mib'] - 1:+.0%}"
+        click.echo(line)
+
+
+@click.command()
+@click.option(
+    "-s",
+    "--sizes",
+    default="553,5000",
+    help="comma separated catalogue sizes, e.g. 553,5000,50000",
+)
+@click.option(
+    "--scenarios",
+    default=",".join(SCENARIOS),
+    help=f"comma separated scenarios to run, of {','.join(SCENARIOS)}",
+)
+@click.option(
+    "-e",
+    "--engines",
+    default="async,process",
+    help="comma separated collect_tides_info.py engines for the sweep",
+)
+@click.option(
+    "--pages",
+    type=Path,
+    default=FIXTURE_DIR,
+    help="recorded BBC pages to replay: a directory of *.html, or an HTTP_CACHE_DIR",
+)
+@click.option("--latency", type=float, default=0.05, help="seconds each page takes to serve")
+@click.option("--jitter", type=float, default=0.05, help="up to this many more seconds at random")
+@click.option("--error-rate", type=float, default=0.01, help="fraction of 503 responses")
+@click.option("-k", "--concurrency", type=int, default=16, help="in-flight requests, async sweep")
+@click.option("-n", "--num-workers", type=int, default=8, help="processes, process sweep")
+@click.option("-b", "--batch-size", type=int, default=50, help="ports per ingest transaction")
+@click.option("-r", "--repeat", type=int, default=200, help="queries per query scenario")
+@click.option(
+    "-o", "--output", type=Path, default=None, help="write the results to this JSON file"
+)
+@click.option(
+    "--baseline",
+    type=Path,
+    default=None,
+    help="results of an earlier run, e.g. of another commit, to compare against",
+)
+def main(
+    sizes: str,
+    scenarios: str,
+    engines: str,
+    pages: Path,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    concurrency: int,
+    num_workers: int,
+    batch_size: int,
+    repeat: int,
+    output: Optional[Path],
+    baseline: Optional[Path],
+):
+    to_run = [scenario for scenario in scenarios.split(",") if scenario]
+    unknown = set(to_run) - set(SCENARIOS)
+    if unknown:
+        raise click.ClickException(f"unknown scenarios {sorted(unknown)}, of {SCENARIOS}")
+    recorded = recorded_pages(pages)
+    if "sweep" in to_run and not recorded:
+        raise click.ClickException(f"no recorded pages in {pages}")
+    baseline_results = None
+    if baseline is not None:
+        baseline_results = {
+            (row["scenario"], row["num_ports"]): row
+            for row in json.loads(baseline.read_text())["results"]
+        }
+
+    server = FixtureServer(
+        ("127.0.0.1", 0), bbc_pages=recorded, latency=latency, jitter=jitter, error_rate=error_rate
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/bbc/"
+
+    results: List[dict] = list()
+    for num_ports in map(int, sizes.split(",")):
+        first = len(results)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            work_dir = Path(tmp_dir)
+            database_file = str(work_dir / "tidal.db")
+            if "sweep" in to_run:
+                write_config(work_dir, num_ports, base_url)
+                for engine in engines.split(","):
+                    options = ["--concurrency", str(concurrency)]
+                    if engine == "process":
+                        options = ["--num-workers", str(num_workers)]
+                    (work_dir / "sweep.db").unlink(missing_ok=True)
+                    results.append(
+                        in_subprocess(run_sweep, tmp_dir, num_ports, engine, options)
+                    )
+            if {"ingest", "query", "query-batch", "notify"} & set(to_run):
+                # the other database scenarios read what this one wrote
+                row = in_subprocess(run_ingest, database_file, num_ports, batch_size)
+                if "ingest" in to_run:
+                    results.append(row)
+            if "query" in to_run:
+                results.append(in_subprocess(run_query, database_file, num_ports, repeat))
+            if "query-batch" in to_run:
+                results.append(
+                    in_subprocess(run_query_batch, database_file, num_ports, repeat)
+                )
+            if "notify" in to_run:
+                results.append(
+                    in_subprocess(run_notify, database_file, num_ports, max(repeat // 20, 3))
+                )
+            if "jsonstore" in to_run:
+                results.append(in_subprocess(run_jsonstore, tmp_dir, num_ports, 4096))
+        echo_results(results[first:], baseline_results)
+    server.shutdown()
+
+    if output is not None:
+        report = {
+            "commit": git_commit(),
+            "started": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {
+                "pages": len(recorded),
+                "latency": latency,
+                "jitter": jitter,
+                "error_rate": error_rate,
+                "concurrency": concurrency,
+                "num_workers": num_workers,
+                "batch_size": batch_size,
+                "repeat": repeat,
+            },
+            "results": results,
+        }
+        output.write_text(json.dumps(report, indent=2))
+        click.echo(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
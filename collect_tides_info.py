@@ -1,23 +1,218 @@
 import configparser
 import logging
+import os
+import time
+from dataclasses import dataclass, field
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
-from typing import Dict, List
+from typing import (TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
 
 import click
-import tqdm
 
+from tidal.cache import ResponseCache
 from tidal.db import TidalDatabase
-from tidal.scraper import URL, BBCTideScraper
-from tidal.tide_dto import PortID, TideLocation
-from tidal.utils.store import JSONStore
+from tidal.journal import (DEFERRED, DONE, FAILED, PENDING, UNCHANGED,
+                           SweepJournal)
+from tidal.locations import LocationSearch, load_coordinates
+from tidal.metrics import Metrics, merge_profiles
+from tidal.packed import decode_tides, encode_tides
+from tidal.providers import (TideProvider, get_provider_class,
+                             provider_name_of, provider_names)
+from tidal.providers.bbc import PARSERS
+from tidal.scheduler import AIMDLimiter, FetchHistory, SweepScheduler
+from tidal.scraper import FetchResult, TideScraper
+from tidal.tide_dto import DailyTideRecord, PortID, TideLocation
+from tidal.writer import TideWriter
 
+if TYPE_CHECKING:
+    from tidal.async_scraper import AsyncTideScraper
 
-def load_locations_map(tide_location_file: Path) -> Dict[PortID, TideLocation]:
-    location_map = dict()
-    for location in JSONStore.load_lines(path=tide_location_file, dtype=TideLocation):
-        location_map[location.port_id] = location
-    return location_map
+
+def load_response_cache(config: configparser.SectionProxy) -> Optional[ResponseCache]:
+    cache_dir = config.get("HTTP_CACHE_DIR")
+    if not cache_dir:
+        return None
+    return ResponseCache(
+        Path(cache_dir),
+        ttl=config.getfloat("HTTP_CACHE_TTL_HOURS", 24.0) * 3600,
+        max_bytes=int(config.getfloat("HTTP_CACHE_MAX_MB", 256.0) * 1024 * 1024),
+    )
+
+
+def load_providers(
+    config: configparser.SectionProxy, names: Iterable[str], parser: str
+) -> List[TideProvider]:
+    providers = list()
+    for name in names:
+        provider_class = get_provider_class(name)
+        if name == "bbc":
+            providers.append(provider_class.from_config(config, parser=parser))
+        else:
+            providers.append(provider_class.from_config(config))
+    return providers
+
+
+@dataclass
+class SweepSummary:
+    error_locations: List[TideLocation] = field(default_factory=list)
+    # locations whose page did not change since the last (cached) fetch
+    unchanged_locations: List[TideLocation] = field(default_factory=list)
+    # locations skipped as they failed too often lately
+    deferred_locations: List[TideLocation] = field(default_factory=list)
+
+
+def store_result(
+    location: TideLocation,
+    records: Optional[Iterable[DailyTideRecord]],
+    writer: TideWriter,
+    summary: SweepSummary,
+    block: bool = True,
+) -> bool:
+    """False if the records could not be queued without blocking"""
+    if records is None:
+        summary.error_locations.append(location)
+    elif not records:
+        summary.unchanged_locations.append(location)
+    else:
+        return writer.add(records, block=block)
+    return True
+
+
+_worker_scrapper: Optional[TideScraper] = None
+
+
+def _init_worker(scrapper: TideScraper) -> None:
+    global _worker_scrapper
+    _worker_scrapper = scrapper
+    if scrapper.metrics.profile_dir is not None:
+        # each worker writes its own profiles when the pool is closed,
+        # merged by the parent afterwards
+        from multiprocessing.util import Finalize
+
+        Finalize(
+            None,
+            scrapper.metrics.dump_profiles,
+            kwargs={"suffix": f".{os.getpid()}"},
+            exitpriority=10,
+        )
+
+
+def _download_packed(
+    location: TideLocation,
+) -> Tuple[FetchResult, Optional[bytes], dict]:
+    # runs in the pool workers, tides go back to the parent as packed
+    # binary records rather than pickled objects, with what the worker
+    # measured meanwhile
+    metrics = _worker_scrapper.metrics
+    result = _worker_scrapper.fetch_location(location)
+    packed = None
+    if result.records is not None:
+        with metrics.stage("encode"):
+            packed = encode_tides(result.records, {location.port_id: 0})
+        metrics.inc("transfer_bytes_total", len(packed))
+    return result._replace(records=None), packed, metrics.drain()
+
+
+def collect_with_pool(
+    scrapper: TideScraper,
+    scheduler: SweepScheduler,
+    writer: TideWriter,
+    summary: SweepSummary,
+    num_workers: int,
+    total: int,
+) -> None:
+    import queue
+
+    import tqdm
+
+    metrics = scrapper.metrics
+    # filled by the pool's result thread
+    finished: "queue.SimpleQueue" = queue.SimpleQueue()
+    pool = Pool(processes=num_workers, initializer=_init_worker, initargs=(scrapper,))
+    try:
+        with tqdm.tqdm(total=total, position=0, leave=True) as progress:
+            while not scheduler.finished:
+                location = scheduler.next_location()
+                while location is not None:
+                    pool.apply_async(
+                        _download_packed,
+                        (location,),
+                        callback=finished.put,
+                        error_callback=finished.put,
+                    )
+                    location = scheduler.next_location()
+                try:
+                    done = finished.get(timeout=scheduler.wait_time())
+                except queue.Empty:
+                    # a retry is due
+                    continue
+                if isinstance(done, BaseException):
+                    raise done
+                metrics.observe("results_queue_depth", finished.qsize())
+                result, packed, snapshot = done
+                metrics.merge(snapshot)
+                if packed is not None:
+                    with metrics.stage("decode"):
+                        records = decode_tides(packed, [result.location])
+                    result = result._replace(records=records)
+                if scheduler.done(result):
+                    store_result(result.location, result.records, writer, summary)
+                    progress.update()
+        # close rather than terminate, so workers exit cleanly and dump profiles
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+async def collect_async(
+    scrapper: "AsyncTideScraper",
+    scheduler: SweepScheduler,
+    writer: TideWriter,
+    summary: SweepSummary,
+    total: int,
+) -> None:
+    import asyncio
+
+    import tqdm
+
+    in_flight = set()
+    async with scrapper:
+        with tqdm.tqdm(total=total, position=0, leave=True) as progress:
+            try:
+                while not scheduler.finished:
+                    location = scheduler.next_location()
+                    while location is not None:
+                        # retries are up to the scheduler
+                        in_flight.add(
+                            asyncio.ensure_future(
+                                scrapper.fetch_location(location, retry=False)
+                            )
+                        )
+                        location = scheduler.next_location()
+                    if not in_flight:
+                        await asyncio.sleep(scheduler.wait_time())
+                        continue
+                    done, in_flight = await asyncio.wait(
+                        in_flight,
+                        timeout=scheduler.wait_time(),
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    for task in done:
+                        result = task.result()
+                        if scheduler.done(result):
+                            if not store_result(
+                                result.location, result.records, writer, summary, block=False
+                            ):
+                                # the writer is behind, wait without blocking the loop
+                                await asyncio.to_thread(writer.add, result.records)
+                            progress.update()
+            finally:
+                for task in in_flight:
+                    task.cancel()
 
 
 @click.command()
@@ -35,6 +230,27 @@ def load_locations_map(tide_location_file: Path) -> Dict[PortID, TideLocation]:
     type=PortID,
     help="port-ids to scrape, if not specified all ports will be scraped.",
 )
+@click.option(
+    "--provider",
+    "provider_option",
+    multiple=True,
+    type=click.Choice(provider_names()),
+    help="tide sites to scrape, default those of PROVIDERS in the config file "
+    "or of --port-ids, else bbc",
+)
+@click.option(
+    "--near",
+    type=str,
+    default=None,
+    help="scrape the ports within --radius of LAT,LON instead, "
+    "needs LOCATION_COORDINATES_FILE",
+)
+@click.option(
+    "--radius",
+    type=float,
+    default=25.0,
+    help="km around --near, default 25",
+)
 @click.option(
     "-n",
     "--num-workers",
@@ -42,13 +258,100 @@ def load_locations_map(tide_location_file: Path) -> Dict[PortID, TideLocation]:
     default=cpu_count(),
     help=f"num of concurrent workers, default {cpu_count()}",
 )
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(["process", "async"]),
+    default="process",
+    help="'process' scrapes with a pool of --num-workers processes, "
+    "'async' scrapes with asyncio over pooled keep-alive connections",
+)
+@click.option(
+    "-k",
+    "--concurrency",
+    type=int,
+    default=16,
+    help="max in-flight requests for the async engine, default 16",
+)
+@click.option(
+    "--parser",
+    type=click.Choice(PARSERS),
+    default="fast",
+    help="'fast' streams only the tide tables out of each page, "
+    "'bs4' builds a full BeautifulSoup tree, default fast",
+)
+@click.option(
+    "-b",
+    "--batch-size",
+    type=int,
+    default=50,
+    help="max num of locations written to the database per transaction, default 50",
+)
+@click.option(
+    "--write-queue-size",
+    type=int,
+    default=256,
+    help="num of locations waiting to be written before fetching slows down, default 256",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="continue the last run, fetching only the locations it had not finished "
+    "or that failed",
+)
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    help="fetch again only the locations that failed in the last run",
+)
+@click.option(
+    "--adaptive/--fixed",
+    default=True,
+    help="adapt the num of concurrent fetches, up to --num-workers or --concurrency, "
+    "to the host's latency and errors, or always use that many. Default adaptive",
+)
+@click.option(
+    "--metrics-file",
+    type=Path,
+    default=None,
+    help="write a JSON report of the run: per stage timings, counters and failures",
+)
+@click.option(
+    "--prometheus-file",
+    type=Path,
+    default=None,
+    help="write the run's metrics in the Prometheus text format, "
+    "e.g. for the node exporter's textfile collector",
+)
+@click.option(
+    "--profile",
+    "profile_dir",
+    type=Path,
+    default=None,
+    help="profile each stage with cProfile, writing <stage>.prof files to this directory",
+)
 @click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
 def main(
     config_file: str,
     port_ids: List[PortID],
+    provider_option: List[str],
+    near: Optional[str],
+    radius: float,
     num_workers: int,
+    engine: str,
+    concurrency: int,
+    parser: str,
+    batch_size: int,
+    write_queue_size: int,
+    resume: bool,
+    retry_failed: bool,
+    adaptive: bool,
+    metrics_file: Optional[Path],
+    prometheus_file: Optional[Path],
+    profile_dir: Optional[Path],
     verbose: bool,
 ):
+    started = time.time()
     config = configparser.ConfigParser()
     if verbose:
         log_level = logging.DEBUG
@@ -67,49 +370,250 @@ def main(
         logging.error(f"config file {config_file} not found!")
         exit(-1)
 
-    tide_location_map = load_locations_map(
-        Path(config["DEFAULT"].get("TIDE_LOCATION_FILE"))
-    )
+    metrics = Metrics(profile_dir=profile_dir)
+    response_cache = load_response_cache(config["DEFAULT"])
+    database_file = Path(config["DEFAULT"].get("DATABASE_NAME"))
+    table_name = config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME")
+    tide_database = TidalDatabase(database_file, table_name, metrics=metrics)
+    try:
+        tide_database.create_table(drop_existing=False)
+    except RuntimeError as re:
+        logging.error(str(re))
+        exit(-1)
+
+    journal = SweepJournal(tide_database.con)
+    if (resume or retry_failed) and (port_ids or near):
+        logging.error("--resume and --retry-failed take the locations from the last run")
+        exit(-1)
+    if near and port_ids:
+        logging.error("--near and --port-ids can't be used together")
+        exit(-1)
+    if resume or retry_failed:
+        sweep = journal.latest()
+        if sweep is None:
+            logging.error("No previous run found in the journal")
+            exit(-1)
+        sweep_id = sweep.sweep_id
+        # a run that died leaves ports pending
+        statuses = (FAILED,) if retry_failed else (PENDING, FAILED)
+        port_ids = journal.ports(sweep_id, statuses)
+        if not port_ids:
+            logging.info(f"Nothing left to do in run {sweep_id}")
+            return
+        logging.info(
+            f"{'Retrying' if retry_failed else 'Resuming'} run {sweep_id}: "
+            f"{len(port_ids)} of its locations left"
+        )
 
-    if not port_ids:
-        locations_to_download = tide_location_map.values()
+    # ports of other providers than the default one are "<provider>:<id>"
+    ports_by_provider: Dict[str, List[PortID]] = dict()
+    for port_id in port_ids:
+        ports_by_provider.setdefault(provider_name_of(port_id), list()).append(port_id)
+    if provider_option:
+        provider_list = list(dict.fromkeys(provider_option))
+    elif port_ids:
+        provider_list = list(ports_by_provider)
+    else:
+        provider_list = [
+            name.strip()
+            for name in config["DEFAULT"].get("PROVIDERS", "bbc").split(",")
+            if name.strip()
+        ]
+    for name in ports_by_provider:
+        if name not in provider_list:
+            logging.error(f"port_ids of {name} given, but {name} is not in --provider")
+            exit(-1)
+    try:
+        providers = load_providers(config["DEFAULT"], provider_list, parser)
+    except (KeyError, ValueError) as e:
+        logging.error(f"Failed to set up the providers {provider_list}: {str(e)}")
+        exit(-1)
+    logging.debug(f"scraping {providers}")
+
+    # ports asked for are fetched even if deferred
+    asked_for = bool(port_ids) or bool(near)
+    if near:
+        coordinates_file = config["DEFAULT"].get("LOCATION_COORDINATES_FILE")
+        if not coordinates_file:
+            logging.error("--near needs LOCATION_COORDINATES_FILE in the config file")
+            exit(-1)
+        try:
+            latitude, longitude = (float(value) for value in near.split(","))
+        except ValueError:
+            logging.error(f"--near must be LAT,LON in degrees, not {near}")
+            exit(-1)
+        try:
+            coordinates = load_coordinates(Path(coordinates_file))
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Failed to load {coordinates_file}: {str(e)}")
+            exit(-1)
+        search = LocationSearch(
+            [location for provider in providers for location in provider.locations()],
+            coordinates,
+        )
+        nearby = search.within(latitude, longitude, radius)
+        for location, distance in nearby:
+            logging.debug(f"{location.name} ({location.port_id}) {distance:.1f} km away")
+        locations_to_download = [location for location, _ in nearby]
+        logging.info(f"{len(locations_to_download)} locations within {radius:g} km of {near}")
+        if not locations_to_download:
+            return
+    elif not port_ids:
+        locations_to_download = [
+            location for provider in providers for location in provider.locations()
+        ]
     else:
         locations_to_download = list()
+        for provider in providers:
+            if provider.name in ports_by_provider:
+                locations_to_download.extend(
+                    provider.locations(ports_by_provider[provider.name])
+                )
+        found = {location.port_id for location in locations_to_download}
         for port_id in port_ids:
-            if port_id in tide_location_map:
-                locations_to_download.append(tide_location_map[port_id])
-            else:
+            if port_id not in found:
                 logging.warning(
                     f"port_id {port_id} does not exist in the location file! Skipping"
                 )
 
-    scrapper = BBCTideScraper(URL(config["DEFAULT"].get("BASE_URL")))
-    tide_database = TidalDatabase(
-        Path(config["DEFAULT"].get("DATABASE_NAME")),
-        config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME"),
+    if resume or retry_failed:
+        journal.reopen(sweep_id, [location.port_id for location in locations_to_download])
+    else:
+        sweep_id = journal.start(location.port_id for location in locations_to_download)
+
+    max_concurrency = concurrency if engine == "async" else num_workers
+    provider_of = {provider.name: provider for provider in providers}
+    hosts: Dict[str, int] = dict()
+    for provider in providers:
+        # providers on one host share the lowest limit
+        limit = min(provider.max_concurrency or max_concurrency, max_concurrency)
+        hosts[provider.host] = min(hosts.get(provider.host, limit), limit)
+    if len(hosts) > 1:
+        # each host adapts to its own latency and errors, within a fixed total
+        limiter = AIMDLimiter(maximum=max_concurrency, minimum=max_concurrency)
+        host_limiters = {
+            host: AIMDLimiter(
+                maximum=limit, minimum=1 if adaptive else limit, initial=min(4, limit)
+            )
+            for host, limit in hosts.items()
+        }
+    else:
+        (limit,) = hosts.values()
+        limiter = AIMDLimiter(
+            maximum=limit,
+            minimum=1 if adaptive else limit,
+            initial=min(4, limit),
+        )
+        host_limiters = None
+    scheduler = SweepScheduler(
+        FetchHistory(tide_database.con),
+        limiter,
+        metrics=metrics,
+        host_of=lambda location: provider_of[provider_name_of(location.port_id)].host,
+        host_limiters=host_limiters,
+    )
+    # cached pages are only skipped if their tides are in the database
+    stored_digests = {
+        port_id: history.digest
+        for port_id, history in scheduler.histories.items()
+        if history.digest is not None
+    }
+    summary = SweepSummary()
+    summary.deferred_locations = scheduler.plan(
+        locations_to_download, include_deferred=asked_for
+    )
+    if summary.deferred_locations:
+        logging.info(
+            f"{len(summary.deferred_locations)} locations skipped, "
+            f"they failed too often lately"
+        )
+    total = len(locations_to_download) - len(summary.deferred_locations)
+
+    # results are written by a thread of its own, while fetching goes on
+    def mark_done(
+        writer_database: TidalDatabase, batch: Sequence[Iterable[DailyTideRecord]]
+    ) -> None:
+        # on the writer's thread and connection, once the batch is committed
+        SweepJournal(writer_database.con).mark(
+            sweep_id, (next(iter(records)).location.port_id for records in batch), DONE
+        )
+
+    with TideWriter(
+        lambda: TidalDatabase(database_file, table_name, metrics=metrics),
+        batch_size=batch_size,
+        queue_size=write_queue_size,
+        metrics=metrics,
+        on_written=mark_done,
+    ) as writer:
+        if engine == "async":
+            import asyncio
+
+            from tidal.async_scraper import AsyncTideScraper
+
+            scrapper = AsyncTideScraper(
+                providers,
+                cache=response_cache,
+                concurrency=concurrency,
+                metrics=metrics,
+                stored_digests=stored_digests,
+            )
+            asyncio.run(collect_async(scrapper, scheduler, writer, summary, total))
+        else:
+            scrapper = TideScraper(
+                providers,
+                cache=response_cache,
+                metrics=metrics,
+                stored_digests=stored_digests,
+            )
+            collect_with_pool(scrapper, scheduler, writer, summary, num_workers, total)
+    scheduler.save()
+    for locations, status in (
+        (summary.error_locations, FAILED),
+        (summary.unchanged_locations, UNCHANGED),
+        (summary.deferred_locations, DEFERRED),
+    ):
+        journal.mark(sweep_id, (location.port_id for location in locations), status)
+    journal.finish(sweep_id)
+    journal.prune()
+
+    num_success = total - len(summary.error_locations)
+    logging.info(
+        f"{num_success}/{len(locations_to_download)} locations collected, "
+        f"{len(summary.unchanged_locations)} unchanged since last run."
     )
-    tide_database.create_table(drop_existing=False)
-
-    with Pool(processes=num_workers) as pool:
-        error_locations = list()
-        for location, records in tqdm.tqdm(
-            pool.imap(scrapper.download_tidal_info, locations_to_download),
-            total=len(locations_to_download),
-            position=0,
-            leave=True,
-        ):
-            if not records:
-                error_locations.append(location)
-            else:
-                tide_database.insert(records)
-        num_success = len(locations_to_download) - len(error_locations)
-        logging.info(f"{num_success}/{len(locations_to_download)} locations collected.")
-        if len(error_locations) > 0:
-            for i, location in enumerate(error_locations):
-                logging.error(f"Failed location {i+1}: {location}")
+    if len(summary.error_locations) > 0:
+        for i, location in enumerate(summary.error_locations):
+            logging.error(f"Failed location {i+1}: {location}")
+        logging.info("Run again with --retry-failed to fetch only the failed locations")
+
+    if response_cache is not None:
+        response_cache.evict()
 
     tide_database.close()
 
+    if metrics_file is not None:
+        metrics.write_report(
+            metrics_file,
+            started=started,
+            elapsed_seconds=time.time() - started,
+            sweep_id=sweep_id,
+            engine=engine,
+            num_workers=concurrency if engine == "async" else num_workers,
+            parser=parser,
+            providers=provider_list,
+            num_locations=len(locations_to_download),
+            num_success=num_success,
+            num_unchanged=len(summary.unchanged_locations),
+            num_deferred=len(summary.deferred_locations),
+            failed_port_ids=[location.port_id for location in summary.error_locations],
+        )
+    if prometheus_file is not None:
+        metrics.write_prometheus(prometheus_file)
+    if profile_dir is not None:
+        metrics.dump_profiles()
+        merge_profiles(profile_dir)
+        logging.info(f"stage profiles written to {profile_dir}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+import configparser
+import datetime
+import logging
+import time
+from multiprocessing import cpu_count
+from pathlib import Path
+
+import click
+
+from tidal.export import FORMATS, SHARD_BY, export_tides
+
+
+@click.command()
+@click.option("-c", "--config-file", default="config.cfg", help="path to config file")
+@click.option(
+    "-o", "--output-dir", type=Path, required=True, help="directory to write the export to"
+)
+@click.option(
+    "--shard-by",
+    type=click.Choice(SHARD_BY),
+    default="port",
+    help="one shard per --ports-per-shard ports, or per UTC month, default port",
+)
+@click.option(
+    "--ports-per-shard", type=int, default=64, help="ports in a shard, default 64"
+)
+@click.option(
+    "-f",
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    default="npy",
+    help="'npy' writes a memory mappable file per column, "
+    "'npz' a compressed file per shard, default npy",
+)
+@click.option(
+    "-n",
+    "--num-workers",
+    type=int,
+    default=cpu_count(),
+    help=f"num of processes writing shards, default {cpu_count()}",
+)
+@click.option(
+    "--start-date",
+    type=click.DateTime(),
+    default=None,
+    help="first UTC date to export, default the earliest",
+)
+@click.option(
+    "--end-date",
+    type=click.DateTime(),
+    default=None,
+    help="last UTC date to export, default the latest",
+)
+@click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
+def main(
+    config_file,
+    output_dir,
+    shard_by,
+    ports_per_shard,
+    fmt,
+    num_workers,
+    start_date,
+    end_date,
+    verbose,
+):
+    config = configparser.ConfigParser()
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+        datefmt="%d-%m-%Y:%H:%M:%S",
+        level=log_level,
+    )
+    try:
+        with open(config_file) as f:
+            config.read_file(f)
+    except IOError:
+        logging.error(f"config file {config_file} not found!")
+        exit(-1)
+
+    database_file = Path(config["DEFAULT"].get("DATABASE_NAME"))
+    table_name = config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME")
+    if not database_file.exists():
+        logging.error(f"database {database_file} not found!")
+        exit(-1)
+    if end_date is not None:
+        # the whole of the last day
+        end_date += datetime.timedelta(days=1, seconds=-1)
+
+    started = time.perf_counter()
+    manifest = export_tides(
+        database_file,
+        table_name,
+        output_dir,
+        shard_by=shard_by,
+        fmt=fmt,
+        ports_per_shard=ports_per_shard,
+        num_workers=num_workers,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    num_rows = sum(shard["num_rows"] for shard in manifest["shards"])
+    size = sum(path.stat().st_size for path in output_dir.rglob("*") if path.is_file())
+    logging.info(
+        f"{num_rows} tides exported to {len(manifest['shards'])} shards in {output_dir}, "
+        f"{size / 1024 / 1024:.1f} MiB, {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
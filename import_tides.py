@@ -0,0 +1,71 @@
+import configparser
+import logging
+import time
+from pathlib import Path
+
+import click
+
+from tidal.db import TidalDatabase
+from tidal.export import import_tides
+
+
+@click.command()
+@click.option("-c", "--config-file", default="config.cfg", help="path to config file")
+@click.option(
+    "-i",
+    "--input-dir",
+    type=Path,
+    required=True,
+    help="directory of an export written by export_tides.py",
+)
+@click.option(
+    "-b",
+    "--batch-size",
+    type=int,
+    default=50,
+    help="max num of locations written to the database per transaction, default 50",
+)
+@click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
+def main(config_file, input_dir, batch_size, verbose):
+    config = configparser.ConfigParser()
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+        datefmt="%d-%m-%Y:%H:%M:%S",
+        level=log_level,
+    )
+    try:
+        with open(config_file) as f:
+            config.read_file(f)
+    except IOError:
+        logging.error(f"config file {config_file} not found!")
+        exit(-1)
+
+    tide_database = TidalDatabase(
+        Path(config["DEFAULT"].get("DATABASE_NAME")),
+        config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME"),
+    )
+    try:
+        tide_database.create_table(drop_existing=False)
+    except RuntimeError as e:
+        logging.error(str(e))
+        exit(-1)
+
+    started = time.perf_counter()
+    try:
+        num_rows = import_tides(input_dir, tide_database, batch_size=batch_size)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to import {input_dir}: {str(e)}")
+        exit(-1)
+    finally:
+        tide_database.close()
+    logging.info(
+        f"{num_rows} tides imported from {input_dir} in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
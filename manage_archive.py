@@ -0,0 +1,100 @@
+import configparser
+import logging
+import time
+from pathlib import Path
+
+import click
+
+from tidal.db import TidalDatabase
+from tidal.partition import (add_months, compact, drop_before,
+                             enable_partitioning, month_of)
+
+
+@click.command()
+@click.option("-c", "--config-file", default="config.cfg", help="path to config file")
+@click.option(
+    "--partition",
+    is_flag=True,
+    help="store tides in one table per month from now on, moving existing ones",
+)
+@click.option(
+    "--compact-after-months",
+    type=int,
+    default=None,
+    help="compact months older than this into archive files, "
+    "default ARCHIVE_COMPACT_AFTER_MONTHS",
+)
+@click.option(
+    "--retention-months",
+    type=int,
+    default=None,
+    help="drop months older than this, default ARCHIVE_RETENTION_MONTHS",
+)
+@click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
+def main(config_file, partition, compact_after_months, retention_months, verbose):
+    config = configparser.ConfigParser()
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+        datefmt="%d-%m-%Y:%H:%M:%S",
+        level=log_level,
+    )
+    try:
+        with open(config_file) as f:
+            config.read_file(f)
+    except IOError:
+        logging.error(f"config file {config_file} not found!")
+        exit(-1)
+
+    database_file = Path(config["DEFAULT"].get("DATABASE_NAME"))
+    table_name = config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME")
+    if compact_after_months is None:
+        compact_after_months = config["DEFAULT"].getint("ARCHIVE_COMPACT_AFTER_MONTHS")
+    if retention_months is None:
+        retention_months = config["DEFAULT"].getint("ARCHIVE_RETENTION_MONTHS")
+    if not database_file.exists():
+        logging.error(f"database {database_file} not found!")
+        exit(-1)
+    if compact_after_months is not None and compact_after_months < 1:
+        logging.error("--compact-after-months must be at least 1, the current month is written to")
+        exit(-1)
+    if retention_months is not None and retention_months < 1:
+        logging.error("--retention-months must be at least 1")
+        exit(-1)
+
+    tide_database = TidalDatabase(database_file, table_name)
+    try:
+        tide_database.create_table()
+    except RuntimeError as e:
+        logging.error(str(e))
+        exit(-1)
+    con, catalog = tide_database.con, tide_database.partitions
+    if partition:
+        num_rows = enable_partitioning(con, catalog)
+        logging.info(f"{table_name} partitioned by month, {num_rows} tides moved")
+    if not catalog.enabled(con):
+        if compact_after_months is not None or retention_months is not None:
+            logging.error(f"{table_name} is not partitioned, run with --partition first")
+            tide_database.close()
+            exit(-1)
+        tide_database.close()
+        return
+
+    this_month = month_of(int(time.time()))
+    if retention_months is not None:
+        num_dropped = drop_before(con, catalog, add_months(this_month, -retention_months))
+        logging.info(f"{num_dropped} months older than {retention_months} months dropped")
+    if compact_after_months is not None:
+        num_compacted = compact(con, catalog, add_months(this_month, -compact_after_months))
+        logging.info(f"{num_compacted} months older than {compact_after_months} months compacted")
+
+    for p in catalog.partitions(con):
+        logging.debug(f"{p.month}: table {p.table or '-'}, archive {p.archive or '-'}")
+    tide_database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import configparser
+import logging
+import os
+import sqlite3
+from pathlib import Path
+
+import click
+
+from tidal.schema import SCHEMA_VERSION, migrate, schema_version
+
+
+@click.command()
+@click.option("-c", "--config-file", default="config.cfg", help="path to config file")
+@click.option(
+    "-t",
+    "--target-version",
+    type=int,
+    default=SCHEMA_VERSION,
+    help=f"schema version to migrate to, default {SCHEMA_VERSION}",
+)
+@click.option(
+    "--vacuum/--no-vacuum",
+    default=True,
+    help="rebuild the database file afterwards to reclaim the freed space",
+)
+@click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
+def main(config_file, target_version, vacuum, verbose):
+    config = configparser.ConfigParser()
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+        datefmt="%d-%m-%Y:%H:%M:%S",
+        level=log_level,
+    )
+    try:
+        with open(config_file) as f:
+            config.read_file(f)
+    except IOError:
+        logging.error(f"config file {config_file} not found!")
+        exit(-1)
+
+    database_file = Path(config["DEFAULT"].get("DATABASE_NAME"))
+    table_name = config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME")
+    if not database_file.exists():
+        logging.error(f"database {database_file} not found!")
+        exit(-1)
+
+    con = sqlite3.connect(database_file)
+    version = schema_version(con, table_name)
+    if version == target_version:
+        logging.info(f"{database_file} already at version {version}, nothing to do.")
+        con.close()
+        return
+
+    size_before = os.path.getsize(database_file)
+    try:
+        migrate(con, table_name, target=target_version)
+    except ValueError as ve:
+        logging.error(str(ve))
+        con.close()
+        exit(-1)
+    if vacuum:
+        con.execute("VACUUM")
+    con.close()
+
+    size_after = os.path.getsize(database_file)
+    logging.info(
+        f"{database_file} migrated from version {version} to {target_version}, "
+        f"{size_before / 1024:.0f} KiB -> {size_after / 1024:.0f} KiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,30 @@
 import configparser
 import datetime
 import logging
-import time
+import re
+from collections import Counter
 from pathlib import Path
+from typing import List, Optional
 
 import click
-import requests
 
+from tidal.alerts import TideRule, coalesce, evaluate
 from tidal.db import TidalDatabase
-from tidal.tide_dto import Tide, TideLocation, TideType
-
-
-def send_msg(url: str, tide_location: TideLocation, tide_info: Tide):
-    sent = False
-    cnt = 0
-    message = (
-        f'Spring {tide_info.type} tide {tide_info.height}m at "{tide_location.name}"'
-        + f" at: {tide_info.utc_datetime} UTC "
-    )
-    logging.info(f"Sending message = {message}")
-
-    while not sent:
-        r = requests.post(url, json={"text": message})
-        cnt += 1
-        if not (r.status_code == 200 and r.reason == "OK"):
-            logging.debug(f"HTTP POST failed: {r.status_code} {r.reason}")
-            if cnt > 10:
-                logging.debug(f"failed {cnt} times, quitting")
-                break
-            time.sleep(min(300, 2**cnt))
-        else:
-            logging.debug(f"HTTP POST successful: {r.status_code} {r.reason}")
-            sent = True
+from tidal.ledger import NotificationLedger
+from tidal.tide_dto import PortID, TideType
+from tidal.webhook import WebhookDispatcher
 
 
 @click.command()
 @click.option("-c", "--config-file", default="config.cfg", help="path to config file")
-@click.option("-p", "--port-id", required=True, help="port-id to monitor")
+@click.option(
+    "-p",
+    "--port-id",
+    "port_ids",
+    multiple=True,
+    type=PortID,
+    help="port-ids to monitor, if not specified all ports in the database are monitored.",
+)
 @click.option(
     "-t",
     "--low-threshold",
@@ -44,8 +32,40 @@ def send_msg(url: str, tide_location: TideLocation, tide_info: Tide):
     default=0.5,
     help="send notification when tide is lower than this",
 )
+@click.option(
+    "-T",
+    "--high-threshold",
+    type=float,
+    default=None,
+    help="also send notification when tide is higher than this",
+)
+@click.option(
+    "-d", "--days", type=int, default=7, help="num of days ahead to monitor, default 7"
+)
+@click.option(
+    "-w",
+    "--num-workers",
+    type=int,
+    default=8,
+    help="num of threads delivering notifications, default 8",
+)
+@click.option(
+    "--full-scan",
+    is_flag=True,
+    help="evaluate every tide in the window, not only those changed since the last run. "
+    "Alerts already delivered are still not sent again",
+)
 @click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
-def main(config_file, port_id, low_threshold, verbose):
+def main(
+    config_file: str,
+    port_ids: List[PortID],
+    low_threshold: float,
+    high_threshold: Optional[float],
+    days: int,
+    num_workers: int,
+    full_scan: bool,
+    verbose: bool,
+):
     config = configparser.ConfigParser()
     if verbose:
         log_level = logging.DEBUG
@@ -63,24 +83,96 @@ def main(config_file, port_id, low_threshold, verbose):
         logging.error(f"config file {config_file} not found!")
         exit(-1)
 
+    webhooks = [url for url in re.split(r"[\s,]+", config["DEFAULT"].get("WEBHOOK", "")) if url]
+    if not webhooks:
+        # nothing would be sent, yet every alert would be recorded as delivered
+        logging.error(f"no WEBHOOK in {config_file}, nowhere to send the alerts")
+        exit(-1)
+
     tide_database = TidalDatabase(
         Path(config["DEFAULT"].get("DATABASE_NAME")),
         config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME"),
     )
 
-    tide_location = tide_database.get_location_by_port_id(port_id=port_id)
+    rules = [TideRule(TideType.LOW, low_threshold)]
+    if high_threshold is not None:
+        rules.append(TideRule(TideType.HIGH, high_threshold))
+
+    try:
+        tide_database.create_table(drop_existing=False)
+    except RuntimeError as e:
+        logging.error(str(e))
+        exit(-1)
+
+    ledger = NotificationLedger(tide_database.con)
+    watch = ledger.watch_key(port_ids, rules)
+    high_water_mark = None if full_scan else ledger.high_water_mark(watch)
+    # read before the tides, rows written meanwhile are seen again next run
+    data_version = tide_database.data_version()
+
+    now = datetime.datetime.utcnow()
+    window_end = now + datetime.timedelta(days=days)
+    if high_water_mark is None:
+        tides = tide_database.query_tides_by_location(
+            port_ids=port_ids or None, start_date=now, end_date=window_end
+        )
+    else:
+        # only what was written since the last run, or what the window
+        # has moved over since
+        tides = tide_database.query_tides_by_location(
+            port_ids=port_ids or None,
+            start_date=now,
+            end_date=window_end,
+            since_version=high_water_mark.data_version,
+            entered_after=high_water_mark.window_end,
+        )
+    alerts = ledger.unsent(evaluate(tides, rules))
+    # one message per port and day, however many tides match on it
+    digests = coalesce(alerts)
+    # spring or neap, from the daily statistics
+    phases = tide_database.stats.phases(
+        tide_database.con, [(digest.location.port_id, digest.day) for digest in digests]
+    )
+    digests = [
+        digest._replace(phase=phases.get((digest.location.port_id, digest.day)))
+        for digest in digests
+    ]
+    n_match = sum(len(digest.tides()) for digest in digests)
+    logging.info(
+        f"{n_match} new matching tide records found, {len(digests)} messages to send."
+    )
+
+    # indices of digests, once per webhook that accepted it
+    deliveries: List[int] = list()
+    with WebhookDispatcher(
+        num_workers=num_workers,
+        rate=config["DEFAULT"].getfloat("WEBHOOK_RATE_PER_SEC", 1.0),
+        burst=config["DEFAULT"].getfloat("WEBHOOK_BURST", 1.0),
+    ) as dispatcher:
+        for i, digest in enumerate(digests):
+            logging.info(f"Sending message = {digest.message()}")
+            for url in webhooks:
+                dispatcher.submit(
+                    url, digest.payload(), on_sent=lambda i=i: deliveries.append(i)
+                )
 
-    n_match = 0
-    for tide in tide_database.query_tide(
-        port_id=tide_location.port_id,
-        start_date=datetime.datetime.utcnow(),
-        end_date=datetime.datetime.utcnow() + datetime.timedelta(days=7),
-    ):
-        if tide.type == TideType.LOW and tide.height <= low_threshold:
-            n_match += 1
-            send_msg(config["DEFAULT"]["WEBHOOK"], tide_location, tide)
+    delivered = Counter(deliveries)
+    ledger.record(
+        alert
+        for i, digest in enumerate(digests)
+        if delivered[i] == len(webhooks)
+        for alert in digest.alerts
+    )
+    # on failures keep the old mark, so the next run evaluates them again
+    if dispatcher.summary.failed == 0:
+        ledger.advance(watch, ledger.describe_watch(port_ids, rules), data_version, window_end)
+    ledger.prune(before=now)
+    tide_database.close()
 
-    logging.info(f"{n_match} matching tide records found.")
+    summary = dispatcher.summary
+    logging.info(
+        f"{summary.sent} messages sent, {summary.failed} failed, {summary.retried} retries."
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import configparser
+import logging
+from pathlib import Path
+
+import click
+
+from tidal.metrics import Metrics
+from tidal.reader import TidalReader
+from tidal.service import TideServer, TideService
+
+
+@click.command()
+@click.option("-c", "--config-file", default="config.cfg", help="path to config file")
+@click.option("-h", "--host", default="127.0.0.1", help="address to listen on, default 127.0.0.1")
+@click.option("-p", "--port", type=int, default=8080, help="port to listen on, default 8080")
+@click.option(
+    "--hot-days",
+    type=int,
+    default=7,
+    help="days ahead of every port held in memory, default 7",
+)
+@click.option(
+    "--pool-size",
+    type=int,
+    default=8,
+    help="num of read connections to the database, default 8",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    default=4096,
+    help="num of query results outside the hot days kept in memory, default 4096",
+)
+@click.option(
+    "--max-batch", type=int, default=100, help="most ports in one batch request, default 100"
+)
+@click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
+def main(config_file, host, port, hot_days, pool_size, cache_size, max_batch, verbose):
+    config = configparser.ConfigParser()
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+        datefmt="%d-%m-%Y:%H:%M:%S",
+        level=log_level,
+    )
+    try:
+        with open(config_file) as f:
+            config.read_file(f)
+    except IOError:
+        logging.error(f"config file {config_file} not found!")
+        exit(-1)
+
+    database_file = Path(config["DEFAULT"].get("DATABASE_NAME"))
+    table_name = config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME")
+    if not database_file.exists():
+        logging.error(f"database {database_file} not found!")
+        exit(-1)
+
+    reader = TidalReader(database_file, table_name, pool_size=pool_size, cache_size=cache_size)
+    service = TideService(reader, hot_days=hot_days, metrics=Metrics())
+    # loads the hot days before the first request
+    service.hot_window()
+    server = TideServer((host, port), service, max_batch=max_batch)
+    logging.info(f"serving {database_file} on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
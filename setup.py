@@ -3,9 +3,10 @@ from setuptools import setup
 setup(
     name="TidalTime",
     version="1.0",
-    packages=["tidal", "tidal.utils"],
+    packages=["tidal", "tidal.providers", "tidal.utils"],
     package_dir={"": "src"},
     install_requires=[
+        "aiohttp>=3.8.0",
         "click>=8.1.3",
         "bs4>=0.0.1",
         "beautifulsoup4>=4.11.1",
@@ -14,6 +15,14 @@ setup(
         "pyserde>=0.12.2",
         "typing-extensions >= 4.8.0",
     ],
+    extras_require={
+        # tidal.columnar, the vectorized tide API
+        "columnar": ["numpy>=1.23"],
+        # orjson backend of tidal.utils.serialization, used when installed
+        "fast": ["orjson>=3.8"],
+        # the tests under tests/
+        "test": ["pytest>=7"],
+    },
     url="",
     license="",
     author="Wei Liu",
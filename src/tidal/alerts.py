@@ -0,0 +1,87 @@
+import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from tidal.tide_dto import PortID, Tide, TideLocation, TidePhase, TideType
+
+
+class TideRule(NamedTuple):
+    """matches low tides at or below, or high tides at or above, `threshold`"""
+
+    tide_type: TideType
+    threshold: float
+
+    @property
+    def name(self) -> str:
+        op = "<=" if self.tide_type == TideType.LOW else ">="
+        return f"{self.tide_type.value.lower()}{op}{self.threshold:g}"
+
+    def matches(self, tide: Tide) -> bool:
+        if tide.type != self.tide_type:
+            return False
+        if self.tide_type == TideType.LOW:
+            return tide.height <= self.threshold
+        return tide.height >= self.threshold
+
+
+class Alert(NamedTuple):
+    location: TideLocation
+    tide: Tide
+    rule: TideRule
+
+
+class Digest(NamedTuple):
+    """all the alerts of one port on one UTC day, sent as a single message"""
+
+    location: TideLocation
+    day: datetime.date
+    alerts: List[Alert]
+    # spring or neap, if the day is one (see `tidal.stats`)
+    phase: Optional[TidePhase] = None
+
+    def tides(self) -> List[Tide]:
+        """the tides alerted on, once each even if they matched several rules"""
+        unique = {(a.tide.utc_datetime, a.tide.type): a.tide for a in self.alerts}
+        return list(unique.values())
+
+    def message(self) -> str:
+        tides = self.tides()
+        phase = f"{self.phase.value} " if self.phase is not None else ""
+        if len(tides) == 1:
+            tide = tides[0]
+            return (
+                f'{phase}{tide.type.value} tide {tide.height}m at "{self.location.name}"'
+                + f" at: {tide.utc_datetime} UTC "
+            )
+        lines = [f'{len(tides)} {phase.lower()}tides at "{self.location.name}" on {self.day}:']
+        lines += [
+            f"  {tide.type.value} tide {tide.height}m at {tide.utc_datetime:%H:%M} UTC"
+            for tide in tides
+        ]
+        return "\n".join(lines)
+
+    def payload(self) -> dict:
+        # slack incoming webhook format
+        return {"text": self.message()}
+
+
+def evaluate(
+    tides: Iterable[Tuple[TideLocation, Tide]], rules: Sequence[TideRule]
+) -> Iterable[Alert]:
+    """an alert for each (tide, rule) that matches, a tide can match several rules"""
+    for location, tide in tides:
+        for rule in rules:
+            if rule.matches(tide):
+                yield Alert(location, tide, rule)
+
+
+def coalesce(alerts: Iterable[Alert]) -> List[Digest]:
+    """groups alerts into one digest per port and UTC day, in time order"""
+    digests: Dict[Tuple[PortID, datetime.date], Digest] = dict()
+    for alert in alerts:
+        key = (alert.location.port_id, alert.tide.utc_datetime.date())
+        if key not in digests:
+            digests[key] = Digest(alert.location, key[1], list())
+        digests[key].alerts.append(alert)
+    for digest in digests.values():
+        digest.alerts.sort(key=lambda alert: alert.tide.utc_datetime)
+    return list(digests.values())
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, Iterable, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from tidal.cache import ResponseCache
+from tidal.metrics import Metrics
+from tidal.providers import TideProvider
+from tidal.providers.bbc import BBCProvider
+from tidal.scraper import (URL, FetchResult, PageResponse, TideScraper,
+                           is_transient_status)
+from tidal.tide_dto import DailyTideRecord, PortID, TideLocation
+from tidal.utils.lazy import retry
+
+
+def _is_transient_error(exception: BaseException) -> bool:
+    if isinstance(exception, aiohttp.ClientResponseError):
+        return is_transient_status(exception.status)
+    return isinstance(exception, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def count_retry(retry_state) -> None:
+    """tenacity `before_sleep` hook, counts retries in the scraper's metrics"""
+    exception = retry_state.outcome.exception()
+    retry_state.args[0].metrics.inc("retries_total", error=type(exception).__name__)
+
+
+class AsyncTideScraper(TideScraper):
+    """
+    asyncio flavour of `TideScraper`: all requests share one
+    `aiohttp.ClientSession`, so connections to each provider's host are
+    kept alive and reused instead of paying a TCP/TLS handshake per
+    location. At most `concurrency` requests are in flight at any time,
+    and at most a provider's `max_concurrency` to its host.
+
+    must be used as an async context manager:
+
+        async with AsyncTideScraper(providers, concurrency=16) as scraper:
+            async for location, records in scraper.download_all(locations):
+                ...
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[TideProvider],
+        cache: Optional[ResponseCache] = None,
+        concurrency: int = 16,
+        timeout: float = 30.0,
+        keepalive_timeout: float = 30.0,
+        metrics: Optional[Metrics] = None,
+        stored_digests: Optional[Dict[PortID, str]] = None,
+    ):
+        super().__init__(
+            providers, cache=cache, metrics=metrics, stored_digests=stored_digests
+        )
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = dict()
+
+    async def __aenter__(self) -> "AsyncTideScraper":
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            # hosts are limited by their provider's semaphore
+            limit_per_host=0,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        host_limits: Dict[str, int] = dict()
+        for provider in self.providers.values():
+            if provider.max_concurrency is not None:
+                # providers on one host share the lowest limit
+                host_limits[provider.host] = min(
+                    host_limits.get(provider.host, self.concurrency), provider.max_concurrency
+                )
+        self._host_semaphores = {
+            host: asyncio.Semaphore(limit) for host, limit in host_limits.items()
+        }
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def fetch_once(self, target_url: URL, headers: Dict[str, str]) -> PageResponse:
+        host_semaphore = self._host_semaphores.get(urlsplit(target_url).netloc)
+        if host_semaphore is None:
+            return await self._fetch_once(target_url, headers)
+        async with host_semaphore:
+            return await self._fetch_once(target_url, headers)
+
+    async def _fetch_once(self, target_url: URL, headers: Dict[str, str]) -> PageResponse:
+        async with self._semaphore:
+            # timed once a slot is free, not profiled: other requests run
+            # while this one awaits
+            with self.metrics.stage("fetch", profile=False):
+                async with self._session.get(target_url, headers=headers) as response:
+                    response.raise_for_status()
+                    return PageResponse(
+                        status=response.status,
+                        body=await response.read(),
+                        charset=response.charset or "utf-8",
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+
+    # only network level errors, 429 and 5xx are worth retrying, the
+    # semaphore is released while backing off so other locations proceed
+    @retry(
+        lambda tenacity: dict(
+            stop=tenacity.stop_after_attempt(3),
+            wait=tenacity.wait_exponential(multiplier=2, min=2, max=32),
+            retry=tenacity.retry_if_exception(_is_transient_error),
+            reraise=True,
+            before_sleep=count_retry,
+        )
+    )
+    async def fetch(self, target_url: URL, headers: Dict[str, str]) -> PageResponse:
+        return await self.fetch_once(target_url, headers)
+
+    async def download_tidal_info(
+        self, location: TideLocation
+    ) -> Tuple[TideLocation, Optional[Iterable[DailyTideRecord]]]:
+        result = await self.fetch_location(location)
+        return result.location, result.records
+
+    async def fetch_location(self, location: TideLocation, retry: bool = True) -> FetchResult:
+        """
+        a location's tides, errors are logged and returned. With
+        retry=False transient errors are not retried here, but left to the
+        caller (see `tidal.scheduler`).
+        """
+        if self._session is None:
+            raise RuntimeError(
+                f"{type(self).__name__} must be used as an async context manager"
+            )
+        target_url = self.location_url(location)
+        started = time.perf_counter()
+        status = None
+        try:
+            cached = self.cached_entry(location)
+            headers = self.request_headers(location)
+            headers.update(ResponseCache.conditional_headers(cached))
+            fetch = self.fetch if retry else self.fetch_once
+            response = await fetch(target_url, headers)
+            status = response.status
+            latency = time.perf_counter() - started
+            records = self.handle_response(location, response, cached)
+            return FetchResult(location, records, status, latency)
+
+        except aiohttp.ClientResponseError as he:
+            self.metrics.inc("failures_total", error=f"HTTPError {he.status}")
+            logging.error(
+                f"HTTP error {he.status} for {target_url}, please check if the area/port id is correct"
+            )
+            return FetchResult(
+                location,
+                None,
+                he.status,
+                time.perf_counter() - started,
+                transient=is_transient_status(he.status),
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ce:
+            self.metrics.inc("failures_total", error=type(ce).__name__)
+            logging.error(f"Connection error for {target_url}: {ce!r}")
+            return FetchResult(
+                location, None, status, time.perf_counter() - started, transient=True
+            )
+        except ValueError as ve:
+            self.metrics.inc("failures_total", error=type(ve).__name__)
+            logging.error(f"Value error: {str(ve)}")
+            return FetchResult(location, None, status, time.perf_counter() - started)
+        except Exception as e:
+            self.metrics.inc("failures_total", error=type(e).__name__)
+            logging.error(f"Unexpected error: {str(e)}")
+            return FetchResult(location, None, status, time.perf_counter() - started)
+
+    async def download_all(
+        self, locations: Iterable[TideLocation]
+    ) -> AsyncIterator[Tuple[TideLocation, Optional[Iterable[DailyTideRecord]]]]:
+        """
+        yields (location, records) in completion order, so one slow port
+        does not hold back the ones already finished.
+        """
+        tasks = [
+            asyncio.ensure_future(self.download_tidal_info(location))
+            for location in locations
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class AsyncBBCTideScraper(AsyncTideScraper):
+    """`AsyncTideScraper` of the BBC tide tables only"""
+
+    def __init__(
+        self,
+        url: URL,
+        parser: str = "fast",
+        cache: Optional[ResponseCache] = None,
+        concurrency: int = 16,
+        timeout: float = 30.0,
+        keepalive_timeout: float = 30.0,
+        metrics: Optional[Metrics] = None,
+    ):
+        super().__init__(
+            [BBCProvider(url, parser=parser)],
+            cache=cache,
+            concurrency=concurrency,
+            timeout=timeout,
+            keepalive_timeout=keepalive_timeout,
+            metrics=metrics,
+        )
+        self.url = url
+        self.parser = parser
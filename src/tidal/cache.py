@@ -0,0 +1,180 @@
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from tidal.tide_dto import AreaID, PortID
+from tidal.utils.store import JSONStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    body_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    fetched_at: float
+    # `tides_digest` of the tides parsed from the body
+    digest: Optional[str] = None
+
+
+class ResponseCache:
+    """
+    on-disk cache of raw tide table pages.
+
+    bodies are content addressed, stored once under `objects/` by their
+    sha256, and each `area_id/port_id` has a small JSON entry under
+    `index/` pointing at its latest body along with the ETag/Last-Modified
+    needed for conditional requests.
+
+    entries older than `ttl` seconds are ignored and evicted, and
+    `evict` drops the least recently fetched entries once the bodies take
+    more than `max_bytes`. Writes are atomic so the cache can be shared by
+    concurrent worker processes.
+    """
+
+    def __init__(self, cache_dir: Path, ttl: float, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index_dir = self.cache_dir / "index"
+        self.object_dir = self.cache_dir / "objects"
+
+    @staticmethod
+    def hash_body(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    def _entry_path(self, area_id: AreaID, port_id: PortID) -> Path:
+        return self.index_dir / area_id / f"{port_id}.json"
+
+    def _object_path(self, body_hash: str) -> Path:
+        return self.object_dir / body_hash[:2] / body_hash
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _write_entry(self, path: Path, entry: CacheEntry) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        JSONStore.save(entry, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.fetched_at > self.ttl
+
+    def get(self, area_id: AreaID, port_id: PortID) -> Optional[CacheEntry]:
+        path = self._entry_path(area_id, port_id)
+        try:
+            entry = JSONStore.load(path, CacheEntry)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {str(e)}")
+            return None
+        if self._is_expired(entry, time.time()):
+            return None
+        if not self._object_path(entry.body_hash).exists():
+            return None
+        return entry
+
+    def read_body(self, entry: CacheEntry) -> Optional[bytes]:
+        try:
+            return self._object_path(entry.body_hash).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        headers = dict()
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put(
+        self,
+        area_id: AreaID,
+        port_id: PortID,
+        body: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        body_hash: Optional[str] = None,
+        digest: Optional[str] = None,
+    ) -> CacheEntry:
+        body_hash = body_hash or self.hash_body(body)
+        object_path = self._object_path(body_hash)
+        if not object_path.exists():
+            self._atomic_write(object_path, body)
+        entry = CacheEntry(
+            body_hash=body_hash,
+            etag=etag,
+            last_modified=last_modified,
+            size=len(body),
+            fetched_at=time.time(),
+            digest=digest,
+        )
+        self._write_entry(self._entry_path(area_id, port_id), entry)
+        return entry
+
+    def touch(self, area_id: AreaID, port_id: PortID, entry: CacheEntry) -> None:
+        """mark `entry` as fresh, e.g. after a 304 Not Modified"""
+        entry.fetched_at = time.time()
+        self._write_entry(self._entry_path(area_id, port_id), entry)
+
+    def evict(self) -> Tuple[int, int]:
+        """
+        removes expired entries, then the least recently fetched ones
+        until the bodies fit in `max_bytes`, then unreferenced bodies.
+        returns (number of entries, bytes of bodies) removed.
+        """
+        now = time.time()
+        live = list()
+        removed_entries = 0
+        for path in self.index_dir.glob("*/*.json"):
+            try:
+                entry = JSONStore.load(path, CacheEntry)
+            except Exception:
+                entry = None
+            if entry is None or self._is_expired(entry, now):
+                path.unlink(missing_ok=True)
+                removed_entries += 1
+            else:
+                live.append((entry.fetched_at, path, entry))
+
+        # entries can share a body, so count each one once
+        references = Counter(entry.body_hash for _, _, entry in live)
+        sizes = {entry.body_hash: entry.size for _, _, entry in live}
+        total = sum(sizes.values())
+        live.sort(key=lambda x: x[0])
+        while total > self.max_bytes and live:
+            _, path, entry = live.pop(0)
+            path.unlink(missing_ok=True)
+            removed_entries += 1
+            references[entry.body_hash] -= 1
+            if references[entry.body_hash] == 0:
+                total -= sizes[entry.body_hash]
+
+        referenced = {entry.body_hash for _, _, entry in live}
+        removed_bytes = 0
+        for path in self.object_dir.glob("*/*"):
+            if path.name not in referenced and not path.name.startswith("."):
+                removed_bytes += path.stat().st_size
+                path.unlink(missing_ok=True)
+
+        if removed_entries:
+            logger.info(
+                f"Evicted {removed_entries} cached pages ({removed_bytes} bytes)"
+            )
+        return removed_entries, removed_bytes
@@ -0,0 +1,229 @@
+import datetime
+import sqlite3
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tidal.schema import LOCATION_TABLE_NAME, TIDE_TYPE_HIGH, TIDE_TYPE_LOW
+from tidal.tide_dto import PortID
+from tidal.utils.epoch import to_epoch
+
+if TYPE_CHECKING:
+    from tidal.partition import PartitionCatalog
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+_ROW_DTYPE = np.dtype(
+    [("port_key", np.int64), ("ts", np.int64), ("tide_type", np.uint8), ("height", np.float32)]
+)
+
+
+def _group_starts(*keys: np.ndarray) -> np.ndarray:
+    """start offsets of the runs of equal keys in (already sorted) arrays"""
+    if len(keys[0]) == 0:
+        return np.zeros(0, dtype=np.intp)
+    changed = np.zeros(len(keys[0]), dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(changed)
+
+
+@dataclass
+class DailyTideColumns:
+    """per port, per UTC day aggregates, NaN where a day has no low or high"""
+
+    port_ids: List[PortID]
+    port: np.ndarray
+    # days since the unix epoch
+    day: np.ndarray
+    min_low: np.ndarray
+    max_high: np.ndarray
+    tidal_range: np.ndarray
+    count: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def dates(self) -> List[datetime.date]:
+        epoch = datetime.date(1970, 1, 1)
+        return [epoch + datetime.timedelta(days=int(day)) for day in self.day]
+
+
+@dataclass
+class TideColumns:
+    """
+    struct of arrays holding tides for many ports, sorted by (port, ts).
+    `port` indexes into `port_ids`, `ts` is epoch seconds and `tide_type`
+    uses the database's integer codes.
+    """
+
+    port_ids: List[PortID]
+    port: np.ndarray
+    ts: np.ndarray
+    height: np.ndarray
+    tide_type: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def select(self, mask: np.ndarray) -> "TideColumns":
+        return TideColumns(
+            port_ids=self.port_ids,
+            port=self.port[mask],
+            ts=self.ts[mask],
+            height=self.height[mask],
+            tide_type=self.tide_type[mask],
+        )
+
+    def for_port(self, port_id: PortID) -> "TideColumns":
+        index = self.port_ids.index(port_id)
+        start, end = np.searchsorted(self.port, [index, index + 1])
+        return self.select(slice(start, end))
+
+    def below(self, threshold: float, tide_type: Optional[int] = TIDE_TYPE_LOW) -> "TideColumns":
+        """tides with height <= threshold, of `tide_type` unless it is None"""
+        mask = self.height <= threshold
+        if tide_type is not None:
+            mask &= self.tide_type == tide_type
+        return self.select(mask)
+
+    def above(self, threshold: float, tide_type: Optional[int] = TIDE_TYPE_HIGH) -> "TideColumns":
+        """tides with height >= threshold, of `tide_type` unless it is None"""
+        mask = self.height >= threshold
+        if tide_type is not None:
+            mask &= self.tide_type == tide_type
+        return self.select(mask)
+
+    def per_port_min_max(self) -> Tuple[np.ndarray, np.ndarray]:
+        """lowest and highest height of each port in `port_ids`, NaN if no tides"""
+        lowest = np.full(len(self.port_ids), np.nan, dtype=np.float32)
+        highest = np.full(len(self.port_ids), np.nan, dtype=np.float32)
+        starts = _group_starts(self.port)
+        if len(starts):
+            ports = self.port[starts]
+            lowest[ports] = np.minimum.reduceat(self.height, starts)
+            highest[ports] = np.maximum.reduceat(self.height, starts)
+        return lowest, highest
+
+    def daily(self) -> DailyTideColumns:
+        day = self.ts // SECONDS_PER_DAY
+        starts = _group_starts(self.port, day)
+        if len(starts) == 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return DailyTideColumns(
+                port_ids=self.port_ids,
+                port=self.port[:0],
+                day=day[:0],
+                min_low=empty,
+                max_high=empty,
+                tidal_range=empty,
+                count=np.zeros(0, dtype=np.int64),
+            )
+        is_low = self.tide_type == TIDE_TYPE_LOW
+        is_high = self.tide_type == TIDE_TYPE_HIGH
+        min_low = np.minimum.reduceat(np.where(is_low, self.height, np.inf), starts)
+        max_high = np.maximum.reduceat(np.where(is_high, self.height, -np.inf), starts)
+        min_low[np.isinf(min_low)] = np.nan
+        max_high[np.isinf(max_high)] = np.nan
+        return DailyTideColumns(
+            port_ids=self.port_ids,
+            port=self.port[starts],
+            day=day[starts],
+            min_low=min_low.astype(np.float32),
+            max_high=max_high.astype(np.float32),
+            tidal_range=(max_high - min_low).astype(np.float32),
+            count=np.diff(np.append(starts, len(self.ts))),
+        )
+
+
+def query_tides_columnar(
+    con: sqlite3.Connection,
+    table_name: str,
+    port_ids: Optional[Sequence[PortID]],
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+    catalog: Optional["PartitionCatalog"] = None,
+) -> TideColumns:
+    """
+    tides of `port_ids` (all ports if None) between start_date and end_date,
+    read straight from SQLite into arrays without creating `Tide` objects.
+    With `catalog`, partitions and archives of a partitioned table are read
+    as well.
+    """
+    if port_ids is None:
+        locations = con.execute(
+            f"SELECT port_key, port_id FROM {LOCATION_TABLE_NAME} ORDER BY port_key"
+        ).fetchall()
+    else:
+        port_ids = list(dict.fromkeys(port_ids))
+        placeholders = ",".join("?" * len(port_ids))
+        found = {
+            port_id: port_key
+            for port_key, port_id in con.execute(
+                f"SELECT port_key, port_id FROM {LOCATION_TABLE_NAME} "
+                f"WHERE port_id IN ({placeholders})",
+                port_ids,
+            )
+        }
+        locations = [(found[p], p) for p in port_ids if p in found]
+
+    # order the ports by key, so rows come back already sorted by (port, ts)
+    locations.sort()
+    result_port_ids = [PortID(port_id) for _, port_id in locations]
+    if not locations:
+        return TideColumns(
+            port_ids=result_port_ids,
+            port=np.zeros(0, dtype=np.int32),
+            ts=np.zeros(0, dtype=np.int64),
+            height=np.zeros(0, dtype=np.float32),
+            tide_type=np.zeros(0, dtype=np.uint8),
+        )
+
+    port_keys = [port_key for port_key, _ in locations]
+    start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+    tables, archives = [table_name], []
+    if catalog is not None:
+        tables, archives = catalog.sources(con, start_ts, end_ts)
+    where = "ts >= ? AND ts <= ? "
+    params: list = [start_ts, end_ts]
+    if port_ids is not None:
+        where += f"AND port_key IN ({','.join('?' * len(port_keys))}) "
+        params += port_keys
+    sql = " UNION ALL ".join(
+        f"SELECT port_key, ts, tide_type, height FROM {table} WHERE {where}"
+        for table in tables
+    )
+    sql += "ORDER BY port_key, ts"
+    rows = np.fromiter(con.execute(sql, params * len(tables)), dtype=_ROW_DTYPE)
+
+    if archives:
+        key_of = {port_id: port_key for port_key, port_id in locations}
+        archived = np.fromiter(
+            (
+                (key_of[port_id], ts, tide_type, height)
+                for port_id, ts, tide_type, height in catalog.archive_rows(
+                    archives, start_ts, end_ts, None if port_ids is None else set(key_of)
+                )
+                if port_id in key_of
+            ),
+            dtype=_ROW_DTYPE,
+        )
+        if len(archived):
+            # table rows first, so they win over archived ones at the same ts
+            rows = np.concatenate([rows, archived])
+            source = np.repeat([0, 1], [len(rows) - len(archived), len(archived)])
+            rows = rows[np.lexsort((source, rows["ts"], rows["port_key"]))]
+            rows = rows[_group_starts(rows["port_key"], rows["ts"])]
+
+    # map the database keys to positions in `port_ids`
+    index_of = np.full(port_keys[-1] + 1, -1, dtype=np.int32)
+    index_of[port_keys] = np.arange(len(port_keys), dtype=np.int32)
+    return TideColumns(
+        port_ids=result_port_ids,
+        port=index_of[rows["port_key"]],
+        ts=np.ascontiguousarray(rows["ts"]),
+        height=np.ascontiguousarray(rows["height"]),
+        tide_type=np.ascontiguousarray(rows["tide_type"]),
+    )
@@ -1,85 +1,235 @@
 import datetime
 import logging
 import sqlite3
+from collections import defaultdict
 from pathlib import Path
-from typing import Iterable
+from typing import (TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional,
+                    Sequence, Tuple)
 
+from tidal.metrics import Metrics
+from tidal.partition import (PartitionCatalog, merge_archived, month_of,
+                             tide_rows_sql)
+from tidal.schema import (LOCATION_TABLE_NAME, META_TABLE_NAME, SCHEMA_VERSION,
+                          TIDE_TYPE_CODES, TIDE_TYPES, daily_stats_table_ddl,
+                          fetch_history_table_ddl, location_table_ddl,
+                          meta_table_ddl, notification_table_ddl,
+                          partition_table_ddl, schema_version,
+                          sweep_table_ddl, tide_table_ddl)
+from tidal.stats import DailyStats
 from tidal.tide_dto import (AreaID, DailyTideRecord, PortID, Tide,
-                            TideLocation, TideType)
+                            TideLocation)
+from tidal.utils.epoch import from_epoch, to_epoch
+
+if TYPE_CHECKING:
+    from tidal.columnar import TideColumns
 
 logger = logging.getLogger(__name__)
 
 
 class TidalDatabase:
-    def __init__(self, database_file: Path, table_name: str):
+    def __init__(
+        self,
+        database_file: Path,
+        table_name: str,
+        synchronous: str = "NORMAL",
+        cache_size_kib: int = 64 * 1024,
+        metrics: Optional[Metrics] = None,
+    ):
         self.con = sqlite3.connect(database_file)
+        self.metrics = metrics if metrics is not None else Metrics()
         self.cursor = self.con.cursor()
         self.table_name = table_name
+        # WAL lets readers (e.g. notify.py) run while a sweep is writing,
+        # and with synchronous=NORMAL a commit no longer waits for an fsync
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute(f"PRAGMA synchronous={synchronous}")
+        self.cursor.execute(f"PRAGMA cache_size=-{cache_size_kib}")
+        # port_id -> (port_key, location) of locations already stored
+        self._port_keys: Dict[PortID, Tuple[int, TideLocation]] = dict()
+        # monthly partitions of the tide table, if enabled
+        self.partitions = PartitionCatalog(table_name)
+        # per port and day aggregates, updated by every write
+        self.stats = DailyStats(table_name)
 
     def create_table(self, drop_existing=False) -> None:
         if drop_existing:
             self.drop_table()
 
-        sql = (
-            "CREATE TABLE IF NOT EXISTS "
-            + self.table_name
-            + " ("
-            + "location TEXT,"
-            + "area_id TEXT,"
-            + "port_id TEXT,"
-            + "utc_datetime TEXT,"
-            + "tide_type TEXT,"
-            + "height REAL,"
-            + "UNIQUE (port_id, utc_datetime) ON CONFLICT REPLACE )"
-        )
+        version = schema_version(self.con, self.table_name)
+        if 0 < version < SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database is at schema version {version}, "
+                f"run migrate_db.py to upgrade it to version {SCHEMA_VERSION}"
+            )
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than this code "
+                f"(version {SCHEMA_VERSION})"
+            )
 
-        self.cursor.execute(sql)
-        if self.cursor.rowcount <= 0:
+        if version == SCHEMA_VERSION:
             logger.debug(
                 f'Table "{self.table_name}" already existed. Skipping creation'
             )
-        else:
+        for sql in (
+            location_table_ddl()
+            + tide_table_ddl(self.table_name)
+            + meta_table_ddl()
+            + notification_table_ddl()
+            + fetch_history_table_ddl()
+            + sweep_table_ddl()
+            + partition_table_ddl()
+            + daily_stats_table_ddl(self.table_name)
+        ):
+            self.cursor.execute(sql)
+        if version != SCHEMA_VERSION:
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             logger.info(f'Table "{self.table_name}" created.')
         self.con.commit()
 
     def drop_table(self) -> None:
-        sql = f"DROP TABLE {self.table_name};"
+        sql = f"DROP TABLE IF EXISTS {self.table_name};"
         self.cursor.execute(sql)
+        self.cursor.execute(f"DROP TABLE IF EXISTS {self.stats.daily_table}")
         self.con.commit()
 
-    def insert(self, tide_records: Iterable[DailyTideRecord]) -> None:
-        insert_sql = (
-            f"INSERT INTO {self.table_name} "
-            f"(location, area_id, port_id, utc_datetime, tide_type, height) "
-            f"VALUES(?,?,?,?,?,?) "
+    def _port_key(self, location: TideLocation) -> int:
+        cached = self._port_keys.get(location.port_id)
+        if cached is not None and cached[1] == location:
+            return cached[0]
+        # a cursor of its own, as this runs while `insert_many` streams rows
+        cursor = self.con.cursor()
+        cursor.execute(
+            f"INSERT INTO {LOCATION_TABLE_NAME} (port_id, area_id, name, region_name) "
+            f"VALUES(?,?,?,?) "
+            f"ON CONFLICT (port_id) DO UPDATE SET "
+            f"area_id = excluded.area_id, "
+            f"name = excluded.name, "
+            f"region_name = excluded.region_name "
+            f"WHERE area_id IS NOT excluded.area_id "
+            f"OR name IS NOT excluded.name "
+            f"OR region_name IS NOT excluded.region_name",
+            (location.port_id, location.area_id, location.name, location.region_name),
         )
-        for daily_tides in tide_records:
-            for tide in daily_tides.tides:
-                self.cursor.execute(
-                    insert_sql,
-                    (
-                        daily_tides.location.name,
-                        daily_tides.location.area_id,
-                        daily_tides.location.port_id,
-                        tide.utc_datetime.isoformat(),
-                        tide.type.value,
+        cursor.execute(
+            f"SELECT port_key FROM {LOCATION_TABLE_NAME} WHERE port_id = ?",
+            (location.port_id,),
+        )
+        port_key = cursor.fetchone()[0]
+        self._port_keys[location.port_id] = (port_key, location)
+        return port_key
+
+    def _tide_rows(
+        self, batches: Iterable[Iterable[DailyTideRecord]], version: int
+    ) -> Iterator[Tuple[int, int, int, float, int]]:
+        for tide_records in batches:
+            for daily_tides in tide_records:
+                port_key = self._port_key(daily_tides.location)
+                for tide in daily_tides.tides:
+                    yield (
+                        port_key,
+                        to_epoch(tide.utc_datetime),
+                        TIDE_TYPE_CODES[tide.type],
                         tide.height,
-                    ),
+                        version,
+                    )
+
+    def insert(self, tide_records: Iterable[DailyTideRecord]) -> int:
+        """inserts or updates tides in one transaction, returns rows changed"""
+        return self.insert_many([tide_records])
+
+    def insert_many(self, batches: Iterable[Iterable[DailyTideRecord]]) -> int:
+        """
+        inserts the records of many locations in one transaction.
+        rows already stored with the same values are left untouched.
+        `data_version` is bumped if anything changed, so readers know to
+        drop their cached results, and the rows written are stamped with
+        it (see `query_tides_by_location`). The daily statistics of the
+        days written are recomputed in the same transaction.
+        returns the number of rows inserted or updated.
+        """
+        try:
+            with self.metrics.stage("store"), self.con:
+                # bumping first takes the write lock, so no other writer can
+                # stamp rows with the same version
+                self.cursor.execute(
+                    f"UPDATE {META_TABLE_NAME} SET value = value + 1 "
+                    f"WHERE key = 'data_version'"
                 )
-        self.con.commit()
+                version = self.data_version()
+                changes_before = self.con.total_changes
+                rows = self._tide_rows(batches, version)
+                if not self.partitions.enabled(self.con):
+                    tables = [self.table_name]
+                    self.cursor.executemany(self._upsert_sql(self.table_name), rows)
+                    num_rows = max(self.cursor.rowcount, 0)
+                else:
+                    # each month into its own partition
+                    by_month: Dict[int, List[tuple]] = defaultdict(list)
+                    for row in rows:
+                        by_month[month_of(row[1])].append(row)
+                    num_rows = 0
+                    tables = list()
+                    for month in sorted(by_month):
+                        table = self.partitions.ensure_table(self.con, month)
+                        tables.append(table)
+                        self.cursor.executemany(self._upsert_sql(table), by_month[month])
+                        num_rows += max(self.cursor.rowcount, 0)
+                changed = self.con.total_changes != changes_before
+                if changed:
+                    with self.metrics.stage("stats", profile=False):
+                        self.stats.update(self.con, self.partitions, tables, version)
+                else:
+                    # nothing changed, leave data_version as it was
+                    self.con.rollback()
+                    self.partitions.invalidate()
+        except sqlite3.Error:
+            # a rolled back batch may have added locations and partitions
+            self._port_keys.clear()
+            self.partitions.invalidate()
+            self.metrics.inc("db_transactions_total", result="error")
+            raise
+        self.metrics.inc(
+            "db_transactions_total", result="committed" if changed else "unchanged"
+        )
+        self.metrics.inc("db_rows_written_total", num_rows)
+        return num_rows
+
+    @staticmethod
+    def _upsert_sql(table: str) -> str:
+        return (
+            f"INSERT INTO {table} "
+            f"(port_key, ts, tide_type, height, version) "
+            f"VALUES(?,?,?,?,?) "
+            f"ON CONFLICT (port_key, ts) DO UPDATE SET "
+            f"tide_type = excluded.tide_type, "
+            f"height = excluded.height, "
+            f"version = excluded.version "
+            f"WHERE tide_type IS NOT excluded.tide_type "
+            f"OR height IS NOT excluded.height"
+        )
+
+    def data_version(self) -> int:
+        self.cursor.execute(
+            f"SELECT value FROM {META_TABLE_NAME} WHERE key = 'data_version'"
+        )
+        return self.cursor.fetchone()[0]
 
     def get_location_by_port_id(self, port_id: PortID) -> TideLocation:
         sql = (
-            f"SELECT location, area_id "
-            f"FROM {self.table_name} "
-            f"WHERE port_id = ? LIMIT 1"
+            f"SELECT region_name, name, area_id "
+            f"FROM {LOCATION_TABLE_NAME} "
+            f"WHERE port_id = ?"
         )
         self.cursor.execute(sql, (port_id,))
         result = self.cursor.fetchone()
         if not result:
             raise ValueError(f"No location found for port_id {port_id}")
         return TideLocation(
-            name=result[0], area_id=AreaID(result[1]), port_id=PortID(port_id)
+            region_name=result[0] or "",
+            name=result[1],
+            area_id=AreaID(result[2]),
+            port_id=PortID(port_id),
         )
 
     def query_tide(
@@ -88,20 +238,147 @@ class TidalDatabase:
         start_date: datetime.datetime,
         end_date: datetime.datetime,
     ) -> Iterable[Tide]:
-        sql = (
-            f"SELECT utc_datetime, tide_type, height "
-            f"FROM {self.table_name} "
-            f"WHERE port_id = ? AND "
-            f"utc_datetime >= ? AND "
-            f"utc_datetime <= ?"
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        sources = self.partitions.sources(self.con, start_ts, end_ts)
+        sql = tide_rows_sql(
+            "t.ts, t.tide_type, t.height",
+            sources.tables,
+            "l.port_id = ? AND t.ts >= ? AND t.ts <= ?",
         )
-        self.cursor.execute(sql, (port_id, start_date.isoformat(), end_date.isoformat()))
-        for record in self.cursor.fetchall():
+        self.cursor.execute(
+            f"{sql} ORDER BY 1", (port_id, start_ts, end_ts) * len(sources.tables)
+        )
+        rows = self.cursor.fetchall()
+        if sources.archives:
+            archived = self.partitions.archive_rows(
+                sources.archives, start_ts, end_ts, {port_id}
+            )
+            rows = merge_archived(
+                rows,
+                [(ts, tide_type, height) for _, ts, tide_type, height in archived],
+                key=lambda row: row[0],
+            )
+        for record in rows:
             yield Tide(
-                type=TideType(record[1]),
-                utc_datetime=datetime.datetime.fromisoformat(record[0]),
+                type=TIDE_TYPES[record[1]],
+                utc_datetime=from_epoch(record[0]),
                 height=float(record[2]),
             )
 
+    def query_tides_by_location(
+        self,
+        port_ids: Optional[Sequence[PortID]],
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+        since_version: Optional[int] = None,
+        entered_after: Optional[datetime.datetime] = None,
+    ) -> Iterator[Tuple[TideLocation, Tide]]:
+        """
+        (location, tide) of many ports (all ports if `port_ids` is None)
+        between start_date and end_date in a single query, ordered by port
+        then time.
+
+        with `since_version` only the delta since an earlier run is read:
+        tides written after that `data_version`, plus, if `entered_after`
+        is given, the tides after it that the window has moved over since.
+        """
+        columns = "l.port_id, l.region_name, l.name, l.area_id, t.ts, t.tide_type, t.height"
+        port_filter = ""
+        port_params: list = []
+        if port_ids is not None:
+            port_params = list(port_ids)
+            port_filter = f"AND l.port_id IN ({','.join('?' * len(port_params))}) "
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        window = [start_ts, end_ts]
+        sources = self.partitions.sources(self.con, start_ts, end_ts)
+        tables = sources.tables
+
+        if since_version is None:
+            sql = tide_rows_sql(columns, tables, f"t.ts >= ? AND t.ts <= ? {port_filter}")
+            params = (window + port_params) * len(tables)
+        else:
+            sql = tide_rows_sql(
+                columns,
+                tables,
+                f"t.version > ? AND t.ts >= ? AND t.ts <= ? {port_filter}",
+                indexed_by="version",
+                union="UNION",
+            )
+            params = ([since_version] + window + port_params) * len(tables)
+            if entered_after is not None:
+                sql += " UNION " + tide_rows_sql(
+                    columns,
+                    tables,
+                    f"t.ts > ? AND t.ts >= ? AND t.ts <= ? {port_filter}",
+                    union="UNION",
+                )
+                params += ([to_epoch(entered_after)] + window + port_params) * len(tables)
+        # port_id and ts
+        sql += " ORDER BY 1, 5"
+        rows = self.con.execute(sql, params)
+
+        # archived tides carry no version, so for a delta they only count as
+        # new once the window moved over them
+        archive_start = start_ts
+        if since_version is not None:
+            archive_start = end_ts + 1 if entered_after is None else max(
+                start_ts, to_epoch(entered_after) + 1
+            )
+        if sources.archives and archive_start <= end_ts:
+            archived = self.partitions.archive_rows(
+                sources.archives,
+                archive_start,
+                end_ts,
+                None if port_ids is None else set(port_params),
+            )
+            if archived:
+                location_rows = {
+                    row[0]: row
+                    for row in self.con.execute(
+                        f"SELECT port_id, region_name, name, area_id FROM {LOCATION_TABLE_NAME}"
+                    )
+                }
+                rows = merge_archived(
+                    list(rows),
+                    [
+                        location_rows[port_id] + (ts, tide_type, height)
+                        for port_id, ts, tide_type, height in archived
+                        if port_id in location_rows
+                    ],
+                    key=lambda row: (row[0], row[4]),
+                )
+
+        locations: Dict[str, TideLocation] = dict()
+        for port_id, region_name, name, area_id, ts, tide_type, height in rows:
+            location = locations.get(port_id)
+            if location is None:
+                location = locations[port_id] = TideLocation(
+                    region_name=region_name or "",
+                    name=name,
+                    area_id=AreaID(area_id),
+                    port_id=PortID(port_id),
+                )
+            yield location, Tide(
+                type=TIDE_TYPES[tide_type],
+                utc_datetime=from_epoch(ts),
+                height=float(height),
+            )
+
+    def query_tides_columnar(
+        self,
+        port_ids: Optional[Sequence[PortID]],
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+    ) -> "TideColumns":
+        """
+        tides of many ports (all ports if `port_ids` is None) as numpy arrays,
+        see `tidal.columnar`. Requires numpy.
+        """
+        from tidal.columnar import query_tides_columnar
+
+        return query_tides_columnar(
+            self.con, self.table_name, port_ids, start_date, end_date, self.partitions
+        )
+
     def close(self):
         self.con.close()
@@ -0,0 +1,415 @@
+import datetime
+import json
+import logging
+import os
+import shutil
+import sqlite3
+from collections import OrderedDict
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tidal.columnar import TideColumns, _group_starts, query_tides_columnar
+from tidal.db import TidalDatabase
+from tidal.partition import PartitionCatalog, add_months, month_bounds, month_of
+from tidal.schema import LOCATION_TABLE_NAME, META_TABLE_NAME, TIDE_TYPES
+from tidal.tide_dto import (AreaID, DailyTideRecord, PortID, Tide,
+                            TideLocation)
+from tidal.utils.epoch import from_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# an export is a directory of shards plus manifest.json describing them.
+# Each shard holds the tides of some ports (--shard-by port) or of one UTC
+# month (--shard-by month) as four columns sorted by (port, ts):
+#   port       uint32, index into the manifest's port_ids
+#   ts         int64, epoch seconds
+#   height     float32
+#   tide_type  uint8, the database's codes
+# "npy" shards are a directory with one .npy file per column, memory mapped
+# when read; "npz" shards one zlib compressed .npz file, smaller but read
+# a column at a time.
+MANIFEST = "manifest.json"
+EXPORT_VERSION = 1
+FORMATS = ("npy", "npz")
+SHARD_BY = ("port", "month")
+COLUMNS = ("port", "ts", "height", "tide_type")
+
+
+class ShardSpec(NamedTuple):
+    name: str
+    # None is every port
+    port_ids: Optional[List[PortID]]
+    start_ts: int
+    end_ts: int
+
+
+def plan_shards(
+    con: sqlite3.Connection,
+    catalog: PartitionCatalog,
+    port_ids: Sequence[PortID],
+    shard_by: str,
+    ports_per_shard: int = 64,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> List[ShardSpec]:
+    """the shards of an export of `port_ids` from start_ts to end_ts (all if None)"""
+    if start_ts is None or end_ts is None:
+        first, last = _time_range(con, catalog)
+        start_ts = first if start_ts is None else start_ts
+        end_ts = last if end_ts is None else end_ts
+    if start_ts is None or end_ts is None or start_ts > end_ts:
+        return []
+    if shard_by == "port":
+        return [
+            ShardSpec(
+                f"ports-{i // ports_per_shard:05d}",
+                list(port_ids[i: i + ports_per_shard]),
+                start_ts,
+                end_ts,
+            )
+            for i in range(0, len(port_ids), ports_per_shard)
+        ]
+    shards = list()
+    month, last_month = month_of(max(start_ts, 0)), month_of(max(end_ts, 0))
+    while month <= last_month:
+        month_start, month_end = month_bounds(month)
+        shards.append(
+            ShardSpec(
+                f"month-{month}", None, max(start_ts, month_start), min(end_ts, month_end - 1)
+            )
+        )
+        month = add_months(month, 1)
+    return shards
+
+
+def _time_range(
+    con: sqlite3.Connection, catalog: PartitionCatalog
+) -> Tuple[Optional[int], Optional[int]]:
+    first, last = None, None
+    for partition in [None] + catalog.partitions(con):
+        if partition is None:
+            table = catalog.table_name
+        elif partition.table is not None:
+            table = partition.table
+        else:
+            # an archived month, its bounds are good enough
+            start, end = month_bounds(partition.month)
+            first = start if first is None else min(first, start)
+            last = end - 1 if last is None else max(last, end - 1)
+            continue
+        low, high = con.execute(f"SELECT MIN(ts), MAX(ts) FROM {table}").fetchone()
+        if low is not None:
+            first = low if first is None else min(first, low)
+            last = high if last is None else max(last, high)
+    return first, last
+
+
+def _shard_path(directory: Path, name: str, fmt: str) -> Path:
+    return directory / (f"{name}.npz" if fmt == "npz" else name)
+
+
+def _write_shard(path: Path, fmt: str, columns: Dict[str, np.ndarray]) -> None:
+    """writes the shard next to `path`, then renames it into place"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    if fmt == "npz":
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_path, path)
+        return
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    for name, column in columns.items():
+        np.save(tmp_path / f"{name}.npy", column)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def _export_shard(
+    args: Tuple[Path, str, Path, str, ShardSpec, List[PortID]]
+) -> dict:
+    """in a pool worker: reads one shard from the database and writes it"""
+    database_file, table_name, directory, fmt, shard, port_ids = args
+    con = sqlite3.connect(f"{Path(database_file).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        columns = query_tides_columnar(
+            con,
+            table_name,
+            shard.port_ids,
+            from_epoch(shard.start_ts),
+            from_epoch(shard.end_ts),
+            PartitionCatalog(table_name),
+        )
+    finally:
+        con.close()
+    index_of = {port_id: i for i, port_id in enumerate(port_ids)}
+    to_export = np.array([index_of[port_id] for port_id in columns.port_ids], dtype=np.uint32)
+    # ports were ordered by port_key, the export orders them by port_ids
+    port = to_export[columns.port] if len(columns) else np.zeros(0, dtype=np.uint32)
+    order = np.lexsort((columns.ts, port))
+    _write_shard(
+        _shard_path(directory, shard.name, fmt),
+        fmt,
+        {
+            "port": port[order],
+            "ts": columns.ts[order],
+            "height": columns.height[order],
+            "tide_type": columns.tide_type[order],
+        },
+    )
+    return {
+        "name": shard.name,
+        "num_rows": len(columns),
+        "ts_min": int(columns.ts.min()) if len(columns) else None,
+        "ts_max": int(columns.ts.max()) if len(columns) else None,
+        "ports": sorted({int(p) for p in np.unique(port)}),
+    }
+
+
+def export_tides(
+    database_file: Path,
+    table_name: str,
+    directory: Path,
+    shard_by: str = "port",
+    fmt: str = "npy",
+    ports_per_shard: int = 64,
+    num_workers: int = 4,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+) -> dict:
+    """
+    exports the tides of `table_name` to `directory`, a shard per pool
+    worker task, and returns the manifest. Each worker reads through a
+    connection of its own; a sweep writing meanwhile may land in some
+    shards and not others, which is logged.
+    """
+    if shard_by not in SHARD_BY:
+        raise ValueError(f"shard_by must be one of {SHARD_BY}")
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(f"{Path(database_file).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        catalog = PartitionCatalog(table_name)
+        data_version = _data_version(con)
+        locations = [
+            TideLocation(region_name or "", name, AreaID(area_id), PortID(port_id))
+            for port_id, region_name, name, area_id in con.execute(
+                f"SELECT port_id, region_name, name, area_id FROM {LOCATION_TABLE_NAME} "
+                f"ORDER BY port_key"
+            )
+        ]
+        port_ids = [location.port_id for location in locations]
+        shards = plan_shards(
+            con,
+            catalog,
+            port_ids,
+            shard_by,
+            ports_per_shard,
+            None if start_date is None else to_epoch(start_date),
+            None if end_date is None else to_epoch(end_date),
+        )
+    finally:
+        con.close()
+
+    tasks = [(database_file, table_name, directory, fmt, shard, port_ids) for shard in shards]
+    if num_workers > 1 and len(tasks) > 1:
+        with Pool(min(num_workers, len(tasks))) as pool:
+            shard_meta = pool.map(_export_shard, tasks, chunksize=1)
+    else:
+        shard_meta = [_export_shard(task) for task in tasks]
+
+    con = sqlite3.connect(f"{Path(database_file).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        if _data_version(con) != data_version:
+            logger.warning("The database was written to during the export, shards may disagree")
+    finally:
+        con.close()
+
+    manifest = {
+        "version": EXPORT_VERSION,
+        "table": table_name,
+        "data_version": data_version,
+        "shard_by": shard_by,
+        "format": fmt,
+        "port_ids": port_ids,
+        "locations": [
+            [location.region_name, location.name, location.area_id, location.port_id]
+            for location in locations
+        ],
+        "shards": [meta for meta in shard_meta if meta["num_rows"]],
+    }
+    # empty shards are not kept
+    for meta in shard_meta:
+        if not meta["num_rows"]:
+            path = _shard_path(directory, meta["name"], fmt)
+            if fmt == "npz":
+                path.unlink()
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+    tmp_manifest = directory / f".{MANIFEST}.{os.getpid()}.tmp"
+    tmp_manifest.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp_manifest, directory / MANIFEST)
+    return manifest
+
+
+def _data_version(con: sqlite3.Connection) -> int:
+    return con.execute(
+        f"SELECT value FROM {META_TABLE_NAME} WHERE key = 'data_version'"
+    ).fetchone()[0]
+
+
+class TideExport:
+    """
+    reads an export written by `export_tides`. "npy" shards are memory
+    mapped, so slicing a port and a time range only touches the pages
+    holding them; "npz" shards are decompressed whole. The last
+    `cache_shards` shards read are kept open.
+    """
+
+    def __init__(self, directory: Path, cache_shards: int = 16):
+        self.directory = Path(directory)
+        self.cache_shards = cache_shards
+        self._open: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+        self.manifest = json.loads((self.directory / MANIFEST).read_text(encoding="utf-8"))
+        if self.manifest.get("version") != EXPORT_VERSION:
+            raise ValueError(f"{directory} is not a version {EXPORT_VERSION} tide export")
+        self.port_ids: List[PortID] = [PortID(p) for p in self.manifest["port_ids"]]
+        self.locations = [
+            TideLocation(region_name=r, name=n, area_id=AreaID(a), port_id=PortID(p))
+            for r, n, a, p in self.manifest["locations"]
+        ]
+        self._index_of = {port_id: i for i, port_id in enumerate(self.port_ids)}
+        self._shard_ports = [set(shard["ports"]) for shard in self.manifest["shards"]]
+
+    def __len__(self) -> int:
+        return sum(shard["num_rows"] for shard in self.manifest["shards"])
+
+    def _columns(self, shard: dict) -> Dict[str, np.ndarray]:
+        name = shard["name"]
+        if name in self._open:
+            self._open.move_to_end(name)
+            return self._open[name]
+        path = _shard_path(self.directory, name, self.manifest["format"])
+        if self.manifest["format"] == "npz":
+            with np.load(path) as npz:
+                columns = {column: npz[column] for column in COLUMNS}
+        else:
+            columns = {
+                column: np.load(path / f"{column}.npy", mmap_mode="r") for column in COLUMNS
+            }
+        if len(self._open) >= self.cache_shards:
+            self._open.popitem(last=False)
+        self._open[name] = columns
+        return columns
+
+    def query(
+        self,
+        port_ids: Optional[Sequence[PortID]] = None,
+        start_date: Optional[datetime.datetime] = None,
+        end_date: Optional[datetime.datetime] = None,
+    ) -> TideColumns:
+        """
+        the tides of `port_ids` (all ports if None) between start_date and
+        end_date (unbounded if None), like `TidalDatabase.query_tides_columnar`
+        """
+        start_ts = -(2 ** 62) if start_date is None else to_epoch(start_date)
+        end_ts = 2 ** 62 if end_date is None else to_epoch(end_date)
+        if port_ids is None:
+            result_ports = list(range(len(self.port_ids)))
+        else:
+            result_ports = [
+                self._index_of[port_id]
+                for port_id in dict.fromkeys(port_ids)
+                if port_id in self._index_of
+            ]
+        position = np.full(len(self.port_ids), -1, dtype=np.int32)
+        position[result_ports] = np.arange(len(result_ports), dtype=np.int32)
+        wanted = set(result_ports)
+
+        parts: List[Tuple[np.ndarray, ...]] = list()
+        for shard, shard_ports in zip(self.manifest["shards"], self._shard_ports):
+            if shard["ts_max"] < start_ts or shard["ts_min"] > end_ts:
+                continue
+            if port_ids is not None and not shard_ports & wanted:
+                continue
+            columns = self._columns(shard)
+            if port_ids is None:
+                ts = columns["ts"]
+                mask = (ts >= start_ts) & (ts <= end_ts)
+                parts.append(tuple(np.asarray(columns[name])[mask] for name in COLUMNS))
+                continue
+            # rows are sorted by (port, ts), a port and range is two bisections
+            port_column = columns["port"]
+            for port in sorted(shard_ports & wanted):
+                lo, hi = np.searchsorted(port_column, [port, port + 1])
+                ts = columns["ts"][lo:hi]
+                first = np.searchsorted(ts, start_ts, side="left")
+                last = np.searchsorted(ts, end_ts, side="right")
+                if first < last:
+                    rows = slice(lo + first, lo + last)
+                    parts.append(tuple(np.array(columns[name][rows]) for name in COLUMNS))
+
+        if parts:
+            port, ts, height, tide_type = (np.concatenate(column) for column in zip(*parts))
+        else:
+            port = np.zeros(0, dtype=np.uint32)
+            ts = np.zeros(0, dtype=np.int64)
+            height = np.zeros(0, dtype=np.float32)
+            tide_type = np.zeros(0, dtype=np.uint8)
+        port = position[port]
+        if len(parts) > 1:
+            order = np.lexsort((ts, port))
+            port, ts, height, tide_type = port[order], ts[order], height[order], tide_type[order]
+        return TideColumns(
+            port_ids=[self.port_ids[i] for i in result_ports],
+            port=port,
+            ts=ts,
+            height=height,
+            tide_type=tide_type,
+        )
+
+    def iter_records(self) -> Iterator[List[DailyTideRecord]]:
+        """the daily records of each shard, one list per shard"""
+        for shard in self.manifest["shards"]:
+            columns = {name: np.asarray(column) for name, column in self._columns(shard).items()}
+            day = columns["ts"] // 86400
+            starts = _group_starts(columns["port"], day)
+            ends = np.append(starts[1:], len(day))
+            records = list()
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                records.append(
+                    DailyTideRecord(
+                        location=self.locations[int(columns["port"][start])],
+                        tides=[
+                            Tide(
+                                type=TIDE_TYPES[tide_type],
+                                utc_datetime=from_epoch(ts),
+                                height=round(height, 3),
+                            )
+                            for ts, height, tide_type in zip(
+                                columns["ts"][start:end].tolist(),
+                                columns["height"][start:end].tolist(),
+                                columns["tide_type"][start:end].tolist(),
+                            )
+                        ],
+                    )
+                )
+            yield records
+
+
+def import_tides(directory: Path, tide_database: TidalDatabase, batch_size: int = 50) -> int:
+    """inserts the tides of an export into a database, returns rows written"""
+    num_rows = 0
+    for records in TideExport(directory).iter_records():
+        # insert_many takes the records of one location per batch entry
+        by_port: Dict[PortID, List[DailyTideRecord]] = dict()
+        for record in records:
+            by_port.setdefault(record.location.port_id, list()).append(record)
+        batches = list(by_port.values())
+        for i in range(0, len(batches), batch_size):
+            num_rows += tide_database.insert_many(batches[i: i + batch_size])
+    return num_rows
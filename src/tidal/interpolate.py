@@ -0,0 +1,279 @@
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from tidal.columnar import SECONDS_PER_DAY, TideColumns
+from tidal.schema import TIDE_TYPE_CODES
+from tidal.tide_dto import PortID, Tide
+from tidal.utils.epoch import from_epoch, to_epoch
+
+# how the water moves between two consecutive extremes. Both map the
+# fraction of the time elapsed between them to the fraction of the height
+# change done, and back.
+#   cosine:   half a cosine wave, the usual harmonic approximation
+#   twelfths: the rule of twelfths, 1, 2, 3, 3, 2, 1 twelfths of the range
+#             in each sixth of the interval
+METHODS = ("cosine", "twelfths")
+
+_TWELFTHS_X = np.linspace(0.0, 1.0, 7)
+_TWELFTHS_Y = np.array([0, 1, 3, 6, 9, 11, 12]) / 12.0
+
+# composite (port, ts) search keys, ts relative to the earliest tide
+_PORT_SHIFT = 40
+
+
+def _rise(x: np.ndarray, method: str) -> np.ndarray:
+    if method == "cosine":
+        return (1.0 - np.cos(np.pi * x)) / 2.0
+    return np.interp(x, _TWELFTHS_X, _TWELFTHS_Y)
+
+
+def _inverse_rise(y: np.ndarray, method: str) -> np.ndarray:
+    if method == "cosine":
+        return np.arccos(np.clip(1.0 - 2.0 * y, -1.0, 1.0)) / np.pi
+    return np.interp(y, _TWELFTHS_Y, _TWELFTHS_X)
+
+
+@dataclass
+class TideWindows:
+    """time windows, per port, in epoch seconds, sorted by (port, start)"""
+
+    port_ids: List[PortID]
+    port: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def for_port(self, port_id: PortID) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        index = self.port_ids.index(port_id)
+        mask = self.port == index
+        return [
+            (from_epoch(int(start)), from_epoch(int(end)))
+            for start, end in zip(self.start[mask], self.end[mask])
+        ]
+
+
+class TideCurve:
+    """
+    continuous water height of many ports, reconstructed from the high and
+    low tides in `columns` (see `tidal.columnar`). Heights are only defined
+    between a port's first and last extreme, NaN elsewhere.
+    """
+
+    def __init__(self, columns: TideColumns, method: str = "cosine"):
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method}, available: {METHODS}")
+        self.method = method
+        self.port_ids = list(columns.port_ids)
+        self.port = columns.port.astype(np.int64)
+        self.ts = columns.ts.astype(np.int64)
+        self.height = columns.height.astype(np.float64)
+        self._base = int(self.ts.min()) if len(self.ts) else 0
+        self._keys = (self.port << _PORT_SHIFT) | (self.ts - self._base)
+
+    @classmethod
+    def from_tides(
+        cls, port_id: PortID, tides: Sequence[Tide], method: str = "cosine"
+    ) -> "TideCurve":
+        tides = sorted(tides, key=lambda tide: tide.utc_datetime)
+        columns = TideColumns(
+            port_ids=[port_id],
+            port=np.zeros(len(tides), dtype=np.int32),
+            ts=np.array([to_epoch(tide.utc_datetime) for tide in tides], dtype=np.int64),
+            height=np.array([tide.height for tide in tides], dtype=np.float32),
+            tide_type=np.array([TIDE_TYPE_CODES[tide.type] for tide in tides], dtype=np.uint8),
+        )
+        return cls(columns, method=method)
+
+    def _port_index(self, port: Union[PortID, int, np.ndarray]) -> Union[int, np.ndarray]:
+        if isinstance(port, str):
+            # an unknown port has no heights
+            return self.port_ids.index(port) if port in self.port_ids else -1
+        return port
+
+    def heights(
+        self, ts: np.ndarray, port: Union[PortID, int, np.ndarray] = 0
+    ) -> np.ndarray:
+        """
+        height at each of `ts` (epoch seconds) of `port`, a port id, or
+        index into `port_ids`, or an array of indices, one per timestamp.
+        """
+        ts = np.asarray(ts, dtype=np.int64)
+        port = np.broadcast_to(np.asarray(self._port_index(port), dtype=np.int64), ts.shape)
+        result = np.full(ts.shape, np.nan)
+        if len(self.ts) == 0:
+            return result
+
+        keys = (port << _PORT_SHIFT) | np.clip(ts - self._base, 0, None)
+        # the extreme at or before each timestamp, and the one after it
+        left = np.searchsorted(self._keys, keys, side="right") - 1
+        right = left + 1
+        left_c = np.clip(left, 0, len(self.ts) - 1)
+        right_c = np.clip(right, 0, len(self.ts) - 1)
+        in_range = (
+            (left >= 0)
+            & (right < len(self.ts))
+            & (self.port[left_c] == port)
+            & (self.port[right_c] == port)
+            & (ts >= self.ts[left_c])
+        )
+        t0, t1 = self.ts[left_c], self.ts[right_c]
+        h0, h1 = self.height[left_c], self.height[right_c]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x = (ts - t0) / (t1 - t0)
+        curve = h0 + (h1 - h0) * _rise(np.clip(x, 0.0, 1.0), self.method)
+        result[in_range] = curve[in_range]
+        # exactly on a port's last extreme
+        on_extreme = (left >= 0) & (self.port[left_c] == port) & (ts == self.ts[left_c])
+        result[on_extreme] = h0[on_extreme]
+        return result
+
+    def height_at(self, port_id: PortID, when: datetime.datetime) -> float:
+        return float(self.heights(np.array([to_epoch(when)]), port_id)[0])
+
+    def sample(
+        self,
+        port_id: PortID,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+        step: datetime.timedelta = datetime.timedelta(minutes=10),
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(epoch seconds, heights) every `step` from start_date to end_date"""
+        ts = np.arange(
+            to_epoch(start_date), to_epoch(end_date) + 1, int(step.total_seconds()), dtype=np.int64
+        )
+        return ts, self.heights(ts, port_id)
+
+    def crossings(self, threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (port, ts, falling) of every time the water goes below `threshold`
+        (falling) or back to it or above, solved exactly on each interval
+        between two extremes of a port.
+        """
+        same_port = self.port[1:] == self.port[:-1]
+        h0, h1 = self.height[:-1], self.height[1:]
+        crosses = same_port & ((h0 < threshold) != (h1 < threshold))
+        index = np.flatnonzero(crosses)
+        h0, h1 = h0[index], h1[index]
+        t0, t1 = self.ts[index], self.ts[index + 1]
+        x = _inverse_rise((threshold - h0) / (h1 - h0), self.method)
+        ts = t0 + np.rint(x * (t1 - t0)).astype(np.int64)
+        return self.port[index], ts, h1 < h0
+
+    def _windows(self, threshold: float, below: bool) -> TideWindows:
+        if len(self.ts) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return TideWindows(self.port_ids, port=empty, start=empty, end=empty)
+        port, ts, falling = self.crossings(threshold)
+        first = np.flatnonzero(np.r_[True, self.port[1:] != self.port[:-1]])
+        last = np.r_[first[1:], len(self.ts)] - 1
+        is_below = self.height[first] < threshold
+
+        # per port, in time order: the first extreme, the crossings, then
+        # the last extreme. Crossings alternate between opening and closing
+        # a window, the first extreme opens one if the water starts inside
+        # it and the last extreme closes whatever is still open.
+        opening = np.concatenate(
+            [
+                is_below if below else ~is_below,
+                falling if below else ~falling,
+                np.zeros(len(last), dtype=bool),
+            ]
+        )
+        event_port = np.concatenate([self.port[first], port, self.port[last]])
+        event_ts = np.concatenate([self.ts[first], ts, self.ts[last]])
+        rank = np.concatenate(
+            [np.zeros(len(first)), np.ones(len(ts)), np.full(len(last), 2)]
+        )
+        order = np.lexsort((rank, event_ts, event_port))
+        event_port, event_ts, opening = event_port[order], event_ts[order], opening[order]
+
+        # an opening event followed by the next event of the same port
+        opens = np.flatnonzero(opening[:-1] & (event_port[:-1] == event_port[1:]))
+        opens = opens[event_ts[opens + 1] > event_ts[opens]]
+        return TideWindows(
+            port_ids=self.port_ids,
+            port=event_port[opens],
+            start=event_ts[opens],
+            end=event_ts[opens + 1],
+        )
+
+    def windows_below(self, threshold: float) -> TideWindows:
+        """when the water is below `threshold`, within the known extremes"""
+        return self._windows(threshold, below=True)
+
+    def windows_above(self, threshold: float) -> TideWindows:
+        """when the water is at or above `threshold`, within the known extremes"""
+        return self._windows(threshold, below=False)
+
+
+class CurveCache:
+    """
+    LRU cache of one port's curve for one UTC day, and of the samples taken
+    from it, for callers asking for the same days over and over. `source` is
+    a `TidalDatabase` or a `TidalReader`; everything cached is dropped when
+    its data_version moves. Cached arrays are shared, and read-only.
+    """
+
+    def __init__(self, source, method: str = "cosine", cache_size: int = 1024):
+        self.source = source
+        self.method = method
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, object]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple) -> Tuple[Optional[object], int]:
+        version = self.source.data_version()
+        with self._lock:
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value, version
+
+    def _put(self, key: tuple, value: object, version: int) -> None:
+        with self._lock:
+            if version == self._version:
+                self._cache[key] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def curve(self, port_id: PortID, day: datetime.date) -> TideCurve:
+        key = ("curve", port_id, day)
+        curve, version = self._get(key)
+        if curve is None:
+            day_start = datetime.datetime.combine(day, datetime.time())
+            # the extremes either side of the day, so all of it can be evaluated
+            columns = self.source.query_tides_columnar(
+                [port_id],
+                day_start - datetime.timedelta(days=1),
+                day_start + datetime.timedelta(days=2),
+            )
+            curve = TideCurve(columns, method=self.method)
+            self._put(key, curve, version)
+        return curve
+
+    def sample_day(
+        self, port_id: PortID, day: datetime.date, num_points: int = 144
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(epoch seconds, heights) at `num_points` evenly spread over the day"""
+        key = ("sample", port_id, day, num_points)
+        samples, version = self._get(key)
+        if samples is None:
+            start = to_epoch(datetime.datetime.combine(day, datetime.time()))
+            ts = start + np.arange(num_points, dtype=np.int64) * SECONDS_PER_DAY // num_points
+            heights = self.curve(port_id, day).heights(ts, port_id)
+            ts.flags.writeable = False
+            heights.flags.writeable = False
+            samples = (ts, heights)
+            self._put(key, samples, version)
+        return samples
@@ -0,0 +1,128 @@
+import sqlite3
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from tidal.schema import SWEEP_PORT_TABLE_NAME, SWEEP_TABLE_NAME
+from tidal.tide_dto import PortID
+
+# status of a port in a sweep
+PENDING = "pending"
+# its tides are in the database
+DONE = "done"
+# its page did not change since the last fetch
+UNCHANGED = "unchanged"
+FAILED = "failed"
+# left out by the scheduler, see `tidal.scheduler`
+DEFERRED = "deferred"
+STATUSES = (PENDING, DONE, UNCHANGED, FAILED, DEFERRED)
+
+
+class Sweep(NamedTuple):
+    sweep_id: int
+    # epoch seconds, finished_at is None until every port got a final status
+    started_at: int
+    finished_at: Optional[int]
+
+
+class SweepJournal:
+    """
+    the status of every port of each `collect_tides_info.py` run, kept in
+    the tide database and updated as the run goes, so a run that died can
+    be resumed, or its failed ports fetched again.
+
+    a port is only DONE once its tides are committed, it is marked from the
+    writer's connection right after its batch is written. A crash in
+    between leaves it PENDING, and resuming fetches it again. Its page may
+    have been cached before the crash, but the response cache is only
+    trusted for tides the fetch history says are stored, and the history
+    is saved after the last commit of a run (see `tidal.scraper.TideScraper`),
+    so the page is parsed and stored again rather than found unchanged.
+    """
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con = con
+
+    def start(self, port_ids: Iterable[PortID]) -> int:
+        """a new sweep with all of `port_ids` PENDING, returns its id"""
+        now = int(time.time())
+        with self.con:
+            cursor = self.con.execute(
+                f"INSERT INTO {SWEEP_TABLE_NAME} (started_at) VALUES (?)", (now,)
+            )
+            sweep_id = cursor.lastrowid
+            self.con.executemany(
+                f"INSERT INTO {SWEEP_PORT_TABLE_NAME} (sweep_id, port_id, status, updated_at) "
+                f"VALUES (?,?,?,?) ON CONFLICT DO NOTHING",
+                ((sweep_id, port_id, PENDING, now) for port_id in port_ids),
+            )
+        return sweep_id
+
+    def latest(self) -> Optional[Sweep]:
+        row = self.con.execute(
+            f"SELECT sweep_id, started_at, finished_at FROM {SWEEP_TABLE_NAME} "
+            f"ORDER BY sweep_id DESC LIMIT 1"
+        ).fetchone()
+        return None if row is None else Sweep(*row)
+
+    def ports(self, sweep_id: int, statuses: Sequence[str]) -> List[PortID]:
+        return [
+            row[0]
+            for row in self.con.execute(
+                f"SELECT port_id FROM {SWEEP_PORT_TABLE_NAME} "
+                f"WHERE sweep_id = ? AND status IN ({','.join('?' * len(statuses))}) "
+                f"ORDER BY port_id",
+                (sweep_id, *statuses),
+            )
+        ]
+
+    def mark(self, sweep_id: int, port_ids: Iterable[PortID], status: str) -> None:
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status {status}, must be one of {STATUSES}")
+        now = int(time.time())
+        with self.con:
+            self.con.executemany(
+                f"UPDATE {SWEEP_PORT_TABLE_NAME} SET status = ?, updated_at = ? "
+                f"WHERE sweep_id = ? AND port_id = ?",
+                ((status, now, sweep_id, port_id) for port_id in port_ids),
+            )
+
+    def counts(self, sweep_id: int) -> Dict[str, int]:
+        return dict(
+            self.con.execute(
+                f"SELECT status, COUNT(*) FROM {SWEEP_PORT_TABLE_NAME} "
+                f"WHERE sweep_id = ? GROUP BY status",
+                (sweep_id,),
+            ).fetchall()
+        )
+
+    def finish(self, sweep_id: int) -> None:
+        """marks the sweep finished if no port is PENDING any more"""
+        with self.con:
+            self.con.execute(
+                f"UPDATE {SWEEP_TABLE_NAME} SET finished_at = ? "
+                f"WHERE sweep_id = ? AND NOT EXISTS ("
+                f"SELECT 1 FROM {SWEEP_PORT_TABLE_NAME} "
+                f"WHERE sweep_id = ? AND status = '{PENDING}')",
+                (int(time.time()), sweep_id, sweep_id),
+            )
+
+    def reopen(self, sweep_id: int, port_ids: Iterable[PortID]) -> None:
+        """puts `port_ids` back to PENDING, to be fetched again"""
+        self.mark(sweep_id, port_ids, PENDING)
+        with self.con:
+            self.con.execute(
+                f"UPDATE {SWEEP_TABLE_NAME} SET finished_at = NULL WHERE sweep_id = ?",
+                (sweep_id,),
+            )
+
+    def prune(self, keep: int = 30) -> int:
+        """forgets all but the last `keep` sweeps, returns how many it dropped"""
+        with self.con:
+            old = f"SELECT sweep_id FROM {SWEEP_TABLE_NAME} ORDER BY sweep_id DESC LIMIT -1 OFFSET ?"
+            self.con.execute(
+                f"DELETE FROM {SWEEP_PORT_TABLE_NAME} WHERE sweep_id IN ({old})", (keep,)
+            )
+            cursor = self.con.execute(
+                f"DELETE FROM {SWEEP_TABLE_NAME} WHERE sweep_id IN ({old})", (keep,)
+            )
+        return cursor.rowcount
@@ -0,0 +1,99 @@
+import datetime
+import hashlib
+import sqlite3
+import time
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from tidal.alerts import Alert, TideRule
+from tidal.schema import LEDGER_TABLE_NAME, NOTIFY_STATE_TABLE_NAME
+from tidal.tide_dto import PortID
+from tidal.utils.epoch import from_epoch, to_epoch
+
+
+class HighWaterMark(NamedTuple):
+    # the data_version the last run had seen, and the end of its window
+    data_version: int
+    window_end: datetime.datetime
+
+
+class NotificationLedger:
+    """
+    what `notify.py` has already done, kept in the tide database: every
+    delivered alert, keyed by (port_id, tide time, rule), and per watch
+    (a set of ports and rules) the high-water mark of its last run.
+    """
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con = con
+
+    @staticmethod
+    def describe_watch(port_ids: Sequence[PortID], rules: Sequence[TideRule]) -> str:
+        ports = ",".join(sorted(port_ids)) if port_ids else "*"
+        return f"ports={ports} rules={','.join(sorted(rule.name for rule in rules))}"
+
+    @staticmethod
+    def watch_key(port_ids: Sequence[PortID], rules: Sequence[TideRule]) -> str:
+        description = NotificationLedger.describe_watch(port_ids, rules)
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def high_water_mark(self, watch: str) -> Optional[HighWaterMark]:
+        row = self.con.execute(
+            f"SELECT data_version, window_end FROM {NOTIFY_STATE_TABLE_NAME} WHERE watch = ?",
+            (watch,),
+        ).fetchone()
+        if row is None:
+            return None
+        return HighWaterMark(data_version=row[0], window_end=from_epoch(row[1]))
+
+    def advance(
+        self, watch: str, description: str, data_version: int, window_end: datetime.datetime
+    ) -> None:
+        with self.con:
+            self.con.execute(
+                f"INSERT INTO {NOTIFY_STATE_TABLE_NAME} "
+                f"(watch, description, data_version, window_end) VALUES (?,?,?,?) "
+                f"ON CONFLICT (watch) DO UPDATE SET "
+                f"data_version = excluded.data_version, "
+                f"window_end = excluded.window_end",
+                (watch, description, data_version, to_epoch(window_end)),
+            )
+
+    def unsent(self, alerts: Iterable[Alert]) -> List[Alert]:
+        sql = (
+            f"SELECT 1 FROM {LEDGER_TABLE_NAME} "
+            f"WHERE port_id = ? AND ts = ? AND rule = ?"
+        )
+        return [
+            alert
+            for alert in alerts
+            if self.con.execute(
+                sql,
+                (alert.location.port_id, to_epoch(alert.tide.utc_datetime), alert.rule.name),
+            ).fetchone()
+            is None
+        ]
+
+    def record(self, alerts: Iterable[Alert]) -> None:
+        sent_at = int(time.time())
+        with self.con:
+            self.con.executemany(
+                f"INSERT INTO {LEDGER_TABLE_NAME} (port_id, ts, rule, sent_at) "
+                f"VALUES (?,?,?,?) ON CONFLICT DO NOTHING",
+                (
+                    (
+                        alert.location.port_id,
+                        to_epoch(alert.tide.utc_datetime),
+                        alert.rule.name,
+                        sent_at,
+                    )
+                    for alert in alerts
+                ),
+            )
+
+    def prune(self, before: datetime.datetime) -> int:
+        """forgets alerts of tides before `before`, they can't match again"""
+        with self.con:
+            cursor = self.con.execute(
+                f"DELETE FROM {LEDGER_TABLE_NAME} WHERE ts < ?", (to_epoch(before),)
+            )
+        return cursor.rowcount
@@ -0,0 +1,437 @@
+import bisect
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from tidal.tide_dto import AreaID, PortID, TideLocation
+from tidal.utils.store import JSONStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".index.db"
+# bump when the layout of the index changes, older indices are rebuilt
+INDEX_VERSION = 1
+
+
+def load_locations_map(tide_location_file: Path) -> Dict[PortID, TideLocation]:
+    """decodes the whole locations file"""
+    location_map = dict()
+    for location in JSONStore.load_lines(path=tide_location_file, dtype=TideLocation):
+        location_map[location.port_id] = location
+    return location_map
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LocationIndex:
+    """
+    SQLite copy of a locations file (by default `<file>.index.db` next to
+    it) so that looking up a few ports does not decode the whole file.
+
+    the index remembers the size, mtime and sha256 of the file it was
+    built from. It is rebuilt when the file's contents change; a changed
+    mtime alone (e.g. a fresh checkout) only costs hashing the file.
+    When the index can't be written, lookups fall back to decoding the
+    file.
+    """
+
+    def __init__(self, tide_location_file: Path, index_file: Optional[Path] = None):
+        self.tide_location_file = Path(tide_location_file)
+        self.index_file = (
+            Path(index_file)
+            if index_file
+            else self.tide_location_file.with_name(self.tide_location_file.name + INDEX_SUFFIX)
+        )
+        self._con: Optional[sqlite3.Connection] = None
+        self._fallback: Optional[Dict[PortID, TideLocation]] = None
+
+    def _stored_meta(self, con: sqlite3.Connection) -> Dict[str, str]:
+        try:
+            return dict(con.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error:
+            return dict()
+
+    def _build(self, stat: os.stat_result, digest: str) -> None:
+        tmp_file = self.index_file.with_name(f".{self.index_file.name}.{os.getpid()}.tmp")
+        tmp_file.unlink(missing_ok=True)
+        con = sqlite3.connect(tmp_file)
+        try:
+            with con:
+                con.execute(
+                    # rowids keep the order of the file
+                    "CREATE TABLE locations (port_id TEXT NOT NULL UNIQUE, region_name TEXT, "
+                    "name TEXT, area_id TEXT)"
+                )
+                con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                con.executemany(
+                    "INSERT INTO locations VALUES (?, ?, ?, ?)",
+                    (
+                        (loc.port_id, loc.region_name, loc.name, loc.area_id)
+                        for loc in load_locations_map(self.tide_location_file).values()
+                    ),
+                )
+                con.executemany(
+                    "INSERT INTO meta VALUES (?, ?)",
+                    [
+                        ("version", str(INDEX_VERSION)),
+                        ("size", str(stat.st_size)),
+                        ("mtime_ns", str(stat.st_mtime_ns)),
+                        ("sha256", digest),
+                    ],
+                )
+        finally:
+            con.close()
+        # atomic, concurrent cron jobs either see the old or the new index
+        os.replace(tmp_file, self.index_file)
+        logger.info(f"Built location index {self.index_file}")
+
+    def _open(self) -> sqlite3.Connection:
+        stat = self.tide_location_file.stat()
+        digest = None
+        if self.index_file.exists():
+            con = sqlite3.connect(self.index_file)
+            meta = self._stored_meta(con)
+            if meta.get("version") == str(INDEX_VERSION) and meta.get("size") == str(
+                stat.st_size
+            ):
+                if meta.get("mtime_ns") == str(stat.st_mtime_ns):
+                    return con
+                digest = _file_digest(self.tide_location_file)
+                if meta.get("sha256") == digest:
+                    try:
+                        with con:
+                            con.execute(
+                                "UPDATE meta SET value = ? WHERE key = 'mtime_ns'",
+                                (str(stat.st_mtime_ns),),
+                            )
+                    except sqlite3.Error:
+                        pass  # read-only index, still valid, just hashed again next time
+                    return con
+            con.close()
+        self._build(stat, digest or _file_digest(self.tide_location_file))
+        return sqlite3.connect(self.index_file)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._con is None and self._fallback is None:
+            try:
+                self._con = self._open()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(
+                    f"Location index {self.index_file} unavailable ({str(e)}), "
+                    f"decoding {self.tide_location_file} instead"
+                )
+                self._fallback = load_locations_map(self.tide_location_file)
+        return self._con
+
+    @staticmethod
+    def _to_location(row: tuple) -> TideLocation:
+        port_id, region_name, name, area_id = row
+        return TideLocation(
+            region_name=region_name, name=name, area_id=AreaID(area_id), port_id=PortID(port_id)
+        )
+
+    def get(self, port_id: PortID) -> Optional[TideLocation]:
+        con = self._connection()
+        if con is None:
+            return self._fallback.get(port_id)
+        row = con.execute(
+            "SELECT port_id, region_name, name, area_id FROM locations WHERE port_id = ?",
+            (port_id,),
+        ).fetchone()
+        return None if row is None else self._to_location(row)
+
+    def get_many(self, port_ids: Iterable[PortID]) -> Dict[PortID, TideLocation]:
+        """the locations of `port_ids` that exist, in the order given"""
+        result = dict()
+        for port_id in port_ids:
+            location = self.get(port_id)
+            if location is not None:
+                result[port_id] = location
+        return result
+
+    def all(self) -> List[TideLocation]:
+        con = self._connection()
+        if con is None:
+            return list(self._fallback.values())
+        return [
+            self._to_location(row)
+            for row in con.execute(
+                "SELECT port_id, region_name, name, area_id FROM locations ORDER BY rowid"
+            )
+        ]
+
+    def close(self) -> None:
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class Coordinates(NamedTuple):
+    latitude: float
+    longitude: float
+
+
+def load_coordinates(coordinates_file: Path) -> Dict[PortID, Coordinates]:
+    """
+    port coordinates from a CSV file with a `port_id,latitude,longitude`
+    header, or from JSON lines with those keys (gzipped if it ends in .gz)
+    """
+    coordinates_file = Path(coordinates_file)
+    opener = gzip.open if coordinates_file.suffix == ".gz" else open
+    coordinates = dict()
+    with opener(coordinates_file, "rt", encoding="utf-8") as f:
+        if ".csv" in coordinates_file.suffixes:
+            rows: Iterable[dict] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            latitude, longitude = float(row["latitude"]), float(row["longitude"])
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError(f"{coordinates_file}: bad coordinates for port {row['port_id']}")
+            coordinates[PortID(str(row["port_id"]))] = Coordinates(latitude, longitude)
+    return coordinates
+
+
+def distance_km(a: Coordinates, b: Coordinates) -> float:
+    """great circle distance, haversine"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a.latitude, a.longitude, b.latitude, b.longitude))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _unit_vector(point: Coordinates) -> Tuple[float, float, float]:
+    lat, lon = math.radians(point.latitude), math.radians(point.longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i: i + 3] for i in range(len(padded) - 2)}
+
+
+def _spread(points: Sequence[tuple], axis: int) -> float:
+    values = [point[axis] for point in points]
+    return max(values) - min(values)
+
+
+# points in a k-d tree leaf, scanned rather than split further
+_LEAF_SIZE = 8
+
+
+class LocationSearch:
+    """
+    in-memory indices over locations: a k-d tree of the ports with known
+    `coordinates` for nearest and radius queries, and word prefixes plus
+    trigrams for searching names. Queries only visit the tree nodes and
+    postings that can match, so they stay fast as the catalogue grows.
+
+    the tree holds points on the unit sphere, where the straight line
+    (chord) distance orders ports the same as the great circle one, with
+    no special case at the poles or the antimeridian.
+    """
+
+    def __init__(
+        self,
+        locations: Sequence[TideLocation],
+        coordinates: Optional[Dict[PortID, Coordinates]] = None,
+    ):
+        self.locations = list(locations)
+        self.coordinates = coordinates or dict()
+        # the tree: points ordered so that each (lo, hi) range splits at its
+        # middle, on the axis in self._axes
+        self._points: List[Tuple[float, float, float, int]] = [
+            (*_unit_vector(self.coordinates[location.port_id]), i)
+            for i, location in enumerate(self.locations)
+            if location.port_id in self.coordinates
+        ]
+        self._axes: Dict[Tuple[int, int], int] = dict()
+        self._build(0, len(self._points))
+
+        # sorted (word, index) of every word of every name
+        self._words: List[Tuple[str, int]] = list()
+        self._trigrams: Dict[str, List[int]] = defaultdict(list)
+        self._name_trigrams: List[Set[str]] = list()
+        for i, location in enumerate(self.locations):
+            name = _normalize(location.name)
+            self._words.extend((word, i) for word in set(name.split()))
+            trigrams = _trigrams(name)
+            for trigram in trigrams:
+                self._trigrams[trigram].append(i)
+            self._name_trigrams.append(trigrams)
+        self._words.sort()
+
+    @classmethod
+    def from_files(
+        cls,
+        tide_location_file: Path,
+        coordinates_file: Optional[Path] = None,
+        index_file: Optional[Path] = None,
+    ) -> "LocationSearch":
+        location_index = LocationIndex(tide_location_file, index_file)
+        try:
+            locations = location_index.all()
+        finally:
+            location_index.close()
+        coordinates = load_coordinates(coordinates_file) if coordinates_file else None
+        return cls(locations, coordinates)
+
+    def _build(self, lo: int, hi: int) -> None:
+        """orders self._points[lo:hi] into a k-d tree"""
+        # an explicit stack, a sorted catalogue would recurse too deep
+        stack = [(lo, hi)]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= _LEAF_SIZE:
+                continue
+            points = self._points[lo:hi]
+            # split on the axis the points spread the most along
+            axis = max(range(3), key=lambda a: _spread(points, a))
+            points.sort(key=lambda p: p[axis])
+            self._points[lo:hi] = points
+            self._axes[(lo, hi)] = axis
+            mid = (lo + hi) // 2
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    def _search(self, target: Tuple[float, float, float], visit) -> None:
+        """
+        walks the tree nearest side first. `visit(point, squared chord)`
+        is called for candidate points and returns the squared chord beyond
+        which nothing is wanted any more.
+        """
+        x, y, z = target
+        # (lo, hi, lowest squared chord to any point in it)
+        stack = [(0, len(self._points), 0.0)]
+        bound = math.inf
+        while stack:
+            lo, hi, gap = stack.pop()
+            if gap > bound:
+                continue
+            if hi - lo <= _LEAF_SIZE:
+                for point in self._points[lo:hi]:
+                    d = (point[0] - x) ** 2 + (point[1] - y) ** 2 + (point[2] - z) ** 2
+                    if d <= bound:
+                        bound = visit(point, d)
+                continue
+            axis = self._axes[(lo, hi)]
+            mid = (lo + hi) // 2
+            point = self._points[mid]
+            d = (point[0] - x) ** 2 + (point[1] - y) ** 2 + (point[2] - z) ** 2
+            if d <= bound:
+                bound = visit(point, d)
+            diff = target[axis] - point[axis]
+            if diff < 0:
+                stack.append((mid + 1, hi, diff * diff))
+                stack.append((lo, mid, gap))
+            else:
+                stack.append((lo, mid, diff * diff))
+                stack.append((mid + 1, hi, gap))
+
+    def within(
+        self, latitude: float, longitude: float, radius_km: float
+    ) -> List[Tuple[TideLocation, float]]:
+        """(location, distance in km) of the ports within `radius_km`, nearest first"""
+        limit = _km_to_chord(radius_km) ** 2
+        found: List[Tuple[float, int]] = list()
+
+        def visit(point, d):
+            if d <= limit:
+                found.append((d, point[3]))
+            return limit
+
+        self._search(_unit_vector(Coordinates(latitude, longitude)), visit)
+        found.sort()
+        return [(self.locations[i], _chord_to_km(math.sqrt(d))) for d, i in found]
+
+    def nearest(
+        self, latitude: float, longitude: float, n: int = 5
+    ) -> List[Tuple[TideLocation, float]]:
+        """(location, distance in km) of the `n` ports nearest to a point"""
+        # max heap of the best n so far, as (-squared chord, -index)
+        best: List[Tuple[float, int]] = list()
+
+        def visit(point, d):
+            if len(best) < n:
+                heapq.heappush(best, (-d, -point[3]))
+            elif (-d, -point[3]) > best[0]:
+                heapq.heapreplace(best, (-d, -point[3]))
+            return -best[0][0] if len(best) == n else math.inf
+
+        if n > 0:
+            self._search(_unit_vector(Coordinates(latitude, longitude)), visit)
+        found = sorted((-d, -i) for d, i in best)
+        return [(self.locations[i], _chord_to_km(math.sqrt(d))) for d, i in found]
+
+    def search(self, text: str, limit: int = 10, min_score: float = 0.3) -> List[TideLocation]:
+        """
+        locations whose name has words starting with those of `text`,
+        shortest name first, then those with the most trigrams in common
+        with it
+        """
+        query = _normalize(text)
+        if not query:
+            return []
+        # prefix matches: names with a word starting with each query word
+        matches: Optional[Set[int]] = None
+        for word in query.split():
+            with_prefix = set()
+            j = bisect.bisect_left(self._words, (word,))
+            while j < len(self._words) and self._words[j][0].startswith(word):
+                with_prefix.add(self._words[j][1])
+                j += 1
+            matches = with_prefix if matches is None else matches & with_prefix
+        ranked = heapq.nsmallest(limit, matches, key=lambda i: (len(self.locations[i].name), i))
+        if len(ranked) >= limit:
+            return [self.locations[i] for i in ranked]
+
+        # fuzzy matches by the Jaccard similarity of the trigram sets. A
+        # name scoring at least min_score shares at least `needed` of the
+        # query's trigrams, so has one of its len - needed + 1 rarest ones
+        trigrams = _trigrams(query)
+        needed = max(1, math.ceil(min_score * len(trigrams)))
+        rarest = sorted(trigrams, key=lambda trigram: len(self._trigrams.get(trigram, ())))
+        candidates = set()
+        for trigram in rarest[: len(trigrams) - needed + 1]:
+            candidates.update(self._trigrams.get(trigram, ()))
+        scored = list()
+        for i in candidates.difference(ranked):
+            num_shared = len(trigrams & self._name_trigrams[i])
+            score = num_shared / (len(trigrams) + len(self._name_trigrams[i]) - num_shared)
+            if score >= min_score:
+                scored.append((-score, i))
+        ranked.extend(i for _, i in heapq.nsmallest(limit - len(ranked), scored))
+        return [self.locations[i] for i in ranked]
@@ -0,0 +1,272 @@
+import cProfile
+import json
+import math
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# histogram buckets are powers of 2 ** (1 / _BUCKETS_PER_OCTAVE), about 19%
+# wide, so any scale (seconds, bytes, rows) fits without configuring bounds
+_BUCKETS_PER_OCTAVE = 4
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _bucket_bound(index: int) -> float:
+    return 2.0 ** (index / _BUCKETS_PER_OCTAVE)
+
+
+class Histogram:
+    """count, sum, min, max and log scaled buckets of observed values"""
+
+    __slots__ = ("count", "sum", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # bucket index -> count of values <= its bound and > the one below
+        self.buckets: Dict[int, int] = defaultdict(int)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        index = math.ceil(math.log2(value) * _BUCKETS_PER_OCTAVE) if value > 0 else -10**6
+        self.buckets[index] += 1
+
+    def merge(self, other: "Histogram") -> None:
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """upper bound of the bucket holding the q-quantile"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(_bucket_bound(index), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        empty = self.count == 0
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": None if empty else self.sum / self.count,
+            "min": None if empty else self.min,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": None if empty else self.max,
+        }
+
+
+class Metrics:
+    """
+    counters and histograms, keyed by name and labels, e.g.
+
+        metrics.inc("fetch_total", status=200)
+        with metrics.stage("parse"):
+            ...
+
+    thread safe. Pool workers send `drain()`-ed snapshots to the parent,
+    which `merge`s them, and pickled copies start empty for that reason.
+    With `profile_dir` set, every `stage` also runs under its own
+    cProfile profiler, see `dump_profiles`.
+    """
+
+    def __init__(self, profile_dir: Optional[Path] = None):
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self._lock = threading.Lock()
+        self._counters: Dict[Key, float] = defaultdict(float)
+        self._histograms: Dict[Key, Histogram] = dict()
+        self._profiles: Dict[str, cProfile.Profile] = dict()
+
+    def __getstate__(self) -> dict:
+        return {"profile_dir": self.profile_dir}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["profile_dir"])
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, name: str, profile: bool = True) -> Iterator[None]:
+        """
+        times the block into `stage_seconds{stage=name}`, and profiles it
+        if profiling is on. Pass profile=False around code that awaits, the
+        profiler would pick up whatever else runs meanwhile.
+        """
+        profiler = None
+        if profile and self.profile_dir is not None:
+            with self._lock:
+                profiler = self._profiles.get(name)
+                if profiler is None:
+                    profiler = self._profiles[name] = cProfile.Profile()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self.observe("stage_seconds", time.perf_counter() - start, stage=name)
+
+    def drain(self) -> dict:
+        """a picklable snapshot of everything recorded so far, then resets"""
+        with self._lock:
+            snapshot = {"counters": dict(self._counters), "histograms": self._histograms}
+            self._counters = defaultdict(float)
+            self._histograms = dict()
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] += value
+            for key, histogram in snapshot["histograms"].items():
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram()
+                self._histograms[key].merge(histogram)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0.0)
+
+    def report(self) -> Dict[str, List[dict]]:
+        """counters and histogram summaries, for a JSON run report"""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.summary()}
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def write_report(self, path: Path, **extra: Any) -> None:
+        report = {**extra, **self.report()}
+        _atomic_write(Path(path), json.dumps(report, indent=2, default=str))
+
+    def prometheus(self, prefix: str = "tidal_") -> str:
+        """the metrics in the Prometheus text exposition format"""
+
+        def labels_text(labels: Labels, *extra: Tuple[str, str]) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines: List[str] = list()
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}{name} counter")
+                    typed.add(name)
+                lines.append(f"{prefix}{name}{labels_text(labels)} {value:g}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for index in sorted(histogram.buckets):
+                    cumulative += histogram.buckets[index]
+                    bound = f"{_bucket_bound(index):.6g}"
+                    lines.append(
+                        f"{prefix}{name}_bucket{labels_text(labels, ('le', bound))} {cumulative}"
+                    )
+                lines.append(
+                    f"{prefix}{name}_bucket{labels_text(labels, ('le', '+Inf'))} {histogram.count}"
+                )
+                lines.append(f"{prefix}{name}_sum{labels_text(labels)} {histogram.sum:g}")
+                lines.append(f"{prefix}{name}_count{labels_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        # atomic, so the node exporter never reads half a file
+        _atomic_write(Path(path), self.prometheus())
+
+    def dump_profiles(self, suffix: str = "") -> List[Path]:
+        """writes `<profile_dir>/<stage><suffix>.prof` for each profiled stage"""
+        if self.profile_dir is None:
+            return []
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            profiles = list(self._profiles.items())
+        paths = list()
+        for stage, profiler in profiles:
+            path = self.profile_dir / f"{stage}{suffix}.prof"
+            profiler.dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+def merge_profiles(profile_dir: Path) -> List[Path]:
+    """
+    merges the `<stage>.<pid>.prof` files of pool workers into
+    `<stage>.prof`, adding the parent's own `<stage>.prof` if any.
+    """
+    by_stage: Dict[str, List[Path]] = defaultdict(list)
+    for path in Path(profile_dir).glob("*.*.prof"):
+        by_stage[path.name.split(".", 1)[0]].append(path)
+    merged = list()
+    for stage, paths in sorted(by_stage.items()):
+        target = Path(profile_dir) / f"{stage}.prof"
+        sources = ([target] if target.exists() else []) + paths
+        stats = pstats.Stats(*map(str, sources))
+        stats.dump_stats(target)
+        for path in paths:
+            path.unlink()
+        merged.append(target)
+    return merged
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
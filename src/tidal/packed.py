@@ -0,0 +1,163 @@
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import (BinaryIO, Dict, Iterable, Iterator, List, Sequence, Tuple,
+                    Union)
+
+from tidal.schema import TIDE_TYPE_CODES, TIDE_TYPES
+from tidal.tide_dto import (DailyTideRecord, FrozenDailyTideRecord, FrozenTide,
+                            PortID, TideLocation, intern_location)
+from tidal.utils.epoch import from_epoch, to_epoch
+
+# one tide as a fixed width little-endian record:
+#   uint16 port index, int64 epoch seconds, float32 height, uint8 tide type
+# the layout of numpy dtype [("port", "<u2"), ("ts", "<i8"),
+# ("height", "<f4"), ("tide_type", "u1")], so a buffer of records can also
+# be viewed with np.frombuffer
+RECORD = struct.Struct("<HqfB")
+
+# heights are float32, round them back to the millimetre on decode so they
+# compare equal to the values that were encoded
+_HEIGHT_DIGITS = 3
+
+
+def encode_tides(
+    records: Iterable[DailyTideRecord], port_index: Dict[PortID, int]
+) -> bytes:
+    pack = RECORD.pack
+    return b"".join(
+        pack(
+            port_index[daily_tides.location.port_id],
+            to_epoch(tide.utc_datetime),
+            tide.height,
+            TIDE_TYPE_CODES[tide.type],
+        )
+        for daily_tides in records
+        for tide in daily_tides.tides
+    )
+
+
+def iter_tides(buffer: Union[bytes, memoryview]) -> Iterator[Tuple[int, int, float, int]]:
+    """(port index, epoch seconds, height, tide type code) of each record"""
+    return RECORD.iter_unpack(buffer)
+
+
+def decode_tides(
+    buffer: Union[bytes, memoryview], locations: Sequence[TideLocation]
+) -> List[FrozenDailyTideRecord]:
+    """records grouped per port and UTC day, in the order they were encoded"""
+    interned = [intern_location(location) for location in locations]
+    daily_records: List[FrozenDailyTideRecord] = list()
+    group_key = None
+    tides: List[FrozenTide] = list()
+    for port, ts, height, tide_type in RECORD.iter_unpack(buffer):
+        key = (port, ts // 86400)
+        if key != group_key:
+            if tides:
+                daily_records.append(
+                    FrozenDailyTideRecord(location=interned[group_key[0]], tides=tuple(tides))
+                )
+            group_key = key
+            tides = list()
+        tides.append(
+            FrozenTide(
+                type=TIDE_TYPES[tide_type],
+                utc_datetime=from_epoch(ts),
+                height=round(height, _HEIGHT_DIGITS),
+            )
+        )
+    if tides:
+        daily_records.append(
+            FrozenDailyTideRecord(location=interned[group_key[0]], tides=tuple(tides))
+        )
+    return daily_records
+
+
+# archive file: header, records, then the locations the port indices refer
+# to as JSON.  header: magic, format version, num records, locations offset
+ARCHIVE_MAGIC = b"TIDP"
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct("<4sHQQ")
+
+
+def write_archive(
+    fileobj: BinaryIO, records: Iterable[DailyTideRecord], chunk_size: int = 4096
+) -> int:
+    """streams `records` into a seekable binary file, returns num of tides"""
+    port_index: Dict[PortID, int] = dict()
+    locations: List[TideLocation] = list()
+    start = fileobj.tell()
+    fileobj.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, 0))
+
+    num_records = 0
+    chunk: List[DailyTideRecord] = list()
+
+    def flush() -> None:
+        nonlocal num_records, chunk
+        data = encode_tides(chunk, port_index)
+        fileobj.write(data)
+        num_records += len(data) // RECORD.size
+        chunk = list()
+
+    for daily_tides in records:
+        if daily_tides.location.port_id not in port_index:
+            port_index[daily_tides.location.port_id] = len(locations)
+            locations.append(daily_tides.location)
+        chunk.append(daily_tides)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    locations_offset = fileobj.tell() - start
+    fileobj.write(
+        json.dumps(
+            [[loc.region_name, loc.name, loc.area_id, loc.port_id] for loc in locations]
+        ).encode("utf-8")
+    )
+    end = fileobj.tell()
+    fileobj.seek(start)
+    fileobj.write(
+        ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, num_records, locations_offset)
+    )
+    fileobj.seek(end)
+    return num_records
+
+
+class PackedArchive:
+    """memory mapped, read-only view of an archive written by `write_archive`"""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_records, locations_offset = ARCHIVE_HEADER.unpack_from(
+            self._mmap
+        )
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {ARCHIVE_VERSION} tide archive")
+        self.locations = [
+            TideLocation(region_name=r, name=n, area_id=a, port_id=p)
+            for r, n, a, p in json.loads(self._mmap[locations_offset:].decode("utf-8"))
+        ]
+        start = ARCHIVE_HEADER.size
+        self.records = memoryview(self._mmap)[start: start + num_records * RECORD.size]
+
+    def __len__(self) -> int:
+        return len(self.records) // RECORD.size
+
+    def __iter__(self) -> Iterator[Tuple[int, int, float, int]]:
+        return iter_tides(self.records)
+
+    def decode(self) -> List[FrozenDailyTideRecord]:
+        return decode_tides(self.records, self.locations)
+
+    def close(self) -> None:
+        self.records.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "PackedArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
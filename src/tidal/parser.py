@@ -0,0 +1,114 @@
+import re
+from html.parser import HTMLParser
+from typing import List, NamedTuple, Optional, Tuple
+
+TIDE_TABLE_CLASS = "wr-c-tide-extremes"
+
+TIME_PATTERN = re.compile(r"(\d\d):(\d\d)")
+
+
+class TideTable(NamedTuple):
+    caption: str
+    # text of the header cell of the time column, e.g. "Time (BST)"
+    time_header: str
+    # (tide type, time, height) as found in each row
+    rows: List[Tuple[str, str, str]]
+
+
+class TideTableParser(HTMLParser):
+    """
+    event driven parser that only keeps the text of the caption,
+    th and td cells of `table.wr-c-tide-extremes`, everything else in
+    the page is skipped without building a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables: List[TideTable] = list()
+        self._in_table = False
+        self._table_depth = 0
+        self._caption: List[str] = list()
+        self._rows: List[List[str]] = list()
+        # buffer of the caption/cell currently being read, None if not in one
+        self._text: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self._in_table:
+                self._table_depth += 1
+            else:
+                for name, value in attrs:
+                    if name == "class" and value and TIDE_TABLE_CLASS in value.split():
+                        self._in_table = True
+                        self._table_depth = 0
+                        self._caption = list()
+                        self._rows = list()
+                        break
+        elif not self._in_table:
+            return
+        elif tag == "tr":
+            self._rows.append(list())
+        elif tag == "th" or tag == "td":
+            self._text = list()
+        elif tag == "caption":
+            self._text = self._caption
+
+    def handle_endtag(self, tag):
+        if not self._in_table:
+            return
+        if tag == "th" or tag == "td":
+            if self._text is not None and self._rows:
+                self._rows[-1].append("".join(self._text))
+            self._text = None
+        elif tag == "caption":
+            self._text = None
+        elif tag == "table":
+            if self._table_depth:
+                self._table_depth -= 1
+            else:
+                self._in_table = False
+                self._close_table()
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def _close_table(self) -> None:
+        rows = [row for row in self._rows if row]
+        if not rows:
+            return
+        header = rows.pop(0)
+        time_header = header[1] if len(header) > 1 else ""
+        self.tables.append(
+            TideTable(
+                caption="".join(self._caption).strip(),
+                time_header=time_header,
+                rows=[(row[0], row[1], row[2]) for row in rows if len(row) >= 3],
+            )
+        )
+
+
+def extract_tide_tables(html: str) -> List[TideTable]:
+    start = html.find(TIDE_TABLE_CLASS)
+    if start < 0:
+        return list()
+    # only the fragment spanning the tide tables needs to be tokenized
+    start = html.rfind("<table", 0, start)
+    end = html.rfind("</table>")
+    if start < 0 or end < start:
+        return list()
+    parser = TideTableParser()
+    parser.feed(html[start: end + len("</table>")])
+    parser.close()
+    return parser.tables
+
+
+def parse_time(time_str: str) -> Optional[Tuple[int, int]]:
+    """returns (hour, minute) of the first HH:MM in `time_str`"""
+    match = TIME_PATTERN.search(time_str)
+    if match is None:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
@@ -0,0 +1,490 @@
+import datetime
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import (Callable, Dict, Iterable, List, NamedTuple, Optional,
+                    Sequence, Set, Tuple)
+
+from tidal.schema import (LOCATION_TABLE_NAME, META_TABLE_NAME,
+                          PARTITION_TABLE_NAME, daily_stats_table_name,
+                          tide_table_ddl)
+from tidal.utils.epoch import from_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# a partitioned database keeps the tides of each UTC month in a table of
+# its own, `<table>_p<YYYYMM>`, listed in PARTITION_TABLE_NAME. Rows from
+# before partitioning was enabled may still be in the tide table itself,
+# which is always read as well. Cold months can be compacted into archive
+# files next to the database, and old months dropped as a whole.
+
+# (port_id, ts, tide_type, height) of an archived tide
+ArchiveRow = Tuple[str, int, int, float]
+
+# archive file: magic, length of the JSON header, the header, then the
+# zlib compressed columns it describes. Rows are sorted by (port_id, ts);
+# the port column is run length encoded, ts delta encoded and heights
+# stored in whole millimetres, so the columns compress well.
+ARCHIVE_MAGIC = b"TIDC"
+ARCHIVE_VERSION = 1
+_ARCHIVE_PREFIX = struct.Struct("<4sI")
+
+
+def month_of(ts: int) -> int:
+    """YYYYMM of the UTC month of epoch seconds `ts`"""
+    day = from_epoch(ts)
+    return day.year * 100 + day.month
+
+
+def month_bounds(month: int) -> Tuple[int, int]:
+    """epoch seconds of the start of `month` (YYYYMM), and of the next one"""
+    year, month = divmod(month, 100)
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    return to_epoch(start), to_epoch(end)
+
+
+def add_months(month: int, num: int) -> int:
+    year, month = divmod(month, 100)
+    year, month = divmod(year * 12 + month - 1 + num, 12)
+    return year * 100 + month + 1
+
+
+def partition_table_name(table_name: str, month: int) -> str:
+    return f"{table_name}_p{month}"
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def write_archive(path: Path, rows: Iterable[ArchiveRow]) -> int:
+    """
+    writes `rows`, sorted by (port_id, ts), to `path` atomically, returns
+    the num of rows written
+    """
+    port_ids: List[str] = list()
+    counts = array("I")
+    ts_delta = array("q")
+    tide_type = array("B")
+    height = array("i")
+    previous_ts = 0
+    for port_id, ts, type_code, value in rows:
+        if not port_ids or port_ids[-1] != port_id:
+            port_ids.append(port_id)
+            counts.append(0)
+        counts[-1] += 1
+        ts_delta.append(ts - previous_ts)
+        previous_ts = ts
+        tide_type.append(type_code)
+        height.append(round(value * 1000))
+
+    sections = [
+        zlib.compress(_little_endian(column), 6)
+        for column in (counts, ts_delta, tide_type, height)
+    ]
+    header = json.dumps(
+        {
+            "version": ARCHIVE_VERSION,
+            "num_rows": len(ts_delta),
+            "port_ids": port_ids,
+            "sections": [len(section) for section in sections],
+        }
+    ).encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_ARCHIVE_PREFIX.pack(ARCHIVE_MAGIC, len(header)))
+        f.write(header)
+        for section in sections:
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(ts_delta)
+
+
+def read_archive(path: Path) -> List[ArchiveRow]:
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, header_size = _ARCHIVE_PREFIX.unpack_from(data)
+    offset = _ARCHIVE_PREFIX.size
+    header = json.loads(data[offset: offset + header_size])
+    if magic != ARCHIVE_MAGIC or header["version"] != ARCHIVE_VERSION:
+        raise ValueError(f"{path} is not a version {ARCHIVE_VERSION} tide archive")
+    offset += header_size
+    columns = list()
+    for typecode, size in zip("IqBi", header["sections"]):
+        columns.append(_from_little_endian(typecode, zlib.decompress(data[offset: offset + size])))
+        offset += size
+    counts, ts_delta, tide_type, height = columns
+    port_column = itertools.chain.from_iterable(
+        itertools.repeat(port_id, count) for port_id, count in zip(header["port_ids"], counts)
+    )
+    return list(
+        zip(
+            port_column,
+            itertools.accumulate(ts_delta),
+            tide_type,
+            (value / 1000 for value in height),
+        )
+    )
+
+
+class Partition(NamedTuple):
+    month: int
+    # name of its table, None once compacted
+    table: Optional[str]
+    # archive file, relative to the database's directory, None until compacted
+    archive: Optional[str]
+
+
+class TideSources(NamedTuple):
+    """where the tides of a time range are: tables, then archive files"""
+
+    tables: List[str]
+    archives: List[Path]
+
+
+class PartitionCatalog:
+    """
+    the partitions of a tide table, read from the database and cached until
+    its data_version moves (partitions change only in transactions that
+    bump it). Thread safe, and shared by all connections to one database.
+    """
+
+    def __init__(self, table_name: str, archive_cache_size: int = 4):
+        self.table_name = table_name
+        self.archive_cache_size = archive_cache_size
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._enabled = False
+        self._partitions: Dict[int, Partition] = dict()
+        self._base_dir: Optional[Path] = None
+        self._archives: "OrderedDict[Path, List[ArchiveRow]]" = OrderedDict()
+
+    def _refresh(self, con: sqlite3.Connection) -> None:
+        meta = dict(
+            con.execute(
+                f"SELECT key, value FROM {META_TABLE_NAME} "
+                f"WHERE key IN ('data_version', 'partitioned')"
+            ).fetchall()
+        )
+        with self._lock:
+            if meta.get("data_version") == self._version:
+                return
+        partitions = dict()
+        if meta.get("partitioned"):
+            partitions = {
+                month: Partition(month, table, archive)
+                for month, table, archive in con.execute(
+                    f"SELECT month, table_name, archive FROM {PARTITION_TABLE_NAME} "
+                    f"WHERE base_table = ?",
+                    (self.table_name,),
+                )
+            }
+        base_dir = Path(con.execute("PRAGMA database_list").fetchone()[2] or ".").parent
+        with self._lock:
+            self._version = meta.get("data_version")
+            self._enabled = bool(meta.get("partitioned"))
+            self._partitions = partitions
+            self._base_dir = base_dir
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+
+    def enabled(self, con: sqlite3.Connection) -> bool:
+        self._refresh(con)
+        return self._enabled
+
+    def partitions(self, con: sqlite3.Connection) -> List[Partition]:
+        self._refresh(con)
+        with self._lock:
+            return [self._partitions[month] for month in sorted(self._partitions)]
+
+    def sources(self, con: sqlite3.Connection, start_ts: int, end_ts: int) -> TideSources:
+        """the tables and archives holding tides from start_ts to end_ts"""
+        self._refresh(con)
+        tables = [self.table_name]
+        archives = list()
+        with self._lock:
+            if not self._enabled:
+                return TideSources(tables, archives)
+            # months are few, a linear scan beats keeping them sorted
+            first, last = month_of(max(start_ts, 0)), month_of(max(end_ts, 0))
+            for month in sorted(self._partitions):
+                if first <= month <= last:
+                    partition = self._partitions[month]
+                    if partition.table is not None:
+                        tables.append(partition.table)
+                    if partition.archive is not None:
+                        archives.append(self._base_dir / partition.archive)
+        return TideSources(tables, archives)
+
+    def archive_rows(
+        self,
+        archives: Sequence[Path],
+        start_ts: int,
+        end_ts: int,
+        port_ids: Optional[Set[str]] = None,
+    ) -> List[ArchiveRow]:
+        """archived tides from start_ts to end_ts, sorted by (port_id, ts)"""
+        rows: List[ArchiveRow] = list()
+        for path in archives:
+            rows.extend(
+                row
+                for row in self._read_archive(path)
+                if start_ts <= row[1] <= end_ts and (port_ids is None or row[0] in port_ids)
+            )
+        if len(archives) > 1:
+            rows.sort(key=lambda row: (row[0], row[1]))
+        return rows
+
+    def _read_archive(self, path: Path) -> List[ArchiveRow]:
+        with self._lock:
+            rows = self._archives.get(path)
+            if rows is not None:
+                self._archives.move_to_end(path)
+                return rows
+        rows = read_archive(path)
+        with self._lock:
+            self._archives[path] = rows
+            while len(self._archives) > self.archive_cache_size:
+                self._archives.popitem(last=False)
+        return rows
+
+    def ensure_table(self, con: sqlite3.Connection, month: int) -> str:
+        """
+        the table of `month`, created if need be. Must run inside the
+        write transaction that uses it.
+        """
+        self._refresh(con)
+        with self._lock:
+            partition = self._partitions.get(month)
+        if partition is not None and partition.table is not None:
+            return partition.table
+        table = partition_table_name(self.table_name, month)
+        for sql in tide_table_ddl(table):
+            con.execute(sql)
+        con.execute(
+            f"INSERT INTO {PARTITION_TABLE_NAME} (base_table, month, table_name) "
+            f"VALUES (?,?,?) "
+            f"ON CONFLICT (base_table, month) DO UPDATE SET table_name = excluded.table_name",
+            (self.table_name, month, table),
+        )
+        with self._lock:
+            self._partitions[month] = Partition(
+                month, table, partition.archive if partition is not None else None
+            )
+        return table
+
+
+def _bump_data_version(con: sqlite3.Connection) -> None:
+    con.execute(f"UPDATE {META_TABLE_NAME} SET value = value + 1 WHERE key = 'data_version'")
+
+
+def enable_partitioning(con: sqlite3.Connection, catalog: PartitionCatalog) -> int:
+    """
+    partitions the tide table by month from now on, and moves the rows it
+    already holds into their partitions. Returns the num of rows moved.
+    """
+    table = catalog.table_name
+    num_rows = 0
+    with con:
+        con.execute(
+            f"INSERT INTO {META_TABLE_NAME} (key, value) VALUES ('partitioned', 1) "
+            f"ON CONFLICT (key) DO UPDATE SET value = 1"
+        )
+        _bump_data_version(con)
+        catalog.invalidate()
+        row = con.execute(f"SELECT MIN(ts), MAX(ts) FROM {table}").fetchone()
+        if row[0] is not None:
+            month, last = month_of(row[0]), month_of(row[1])
+            while month <= last:
+                start, end = month_bounds(month)
+                partition = catalog.ensure_table(con, month)
+                cursor = con.execute(
+                    f"INSERT INTO {partition} (port_key, ts, tide_type, height, version) "
+                    f"SELECT port_key, ts, tide_type, height, version FROM {table} "
+                    f"WHERE ts >= ? AND ts < ? ORDER BY port_key, ts "
+                    f"ON CONFLICT (port_key, ts) DO NOTHING",
+                    (start, end),
+                )
+                num_rows += cursor.rowcount
+                month = add_months(month, 1)
+            con.execute(f"DELETE FROM {table}")
+    catalog.invalidate()
+    return num_rows
+
+
+def compact(con: sqlite3.Connection, catalog: PartitionCatalog, before_month: int) -> int:
+    """
+    moves the tides of every month before `before_month` out of their
+    tables into compressed archive files, returns the num of months
+    compacted. A month written to again after it was compacted gets a table
+    again, and is merged into a new archive the next time.
+    """
+    database_file = Path(con.execute("PRAGMA database_list").fetchone()[2])
+    base_dir = database_file.parent
+    archive_dir = f"{database_file.name}.archive"
+    num_compacted = 0
+    isolation_level = con.isolation_level
+    con.commit()
+    # manage the transactions explicitly: the write lock is taken before the
+    # rows of a month are read, so none written meanwhile is dropped with its
+    # table without having been archived
+    con.isolation_level = None
+    try:
+        for partition in catalog.partitions(con):
+            if partition.month >= before_month or partition.table is None:
+                continue
+            archive = None
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                row = con.execute(
+                    f"SELECT table_name, archive FROM {PARTITION_TABLE_NAME} "
+                    f"WHERE base_table = ? AND month = ?",
+                    (catalog.table_name, partition.month),
+                ).fetchone()
+                if row is None or row[0] is None:
+                    # compacted or dropped by another connection meanwhile
+                    con.execute("ROLLBACK")
+                    continue
+                partition = Partition(partition.month, row[0], row[1])
+                rows = catalog.archive_rows(
+                    [base_dir / partition.archive] if partition.archive else [], 0, 2 ** 62
+                )
+                rows.extend(
+                    con.execute(
+                        f"SELECT l.port_id, t.ts, t.tide_type, t.height FROM {partition.table} t "
+                        f"JOIN {LOCATION_TABLE_NAME} l ON l.port_key = t.port_key"
+                    )
+                )
+                # rows from the table win over older archived ones
+                latest = {(row[0], row[1]): row for row in rows}
+                # a new file each time, so the catalogue never points at a half
+                # written one and readers of the old one are not disturbed
+                version = con.execute(
+                    f"SELECT value FROM {META_TABLE_NAME} WHERE key = 'data_version'"
+                ).fetchone()[0]
+                archive = f"{archive_dir}/{partition.table}.{version}.tidc"
+                num_rows = write_archive(
+                    base_dir / archive, (latest[key] for key in sorted(latest))
+                )
+                con.execute(
+                    f"UPDATE {PARTITION_TABLE_NAME} SET table_name = NULL, archive = ?, "
+                    f"archived_rows = ? WHERE base_table = ? AND month = ?",
+                    (archive, num_rows, catalog.table_name, partition.month),
+                )
+                con.execute(f"DROP TABLE {partition.table}")
+                _bump_data_version(con)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                # nothing points at the new archive
+                if archive is not None:
+                    _unlink(base_dir / archive)
+                raise
+            finally:
+                catalog.invalidate()
+            if partition.archive is not None:
+                _unlink(base_dir / partition.archive)
+            logger.info(f"{partition.table} compacted into {archive}, {num_rows} tides")
+            num_compacted += 1
+    finally:
+        con.isolation_level = isolation_level
+    return num_compacted
+
+
+def drop_before(con: sqlite3.Connection, catalog: PartitionCatalog, before_month: int) -> int:
+    """
+    drops every month before `before_month`, table, archive and daily
+    statistics, without touching a single row of the others. Returns the
+    num of months dropped.
+    """
+    base_dir = Path(con.execute("PRAGMA database_list").fetchone()[2]).parent
+    dropped = [p for p in catalog.partitions(con) if p.month < before_month]
+    if not dropped:
+        return 0
+    with con:
+        for partition in dropped:
+            if partition.table is not None:
+                con.execute(f"DROP TABLE {partition.table}")
+            con.execute(
+                f"DELETE FROM {PARTITION_TABLE_NAME} WHERE base_table = ? AND month = ?",
+                (catalog.table_name, partition.month),
+            )
+        con.execute(
+            f"DELETE FROM {daily_stats_table_name(catalog.table_name)} WHERE day < ?",
+            (month_bounds(before_month)[0] // 86400,),
+        )
+        _bump_data_version(con)
+    catalog.invalidate()
+    for partition in dropped:
+        if partition.archive is not None:
+            _unlink(base_dir / partition.archive)
+        logger.info(f"month {partition.month} of {catalog.table_name} dropped")
+    return len(dropped)
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def tide_rows_sql(
+    columns: str,
+    tables: Sequence[str],
+    where: str,
+    indexed_by: Optional[str] = None,
+    union: str = "UNION ALL",
+) -> str:
+    """
+    `SELECT columns FROM t ... WHERE where` over each of `tables`, joined
+    by `union`. `t` is the tide table and `l` the location table; the
+    parameters of `where` must be repeated once per table. `indexed_by`
+    names an index of the tide table by its suffix, e.g. "version".
+    """
+    return f" {union} ".join(
+        f"SELECT {columns} FROM {table} t "
+        + (f"INDEXED BY {table}_{indexed_by} " if indexed_by else "")
+        + f"JOIN {LOCATION_TABLE_NAME} l ON l.port_key = t.port_key "
+        f"WHERE {where}"
+        for table in tables
+    )
+
+
+def merge_archived(rows: Sequence[tuple], archived: Iterable[tuple], key: Callable) -> List[tuple]:
+    """
+    `rows` read from tables and `archived` ones, sorted by `key`. A row
+    from a table wins over an archived one with the same key, it was
+    written after the month was compacted.
+    """
+    seen = {key(row) for row in rows}
+    merged = list(rows)
+    merged.extend(row for row in archived if key(row) not in seen)
+    merged.sort(key=key)
+    return merged
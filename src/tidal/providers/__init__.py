@@ -0,0 +1,39 @@
+import importlib
+import inspect
+from typing import Dict, List, Type
+
+from tidal.providers.base import (DEFAULT_PROVIDER, TideProvider,
+                                  local_port_id, provider_name_of,
+                                  qualified_port_id)
+
+# name -> "module:class" of every provider, imported when first asked for
+_REGISTRY: Dict[str, str] = {
+    "bbc": "tidal.providers.bbc:BBCProvider",
+    "fake": "tidal.providers.fake:FakeProvider",
+}
+
+
+def register_provider(name: str, target: str) -> None:
+    """registers a provider class, given as "module:class", under `name`"""
+    if ":" in name:
+        raise ValueError(f"provider name {name!r} can't contain ':'")
+    _REGISTRY[name] = target
+
+
+def provider_names() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+def get_provider_class(name: str) -> Type[TideProvider]:
+    target = _REGISTRY.get(name)
+    if target is None:
+        raise ValueError(f"Unknown provider {name}, must be one of {provider_names()}")
+    module_name, class_name = target.split(":")
+    provider_class = getattr(importlib.import_module(module_name), class_name)
+    if not (inspect.isclass(provider_class) and issubclass(provider_class, TideProvider)):
+        raise TypeError(f"provider {name} ({target}) is not a TideProvider")
+    if inspect.isabstract(provider_class):
+        missing = ", ".join(sorted(provider_class.__abstractmethods__))
+        raise TypeError(f"provider {name} ({target}) does not implement {missing}")
+    return provider_class
+
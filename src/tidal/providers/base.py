@@ -0,0 +1,94 @@
+import abc
+import configparser
+import datetime as dt
+import random
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from tidal.constant import USER_AGENT_LIST
+from tidal.metrics import Metrics
+from tidal.tide_dto import DailyTideRecord, PortID, TideLocation
+
+# ports of the default provider keep their plain ids, those of any other
+# are stored as "<provider>:<id>", so the ports of all providers share the
+# locations table, fetch history and sweep journal without clashing
+DEFAULT_PROVIDER = "bbc"
+
+
+def provider_name_of(port_id: PortID) -> str:
+    name, sep, _ = port_id.partition(":")
+    return name if sep else DEFAULT_PROVIDER
+
+
+def qualified_port_id(provider_name: str, port_id: str) -> PortID:
+    if provider_name == DEFAULT_PROVIDER:
+        return PortID(port_id)
+    return PortID(f"{provider_name}:{port_id}")
+
+
+def local_port_id(port_id: PortID) -> str:
+    """the id of a port on its provider's site"""
+    return port_id.partition(":")[2] or port_id
+
+
+class TideProvider(abc.ABC):
+    """
+    what differs between tide table sites: where a location's page is, how
+    the tides are read out of it and how its local times become UTC.
+    Fetching, caching, retries, scheduling and storing are shared, see
+    `tidal.scraper.TideScraper`.
+
+    providers are registered by name in `tidal.providers`, and pickled into
+    the scraping processes, so they hold settings rather than connections.
+    `parse`, `to_utc` and `locations` must be implemented, a provider
+    missing one can't be instantiated.
+    """
+
+    name = ""
+
+    def __init__(self, base_url: str, max_concurrency: Optional[int] = None):
+        self.base_url = base_url
+        # most requests in flight to its host, None leaves it to the sweep
+        self.max_concurrency = max_concurrency
+
+    @classmethod
+    def from_config(cls, config: configparser.SectionProxy) -> "TideProvider":
+        """
+        a provider set up from the config file, `<NAME>_BASE_URL` and
+        `<NAME>_MAX_CONCURRENCY`
+        """
+        prefix = cls.name.upper()
+        return cls(
+            config[f"{prefix}_BASE_URL"],
+            max_concurrency=config.getint(f"{prefix}_MAX_CONCURRENCY", None),
+        )
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.base_url).netloc
+
+    def location_url(self, location: TideLocation) -> str:
+        return self.base_url + location.area_id + "/" + local_port_id(location.port_id)
+
+    def request_headers(self) -> Dict[str, str]:
+        return {"User-Agent": random.choice(USER_AGENT_LIST)}
+
+    @abc.abstractmethod
+    def parse(
+        self, html: str, location: TideLocation, metrics: Metrics
+    ) -> List[DailyTideRecord]:
+        """
+        the tides on a location's page, in UTC. Raises ValueError if the
+        page holds no tide table.
+        """
+
+    @abc.abstractmethod
+    def to_utc(self, local: dt.datetime, zone: str) -> dt.datetime:
+        """a time as written on the page, and its zone as named there, in UTC"""
+
+    @abc.abstractmethod
+    def locations(self, port_ids: Optional[Iterable[PortID]] = None) -> List[TideLocation]:
+        """the ports of this provider, or those of `port_ids` it knows"""
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.base_url!r})"
@@ -0,0 +1,203 @@
+import configparser
+import datetime as dt
+import logging
+import random
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from tidal.constant import USER_AGENT_LIST
+from tidal.metrics import Metrics
+from tidal.parser import extract_tide_tables, parse_time
+from tidal.providers.base import TideProvider
+from tidal.tide_dto import DailyTideRecord, PortID, Tide, TideLocation, TideType
+
+# "fast" streams the tide tables out of the page and falls back to "bs4"
+# (a full BeautifulSoup tree) when it can't find them
+PARSERS = ("fast", "bs4")
+
+# hours the UK is ahead of UTC, by the zone named on the page
+_UK_OFFSETS = {"BST": 1, "GMT": 0}
+
+
+class BBCProvider(TideProvider):
+    """
+    BBC tide tables: a page per port at `<base_url><area_id>/<port_id>`,
+    a table per day starting today, times in GMT or BST as labelled in the
+    table header or next to the time itself.
+    """
+
+    name = "bbc"
+
+    def __init__(
+        self,
+        base_url: str,
+        parser: str = "fast",
+        location_file: Optional[Path] = None,
+        index_file: Optional[Path] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        if parser not in PARSERS:
+            raise ValueError(f"Unknown parser {parser}, must be one of {PARSERS}")
+        super().__init__(base_url, max_concurrency=max_concurrency)
+        self.parser = parser
+        self.location_file = location_file
+        self.index_file = index_file
+
+    @classmethod
+    def from_config(
+        cls, config: configparser.SectionProxy, parser: str = "fast"
+    ) -> "BBCProvider":
+        return cls(
+            config["BASE_URL"],
+            parser=parser,
+            location_file=Path(config["TIDE_LOCATION_FILE"]),
+            index_file=config.get("LOCATION_INDEX_FILE"),
+            max_concurrency=config.getint("BBC_MAX_CONCURRENCY", None),
+        )
+
+    def request_headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json; charset=utf-8",
+            "User-Agent": f"{random.choice(USER_AGENT_LIST)}",
+        }
+
+    def locations(self, port_ids: Optional[Iterable[PortID]] = None) -> List[TideLocation]:
+        from tidal.locations import LocationIndex
+
+        location_index = LocationIndex(self.location_file, self.index_file)
+        try:
+            if port_ids is None:
+                return location_index.all()
+            return list(location_index.get_many(port_ids).values())
+        finally:
+            location_index.close()
+
+    def to_utc(self, local: dt.datetime, zone: str) -> dt.datetime:
+        return local - dt.timedelta(hours=_UK_OFFSETS.get(zone, 0))
+
+    @staticmethod
+    def _zone(text: str, default: str) -> str:
+        if "BST" in text:
+            return "BST"
+        if "GMT" in text:
+            return "GMT"
+        return default
+
+    def parse(
+        self, html: str, location: TideLocation, metrics: Metrics
+    ) -> List[DailyTideRecord]:
+        records = None
+        if self.parser == "fast":
+            records = self._parse_fast(html, location)
+            if records is None:
+                logging.debug(f"fast parser found no tide table for {location}, using bs4")
+                metrics.inc("parser_fallback_total")
+        if records is None:
+            records = self._parse_bs4(html, location)
+        return records
+
+    def _parse_fast(
+        self, html: str, location: TideLocation
+    ) -> Optional[List[DailyTideRecord]]:
+        tables = extract_tide_tables(html)
+        if len(tables) == 0:
+            return None
+
+        logging.info(f"{len(tables)} days predictions found for {location}")
+
+        today = dt.datetime.combine(dt.datetime.utcnow().date(), dt.time())
+        multiday_records: List[DailyTideRecord] = list()
+
+        for day_offset, table in enumerate(tables):
+            logging.debug(f"{table.caption}")
+            day = today + dt.timedelta(days=day_offset)
+            table_zone = self._zone(table.time_header, "GMT")
+            tides = list()
+            for tide_type, time_str, height in table.rows:
+                hour_minute = parse_time(time_str)
+                if hour_minute is None:
+                    logging.error(f"Failed to parse time: {time_str.strip()}")
+                    continue
+                hour, minute = hour_minute
+                try:
+                    tide = Tide(
+                        TideType(tide_type.strip()),
+                        utc_datetime=self.to_utc(
+                            day + dt.timedelta(hours=hour, minutes=minute),
+                            self._zone(time_str, table_zone),
+                        ),
+                        height=float(height),
+                    )
+                    tides.append(tide)
+                except ValueError as e:
+                    logging.error(f"Failed to parse tide row: {tide_type}, {height}, error: {str(e)}")
+                    continue
+
+            multiday_records.append(DailyTideRecord(location=location, tides=tides))
+
+        return multiday_records
+
+    def _parse_bs4(
+        self, html: str, location: TideLocation
+    ) -> List[DailyTideRecord]:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, features="html.parser")
+        table_tag = "table.wr-c-tide-extremes"
+        tables = soup.select(table_tag)
+
+        if len(tables) == 0:
+            raise ValueError(
+                f"Unable to parse bbc tide table {table_tag},"
+                f"please check if {self.base_url} layout changed."
+            )
+
+        logging.info(f"{len(tables)} days predictions found for {location}")
+
+        # TODO: using system's date may cause problem due to time zones?
+        today = dt.datetime.utcnow()
+        multiday_records: List[DailyTideRecord] = list()
+
+        # each table contains tide prediction for 1 day starting 'today'
+        for day_offset, table in enumerate(tables):
+            row_text = table.select_one("caption").text
+            logging.debug(f"{row_text}")
+
+            types = [
+                [td.text for td in row.find_all("th")] for row in table.select("tr")
+            ]
+            data = [
+                [td.text for td in row.find_all("td")]
+                for row in table.select("tr")[1:]
+            ]
+            _, time, height = types.pop(0)
+            high_low = [x[0] for x in types]
+            logging.debug(f"{len(high_low)} {row_text}")
+            table_zone = self._zone(time, "GMT")
+            tides = list()
+            for tide_type, (time_str, height) in zip(high_low, data):
+                clean_time_str = time_str.strip()
+                zone = self._zone(clean_time_str, table_zone)
+                if "BST" in clean_time_str or "GMT" in clean_time_str:
+                    clean_time_str = re.sub(r".*(\d\d:\d\d).+", r"\g<1>", clean_time_str)
+
+                try:
+                    tide_time = dt.datetime.strptime(clean_time_str, "%H:%M").time()
+                    new_datetime = self.to_utc(
+                        dt.datetime.combine(today + dt.timedelta(days=day_offset), tide_time),
+                        zone,
+                    )
+                    tide = Tide(
+                        TideType(tide_type),
+                        utc_datetime=new_datetime,
+                        height=float(height),
+                    )
+                    tides.append(tide)
+                except ValueError as e:
+                    logging.error(f"Failed to parse time: {clean_time_str}, error: {str(e)}")
+                    continue
+
+            multiday_records.append(DailyTideRecord(location=location, tides=tides))
+
+        return multiday_records
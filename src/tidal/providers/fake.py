@@ -0,0 +1,267 @@
+import configparser
+import datetime as dt
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tidal.metrics import Metrics
+from tidal.providers.base import (TideProvider, local_port_id,
+                                  qualified_port_id)
+from tidal.tide_dto import (AreaID, DailyTideRecord, PortID, Tide,
+                            TideLocation, TideType)
+
+logger = logging.getLogger(__name__)
+
+# a made up tide site for tests and benchmarks: a page per port at
+# `<base_url><area_id>/<port_id>` with one table of tides, times in local
+# time with their UTC offset (which may change within a page, as at a
+# daylight saving switch) and heights in metres or feet
+
+_TABLE = re.compile(r'<table class="tide-times" data-units="(m|ft)">(.*?)</table>', re.S)
+_ROW = re.compile(r"<tr><td>(low|high)</td><td>([^<]+)</td><td>([^<]+)</td></tr>")
+_OFFSET = re.compile(r"([+-])(\d\d):(\d\d)$")
+_FEET = 0.3048
+
+# UTC offsets and units of the synthetic ports, in turn
+_ZONES = ("+00:00", "+01:00", "+10:00", "-05:00", "+05:30", "-03:30")
+_UNITS = ("m", "m", "ft")
+
+# lunar semidiurnal period, and the spring-neap cycle
+_TIDE_PERIOD = dt.timedelta(hours=12, minutes=25, seconds=14)
+_SPRING_NEAP_DAYS = 14.77
+
+
+def fake_locations(num_ports: int) -> List[TideLocation]:
+    return [
+        TideLocation(
+            region_name=f"Fake region {i % 10}",
+            name=f"Fake port {i}",
+            area_id=AreaID(str(i % 10)),
+            port_id=qualified_port_id(FakeProvider.name, f"{i:04d}"),
+        )
+        for i in range(num_ports)
+    ]
+
+
+def fake_tides(
+    port_id: str, start: dt.datetime, days: int
+) -> List[Tuple[TideType, dt.datetime, float]]:
+    """made up but tide like extremes of a port from start, in UTC"""
+    seed = int(hashlib.sha1(port_id.encode()).hexdigest()[:8], 16)
+    # the same tides for a port whenever its page is asked for
+    epoch = dt.datetime(2024, 1, 1) + dt.timedelta(seconds=seed % int(_TIDE_PERIOD.total_seconds()))
+    mean, amplitude = 2.0 + seed % 30 / 10, 1.0 + seed % 17 / 10
+    when = epoch + (start - epoch) // (_TIDE_PERIOD / 2) * (_TIDE_PERIOD / 2)
+    tide_type = TideType.HIGH if (when - epoch) // (_TIDE_PERIOD / 2) % 2 == 0 else TideType.LOW
+    tides = list()
+    while when < start + dt.timedelta(days=days):
+        if when >= start:
+            spring = 1 + 0.3 * math.cos(2 * math.pi * (when - epoch).days / _SPRING_NEAP_DAYS)
+            sign = 1 if tide_type == TideType.HIGH else -1
+            tides.append((tide_type, when, round(mean + sign * amplitude * spring, 2)))
+        when += _TIDE_PERIOD / 2
+        tide_type = TideType.LOW if tide_type == TideType.HIGH else TideType.HIGH
+    return tides
+
+
+def fake_page(location: TideLocation, start: dt.datetime, days: int = 7) -> str:
+    """the page of a synthetic port, a day's worth of tides per day from start"""
+    port = int(local_port_id(location.port_id)) if local_port_id(location.port_id).isdigit() else 0
+    zone, units = _ZONES[port % len(_ZONES)], _UNITS[port % len(_UNITS)]
+    sign, hours, minutes = _OFFSET.match(zone).groups()
+    offset = (1 if sign == "+" else -1) * dt.timedelta(hours=int(hours), minutes=int(minutes))
+    rows = "\n".join(
+        f"<tr><td>{tide_type.value.lower()}</td>"
+        f"<td>{(when + offset).isoformat(timespec='minutes')}{zone}</td>"
+        f"<td>{height / _FEET if units == 'ft' else height:.2f}</td></tr>"
+        for tide_type, when, height in fake_tides(location.port_id, start, days)
+    )
+    return (
+        f"<html><head><title>{location.name}</title></head><body>\n"
+        f"<h1>{location.name}</h1>\n"
+        f'<table class="tide-times" data-units="{units}">\n'
+        f"<tr><th>Tide</th><th>Time</th><th>Height ({units})</th></tr>\n"
+        f"{rows}\n</table>\n</body></html>\n"
+    )
+
+
+class FakeProvider(TideProvider):
+    """
+    the made up site served by `FixtureServer`. Its ports are the
+    `num_ports` synthetic ones, or those listed in `locations.json` of
+    `fixture_dir`.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        base_url: str,
+        num_ports: int = 100,
+        fixture_dir: Optional[Path] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        super().__init__(base_url, max_concurrency=max_concurrency)
+        self.num_ports = num_ports
+        self.fixture_dir = None if fixture_dir is None else Path(fixture_dir)
+
+    @classmethod
+    def from_config(cls, config: configparser.SectionProxy) -> "FakeProvider":
+        return cls(
+            config["FAKE_BASE_URL"],
+            num_ports=config.getint("FAKE_NUM_PORTS", 100),
+            fixture_dir=config.get("FAKE_FIXTURE_DIR") or None,
+            max_concurrency=config.getint("FAKE_MAX_CONCURRENCY", None),
+        )
+
+    def locations(self, port_ids: Optional[Iterable[PortID]] = None) -> List[TideLocation]:
+        if self.fixture_dir is not None:
+            with open(self.fixture_dir / "locations.json", encoding="utf-8") as f:
+                locations = [TideLocation(**location) for location in json.load(f)]
+        else:
+            locations = fake_locations(self.num_ports)
+        if port_ids is None:
+            return locations
+        wanted = set(port_ids)
+        return [location for location in locations if location.port_id in wanted]
+
+    def to_utc(self, local: dt.datetime, zone: str) -> dt.datetime:
+        match = _OFFSET.match(zone)
+        if match is None:
+            raise ValueError(f"Not a UTC offset: {zone}")
+        sign, hours, minutes = match.groups()
+        offset = dt.timedelta(hours=int(hours), minutes=int(minutes))
+        return local - offset if sign == "+" else local + offset
+
+    def parse(
+        self, html: str, location: TideLocation, metrics: Metrics
+    ) -> List[DailyTideRecord]:
+        table = _TABLE.search(html)
+        if table is None:
+            raise ValueError(f"No tide table found for {location}")
+        units, rows = table.groups()
+        days: Dict[dt.date, List[Tide]] = dict()
+        for tide_type, time_str, height in _ROW.findall(rows):
+            try:
+                utc_datetime = self.to_utc(
+                    dt.datetime.fromisoformat(time_str[:-6]), time_str[-6:]
+                )
+                tide = Tide(
+                    TideType(tide_type.capitalize()),
+                    utc_datetime=utc_datetime,
+                    height=round(float(height) * (_FEET if units == "ft" else 1.0), 2),
+                )
+            except ValueError as e:
+                logging.error(f"Failed to parse tide row: {time_str}, {height}, error: {str(e)}")
+                continue
+            days.setdefault(utc_datetime.date(), list()).append(tide)
+        logging.info(f"{len(days)} days predictions found for {location}")
+        return [DailyTideRecord(location=location, tides=tides) for tides in days.values()]
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    serves tide pages on localhost, so sweeps can be tested and benchmarked
+    without the real sites:
+
+        /fake/<area_id>/<port_id>  the page of a `FakeProvider` port, the
+                                   file <port_id>.html of `fake_dir` if there
+                                   is one, else a synthetic page from today
+        /bbc/<area_id>/<port_id>   one of `bbc_pages`, picked by port
+
+    every response waits `latency` seconds first, plus up to `jitter` more
+    at random, and `error_rate` of them are a 503. `requests` counts the pages served by path prefix.
+    """
+
+    daemon_threads = True
+    # the default backlog of 5 drops connections from a busy sweep
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        bbc_pages: Sequence[str] = (),
+        fake_dir: Optional[Path] = None,
+        days: int = 7,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        jitter: float = 0.0,
+    ):
+        super().__init__(address, _FixtureHandler)
+        self.bbc_pages = [page.encode("utf-8") for page in bbc_pages]
+        self.fake_dir = None if fake_dir is None else Path(fake_dir)
+        self.days = days
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests: Dict[str, int] = dict()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def page(self, path: str) -> Optional[bytes]:
+        parts = path.strip("/").split("/")
+        if len(parts) != 3:
+            return None
+        prefix, area_id, port_id = parts
+        with self._lock:
+            self.requests[prefix] = self.requests.get(prefix, 0) + 1
+        if prefix == "bbc" and self.bbc_pages:
+            digest = hashlib.sha1(port_id.encode()).digest()
+            return self.bbc_pages[digest[0] % len(self.bbc_pages)]
+        if prefix == "fake":
+            if self.fake_dir is not None and (self.fake_dir / f"{port_id}.html").is_file():
+                return (self.fake_dir / f"{port_id}.html").read_bytes()
+            location = TideLocation(
+                region_name="",
+                name=f"Fake port {port_id}",
+                area_id=AreaID(area_id),
+                port_id=qualified_port_id(FakeProvider.name, port_id),
+            )
+            today = dt.datetime.combine(dt.datetime.utcnow().date(), dt.time())
+            return fake_page(location, today, self.days).encode("utf-8")
+        return None
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return self.latency + self._random.uniform(0.0, self.jitter)
+
+    def fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    server: FixtureServer
+    protocol_version = "HTTP/1.1"
+    # small responses on keep-alive connections, don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+        if self.server.fail():
+            status, body = 503, b"try again later"
+        else:
+            body = self.server.page(self.path.split("?")[0])
+            status = 200 if body is not None else 404
+            body = body if body is not None else b"not found"
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
@@ -0,0 +1,301 @@
+import datetime
+import logging
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Sequence, Tuple
+
+from tidal.partition import PartitionCatalog, merge_archived, tide_rows_sql
+from tidal.schema import LOCATION_TABLE_NAME, META_TABLE_NAME, TIDE_TYPES
+from tidal.tide_dto import AreaID, PortID, Tide, TideLocation
+from tidal.utils.epoch import from_epoch, to_epoch
+
+if TYPE_CHECKING:
+    from tidal.columnar import TideColumns
+
+logger = logging.getLogger(__name__)
+
+
+class ReadConnectionPool:
+    """
+    thread-safe pool of read-only connections to a database.
+
+    connections are opened lazily, up to `size`, and handed out one
+    thread at a time. Each keeps sqlite3's statement cache, so queries
+    issued with the same SQL string are only prepared once per connection.
+    """
+
+    def __init__(self, database_file: Path, size: int = 4, cached_statements: int = 128):
+        self.uri = f"{Path(database_file).resolve().as_uri()}?mode=ro"
+        self.size = size
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._num_open = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(
+            self.uri,
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+
+    def acquire(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._num_open < self.size:
+                self._num_open += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._num_open -= 1
+                    raise
+        return self._idle.get(timeout=timeout)
+
+    def release(self, con: sqlite3.Connection) -> None:
+        self._idle.put(con)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    def close(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._num_open -= 1
+
+
+class TidalReader:
+    """
+    read side of `TidalDatabase` for long running consumers.
+
+    `query_tide` results are kept in an LRU cache keyed by
+    (port_id, start_date, end_date), and dropped as a whole whenever the
+    database's data_version moves, i.e. after any insert that changed rows.
+    Cached results are shared between callers and must not be modified.
+    Partitioned tables are read through their `PartitionCatalog`.
+    """
+
+    def __init__(
+        self,
+        database_file: Path,
+        table_name: str,
+        pool_size: int = 4,
+        cache_size: int = 4096,
+        fetch_size: int = 256,
+    ):
+        self.pool = ReadConnectionPool(database_file, size=pool_size)
+        self.table_name = table_name
+        self.cache_size = cache_size
+        self.fetch_size = fetch_size
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._cache_version: Optional[int] = None
+        self._cache_lock = threading.Lock()
+        self.partitions = PartitionCatalog(table_name)
+
+        # built once so every call reuses the connections' prepared statements
+        self._version_sql = (
+            f"SELECT value FROM {META_TABLE_NAME} WHERE key = 'data_version'"
+        )
+        self._location_sql = (
+            f"SELECT region_name, name, area_id "
+            f"FROM {LOCATION_TABLE_NAME} "
+            f"WHERE port_id = ?"
+        )
+        self._tide_sql = (
+            f"SELECT t.ts, t.tide_type, t.height "
+            f"FROM {self.table_name} t "
+            f"JOIN {LOCATION_TABLE_NAME} l ON l.port_key = t.port_key "
+            f"WHERE l.port_id = ? AND "
+            f"t.ts >= ? AND "
+            f"t.ts <= ? "
+            f"ORDER BY t.ts"
+        )
+
+    def data_version(self) -> int:
+        with self.pool.connection() as con:
+            return con.execute(self._version_sql).fetchone()[0]
+
+    def _cached(self, key: tuple) -> Tuple[Optional[tuple], int]:
+        """returns the cached value of `key`, if any, and the data version"""
+        version = self.data_version()
+        with self._cache_lock:
+            if version != self._cache_version:
+                self._cache.clear()
+                self._cache_version = version
+                return None, version
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value, version
+
+    def _store(self, key: tuple, value: tuple, version: int) -> None:
+        with self._cache_lock:
+            if version != self._cache_version:
+                return
+            self._cache[key] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get_location_by_port_id(self, port_id: PortID) -> TideLocation:
+        key = ("location", port_id)
+        cached, version = self._cached(key)
+        if cached is not None:
+            return cached[0]
+        with self.pool.connection() as con:
+            result = con.execute(self._location_sql, (port_id,)).fetchone()
+        if not result:
+            raise ValueError(f"No location found for port_id {port_id}")
+        location = TideLocation(
+            region_name=result[0] or "",
+            name=result[1],
+            area_id=AreaID(result[2]),
+            port_id=PortID(port_id),
+        )
+        self._store(key, (location,), version)
+        return location
+
+    def iter_tide(
+        self,
+        port_id: PortID,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+    ) -> Iterator[Tide]:
+        """streams tides `fetch_size` rows at a time, bypassing the cache"""
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        con = self.pool.acquire()
+        try:
+            tables, archives = self.partitions.sources(con, start_ts, end_ts)
+            sql = self._tide_sql
+            if len(tables) > 1:
+                sql = tide_rows_sql(
+                    "t.ts, t.tide_type, t.height",
+                    tables,
+                    "l.port_id = ? AND t.ts >= ? AND t.ts <= ?",
+                )
+                sql += " ORDER BY 1"
+            cursor = con.execute(sql, (port_id, start_ts, end_ts) * len(tables))
+            if archives:
+                archived = self.partitions.archive_rows(archives, start_ts, end_ts, {port_id})
+                batches: Iterator[list] = iter(
+                    [
+                        merge_archived(
+                            cursor.fetchall(),
+                            [(ts, tide_type, height) for _, ts, tide_type, height in archived],
+                            key=lambda row: row[0],
+                        )
+                    ]
+                )
+            else:
+                batches = iter(lambda: cursor.fetchmany(self.fetch_size), [])
+            for rows in batches:
+                for ts, tide_type, height in rows:
+                    yield Tide(
+                        type=TIDE_TYPES[tide_type],
+                        utc_datetime=from_epoch(ts),
+                        height=height,
+                    )
+        finally:
+            self.pool.release(con)
+
+    def query_tide(
+        self,
+        port_id: PortID,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+    ) -> Tuple[Tide, ...]:
+        key = (port_id, start_date, end_date)
+        cached, version = self._cached(key)
+        if cached is not None:
+            return cached
+        tides = tuple(self.iter_tide(port_id, start_date, end_date))
+        self._store(key, tides, version)
+        return tides
+
+    def query_tides_by_location(
+        self,
+        port_ids: Optional[Sequence[PortID]],
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+    ) -> Iterator[Tuple[TideLocation, Tide]]:
+        """uncached, see `TidalDatabase.query_tides_by_location`"""
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        port_filter = ""
+        port_params: list = []
+        if port_ids is not None:
+            port_params = list(port_ids)
+            port_filter = f"AND l.port_id IN ({','.join('?' * len(port_params))})"
+        with self.pool.connection() as con:
+            tables, archives = self.partitions.sources(con, start_ts, end_ts)
+            sql = tide_rows_sql(
+                "l.port_id, l.region_name, l.name, l.area_id, t.ts, t.tide_type, t.height",
+                tables,
+                f"t.ts >= ? AND t.ts <= ? {port_filter}",
+            )
+            rows = con.execute(
+                f"{sql} ORDER BY 1, 5", ([start_ts, end_ts] + port_params) * len(tables)
+            ).fetchall()
+            if archives:
+                location_rows = {
+                    row[0]: row
+                    for row in con.execute(
+                        f"SELECT port_id, region_name, name, area_id FROM {LOCATION_TABLE_NAME}"
+                    )
+                }
+                archived = self.partitions.archive_rows(
+                    archives, start_ts, end_ts, None if port_ids is None else set(port_params)
+                )
+                rows = merge_archived(
+                    rows,
+                    [
+                        location_rows[port_id] + (ts, tide_type, height)
+                        for port_id, ts, tide_type, height in archived
+                        if port_id in location_rows
+                    ],
+                    key=lambda row: (row[0], row[4]),
+                )
+        locations: Dict[str, TideLocation] = dict()
+        for port_id, region_name, name, area_id, ts, tide_type, height in rows:
+            location = locations.get(port_id)
+            if location is None:
+                location = locations[port_id] = TideLocation(
+                    region_name=region_name or "",
+                    name=name,
+                    area_id=AreaID(area_id),
+                    port_id=PortID(port_id),
+                )
+            yield location, Tide(
+                type=TIDE_TYPES[tide_type], utc_datetime=from_epoch(ts), height=height
+            )
+
+    def query_tides_columnar(
+        self,
+        port_ids: Optional[Sequence[PortID]],
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+    ) -> "TideColumns":
+        """uncached, see `TidalDatabase.query_tides_columnar`"""
+        from tidal.columnar import query_tides_columnar
+
+        with self.pool.connection() as con:
+            return query_tides_columnar(
+                con, self.table_name, port_ids, start_date, end_date, self.partitions
+            )
+
+    def close(self) -> None:
+        self.pool.close()
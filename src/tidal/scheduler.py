@@ -0,0 +1,352 @@
+import heapq
+import itertools
+import logging
+import math
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tidal.metrics import Metrics
+from tidal.schema import FETCH_HISTORY_TABLE_NAME
+from tidal.scraper import FetchResult, tides_digest
+from tidal.tide_dto import PortID, TideLocation
+
+logger = logging.getLogger(__name__)
+
+# weight of the latest observation in the smoothed latency and change rate
+_SMOOTHING = 0.3
+
+
+@dataclass
+class PortHistory:
+    port_id: PortID
+    # epoch seconds of the last successful fetch
+    fetched_at: Optional[float] = None
+    # seconds the last fetch took
+    latency: Optional[float] = None
+    # fetches in a row that failed
+    failures: int = 0
+    # smoothed fraction of fetches that found different tides
+    change_rate: Optional[float] = None
+    # of the tides last fetched, see `tides_digest`
+    digest: Optional[str] = None
+    # epoch seconds before which the port is skipped
+    not_before: Optional[float] = None
+
+
+class FetchHistory:
+    """`PortHistory` of every port fetched so far, kept in the tide database"""
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con = con
+
+    def load(self) -> Dict[PortID, PortHistory]:
+        rows = self.con.execute(
+            f"SELECT port_id, fetched_at, latency, failures, change_rate, digest, "
+            f"not_before FROM {FETCH_HISTORY_TABLE_NAME}"
+        )
+        return {row[0]: PortHistory(*row) for row in rows}
+
+    def save(self, histories: Iterable[PortHistory]) -> None:
+        with self.con:
+            self.con.executemany(
+                f"INSERT INTO {FETCH_HISTORY_TABLE_NAME} "
+                f"(port_id, fetched_at, latency, failures, change_rate, digest, not_before) "
+                f"VALUES (?,?,?,?,?,?,?) "
+                f"ON CONFLICT (port_id) DO UPDATE SET "
+                f"fetched_at = excluded.fetched_at, "
+                f"latency = excluded.latency, "
+                f"failures = excluded.failures, "
+                f"change_rate = excluded.change_rate, "
+                f"digest = excluded.digest, "
+                f"not_before = excluded.not_before",
+                (
+                    (
+                        h.port_id,
+                        None if h.fetched_at is None else int(h.fetched_at),
+                        h.latency,
+                        h.failures,
+                        h.change_rate,
+                        h.digest,
+                        None if h.not_before is None else int(h.not_before),
+                    )
+                    for h in histories
+                ),
+            )
+
+
+class AIMDLimiter:
+    """
+    how many fetches may be in flight, adjusted the way TCP adjusts its
+    congestion window. It starts at `initial` and doubles every round of
+    requests until the first sign of congestion (slow start), after which
+    it grows by one per round (additive increase). A 429, 5xx, network
+    error, or the smoothed latency going above `latency_tolerance` times
+    the lowest latency seen, multiplies it by `decrease` instead, at most
+    once per round trip since every request in flight then sees the same
+    congestion. Latencies under `latency_floor` seconds are never taken for
+    congestion, a fast host's jitter would be.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        initial: Optional[int] = None,
+        decrease: float = 0.5,
+        latency_tolerance: float = 4.0,
+        latency_floor: float = 0.1,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(initial if initial is not None else self.minimum)
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.latency_floor = latency_floor
+        self.slow_start = True
+        # lowest latency seen, drifting up slowly so it follows a server
+        # that got slower for good
+        self.baseline: Optional[float] = None
+        self.smoothed: Optional[float] = None
+        self._last_decrease = -math.inf
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.minimum, min(self.maximum, int(self.limit)))
+
+    def on_success(self, latency: float, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        if self.baseline is None:
+            self.baseline = self.smoothed = latency
+        else:
+            self.baseline = min(latency, self.baseline * 1.01)
+            self.smoothed += _SMOOTHING * (latency - self.smoothed)
+        if self.smoothed > self.latency_tolerance * max(self.baseline, self.latency_floor):
+            self._back_off(now)
+            return
+        self.limit += 1.0 if self.slow_start else 1.0 / self.limit
+        self.limit = min(self.limit, float(self.maximum))
+
+    def on_congestion(self, now: Optional[float] = None) -> None:
+        self._back_off(time.monotonic() if now is None else now)
+
+    def _back_off(self, now: float) -> None:
+        if now - self._last_decrease < (self.smoothed or 0.0):
+            return
+        self.slow_start = False
+        self.limit = max(float(self.minimum), self.limit * self.decrease)
+        self._last_decrease = now
+
+
+class SweepScheduler:
+    """
+    decides which port to fetch next during a sweep, and how many at once.
+
+    ports never fetched come first, then the most stale ones weighted by how
+    often their tides change, slowest first among equals so they don't
+    straggle at the end of the sweep; ports that failed last time come
+    last. Transient failures (see `FetchResult.transient`) go back in the
+    queue after `retry_delay` seconds, doubling, up to `max_attempts`
+    attempts. A port failing `max_failures` sweeps in a row is then left
+    out of sweeps for `defer_seconds`, doubling while it keeps failing, up
+    to `max_defer_seconds`.
+
+    when ports are spread over several hosts, `host_of` tells the host of a
+    port and `host_limiters` how many fetches each host takes at once: every
+    host then backs off on its own congestion only, while `limiter` caps
+    the fetches in flight over all hosts. Hosts without a limiter are only
+    capped by `limiter`.
+
+    callers loop on `next_location` / `wait_time` / `done` until `finished`,
+    and `save` the history at the end:
+
+        scheduler.plan(locations)
+        while not scheduler.finished:
+            location = scheduler.next_location()
+            ... start fetching it, or wait for a fetch in flight, at most
+            scheduler.wait_time(), and pass its result to scheduler.done()
+    """
+
+    def __init__(
+        self,
+        history: FetchHistory,
+        limiter: AIMDLimiter,
+        max_attempts: int = 3,
+        retry_delay: float = 2.0,
+        max_failures: int = 3,
+        defer_seconds: float = 3600.0,
+        max_defer_seconds: float = 86400.0,
+        metrics: Optional[Metrics] = None,
+        host_of: Optional[Callable[[TideLocation], str]] = None,
+        host_limiters: Optional[Dict[str, AIMDLimiter]] = None,
+    ):
+        self.history = history
+        self.limiter = limiter
+        self.host_of = host_of
+        self.host_limiters = host_limiters if host_limiters is not None else dict()
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+        self.defer_seconds = defer_seconds
+        self.max_defer_seconds = max_defer_seconds
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.histories = history.load()
+        self.in_flight = 0
+        self.host_in_flight: Dict[str, int] = dict()
+        # host -> (ready at, rank, location, attempt) in monotonic seconds
+        self._queues: Dict[str, List[Tuple[float, int, TideLocation, int]]] = dict()
+        self._attempts: Dict[PortID, int] = dict()
+        self._rank = itertools.count()
+        self._updated: Dict[PortID, PortHistory] = dict()
+
+    def priority(self, location: TideLocation, now: float) -> Tuple:
+        history = self.histories.get(location.port_id)
+        if history is None or history.fetched_at is None:
+            return (0, 0.0, 0.0)
+        staleness = max(now - history.fetched_at, 0.0)
+        # ports that never changed are still refreshed eventually
+        change_rate = 0.5 if history.change_rate is None else history.change_rate
+        score = staleness * (change_rate + 0.1)
+        return (1 + min(history.failures, 1), -score, -(history.latency or 0.0))
+
+    def plan(
+        self, locations: Sequence[TideLocation], include_deferred: bool = False
+    ) -> List[TideLocation]:
+        """
+        queues `locations` in priority order, returns those left out
+        because they are deferred.
+        """
+        now = time.time()
+        deferred = list()
+        to_fetch = list()
+        for location in locations:
+            history = self.histories.get(location.port_id)
+            if (
+                not include_deferred
+                and history is not None
+                and history.not_before is not None
+                and history.not_before > now
+            ):
+                deferred.append(location)
+            else:
+                to_fetch.append(location)
+        to_fetch.sort(key=lambda location: self.priority(location, now))
+        for location in to_fetch:
+            self._push(location, 0.0, attempt=1)
+        self.metrics.inc("scheduler_deferred_total", len(deferred))
+        return deferred
+
+    def _host(self, location: TideLocation) -> str:
+        return "" if self.host_of is None else self.host_of(location)
+
+    def _push(self, location: TideLocation, ready_at: float, attempt: int) -> None:
+        queue = self._queues.setdefault(self._host(location), list())
+        heapq.heappush(queue, (ready_at, next(self._rank), location, attempt))
+
+    def _next_queue(self) -> Optional[List[Tuple[float, int, TideLocation, int]]]:
+        """the queue of the host with room for a fetch whose head is due first"""
+        if self.in_flight >= self.limiter.concurrency:
+            return None
+        best = None
+        for host, queue in self._queues.items():
+            if not queue:
+                continue
+            limiter = self.host_limiters.get(host)
+            if limiter is not None and self.host_in_flight.get(host, 0) >= limiter.concurrency:
+                continue
+            if best is None or queue[0][:2] < best[0][:2]:
+                best = queue
+        return best
+
+    @property
+    def finished(self) -> bool:
+        return self.in_flight == 0 and not any(self._queues.values())
+
+    def next_location(self, now: Optional[float] = None) -> Optional[TideLocation]:
+        """the next port to fetch, None if none is due or enough are in flight"""
+        now = time.monotonic() if now is None else now
+        queue = self._next_queue()
+        if queue is None:
+            return None
+        ready_at, _, location, attempt = queue[0]
+        if ready_at > now:
+            return None
+        heapq.heappop(queue)
+        self._attempts[location.port_id] = attempt
+        self.in_flight += 1
+        host = self._host(location)
+        self.host_in_flight[host] = self.host_in_flight.get(host, 0) + 1
+        return location
+
+    def wait_time(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        seconds until a queued retry is due, None if there is nothing to
+        do but wait for a fetch in flight
+        """
+        queue = self._next_queue()
+        if queue is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(queue[0][0] - now, 0.0)
+
+    def done(self, result: FetchResult, now: Optional[float] = None) -> bool:
+        """
+        records the outcome of a fetch. Returns False if the port was queued
+        to be fetched again, True once its result is final.
+        """
+        now = time.monotonic() if now is None else now
+        self.in_flight -= 1
+        host = self._host(result.location)
+        self.host_in_flight[host] -= 1
+        limiter = self.host_limiters.get(host, self.limiter)
+        if result.records is not None:
+            limiter.on_success(result.latency, now)
+        elif result.transient:
+            limiter.on_congestion(now)
+        self.metrics.observe("scheduler_concurrency", self.limiter.concurrency)
+        if host in self.host_limiters:
+            self.metrics.observe("scheduler_host_concurrency", limiter.concurrency, host=host)
+
+        attempt = self._attempts.pop(result.location.port_id, 1)
+        if result.records is None and result.transient and attempt < self.max_attempts:
+            self.metrics.inc("scheduler_requeued_total")
+            self._push(
+                result.location, now + self.retry_delay * 2 ** (attempt - 1), attempt + 1
+            )
+            return False
+        self._update_history(result)
+        return True
+
+    def _update_history(self, result: FetchResult) -> None:
+        port_id = result.location.port_id
+        history = self.histories.get(port_id) or PortHistory(port_id)
+        now = time.time()
+        history.latency = result.latency
+        if result.records is None:
+            history.failures += 1
+            if history.failures >= self.max_failures:
+                defer = self.defer_seconds * 2 ** (history.failures - self.max_failures)
+                history.not_before = now + min(defer, self.max_defer_seconds)
+                logger.warning(
+                    f"port {port_id} failed {history.failures} times in a row, "
+                    f"skipped for {min(defer, self.max_defer_seconds) / 3600:.1f}h"
+                )
+        else:
+            # an empty list is a page that did not change since the last fetch
+            digest = tides_digest(result.records) if result.records else history.digest
+            changed = float(digest != history.digest)
+            if history.change_rate is None:
+                history.change_rate = changed
+            else:
+                history.change_rate += _SMOOTHING * (changed - history.change_rate)
+            history.digest = digest
+            history.fetched_at = now
+            history.failures = 0
+            history.not_before = None
+        self.histories[port_id] = history
+        self._updated[port_id] = history
+
+    def save(self) -> None:
+        self.history.save(self._updated.values())
+        self._updated = dict()
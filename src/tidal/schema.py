@@ -0,0 +1,300 @@
+import logging
+import sqlite3
+from typing import Callable, Dict, List
+
+from tidal.tide_dto import TideType
+
+logger = logging.getLogger(__name__)
+
+# version of the database layout, kept in `PRAGMA user_version`.
+#   1: one row per tide with location name, area_id and port_id as TEXT and
+#      an ISO `utc_datetime` (databases created before versioning report 0)
+#   2: separate `locations` table, tide rows keyed by (port_key, ts) with
+#      ts in epoch seconds in a WITHOUT ROWID table
+#   3: `db_meta` table with a `data_version` counter bumped by every write
+#   4: tide rows carry the `data_version` that last wrote them (`version`),
+#      and `notify.py` keeps its delivered alerts and high-water marks in
+#      notification tables
+#   5: `fetch_history` table, what the sweep scheduler learned about each port
+#   6: `sweeps` and `sweep_ports` tables, a journal of collection runs
+#   7: `tide_partitions` table, the monthly partitions of a tide table once
+#      partitioning is enabled (see `tidal.partition`)
+#   8: `<table>_daily` table, per port and UTC day aggregates of the tide
+#      table kept up to date by every write (see `tidal.stats`)
+SCHEMA_VERSION = 8
+
+LOCATION_TABLE_NAME = "locations"
+META_TABLE_NAME = "db_meta"
+LEDGER_TABLE_NAME = "notification_ledger"
+NOTIFY_STATE_TABLE_NAME = "notification_state"
+FETCH_HISTORY_TABLE_NAME = "fetch_history"
+SWEEP_TABLE_NAME = "sweeps"
+SWEEP_PORT_TABLE_NAME = "sweep_ports"
+PARTITION_TABLE_NAME = "tide_partitions"
+
+# integer codes of `TideType` in the tide tables
+TIDE_TYPE_LOW = 0
+TIDE_TYPE_HIGH = 1
+TIDE_TYPE_CODES = {TideType.LOW: TIDE_TYPE_LOW, TideType.HIGH: TIDE_TYPE_HIGH}
+TIDE_TYPES = {code: tide_type for tide_type, code in TIDE_TYPE_CODES.items()}
+
+
+def location_table_ddl() -> List[str]:
+    return [
+        f"CREATE TABLE IF NOT EXISTS {LOCATION_TABLE_NAME} ("
+        f"port_key INTEGER PRIMARY KEY,"
+        f"port_id TEXT NOT NULL UNIQUE,"
+        f"area_id TEXT NOT NULL,"
+        f"name TEXT NOT NULL,"
+        f"region_name TEXT )"
+    ]
+
+
+def meta_table_ddl() -> List[str]:
+    return [
+        f"CREATE TABLE IF NOT EXISTS {META_TABLE_NAME} ("
+        f"key TEXT PRIMARY KEY,"
+        f"value INTEGER NOT NULL ) WITHOUT ROWID",
+        f"INSERT INTO {META_TABLE_NAME} (key, value) VALUES ('data_version', 0) "
+        f"ON CONFLICT (key) DO NOTHING",
+    ]
+
+
+def tide_table_ddl(table_name: str) -> List[str]:
+    return [
+        f"CREATE TABLE IF NOT EXISTS {table_name} ("
+        f"port_key INTEGER NOT NULL REFERENCES {LOCATION_TABLE_NAME} (port_key),"
+        f"ts INTEGER NOT NULL,"
+        f"tide_type INTEGER NOT NULL,"
+        f"height REAL NOT NULL,"
+        f"version INTEGER NOT NULL DEFAULT 0,"
+        f"PRIMARY KEY (port_key, ts) ) WITHOUT ROWID",
+        tide_version_index_ddl(table_name),
+    ]
+
+
+def tide_version_index_ddl(table_name: str) -> str:
+    # finds the rows written since a given data_version
+    return f"CREATE INDEX IF NOT EXISTS {table_name}_version ON {table_name} (version)"
+
+
+def notification_table_ddl() -> List[str]:
+    return [
+        # alerts already delivered, so they are never sent twice
+        f"CREATE TABLE IF NOT EXISTS {LEDGER_TABLE_NAME} ("
+        f"port_id TEXT NOT NULL,"
+        f"ts INTEGER NOT NULL,"
+        f"rule TEXT NOT NULL,"
+        f"sent_at INTEGER NOT NULL,"
+        f"PRIMARY KEY (port_id, ts, rule) ) WITHOUT ROWID",
+        # per set of watched ports and rules: the data_version and the end of
+        # the time window covered by the last run
+        f"CREATE TABLE IF NOT EXISTS {NOTIFY_STATE_TABLE_NAME} ("
+        f"watch TEXT PRIMARY KEY,"
+        f"description TEXT NOT NULL,"
+        f"data_version INTEGER NOT NULL,"
+        f"window_end INTEGER NOT NULL ) WITHOUT ROWID",
+    ]
+
+
+def fetch_history_table_ddl() -> List[str]:
+    return [
+        # per port: when it was last fetched and how long that took, how many
+        # fetches in a row failed, how often its tides change and a digest of
+        # the last ones, and the time before which it is not fetched again
+        f"CREATE TABLE IF NOT EXISTS {FETCH_HISTORY_TABLE_NAME} ("
+        f"port_id TEXT PRIMARY KEY,"
+        f"fetched_at INTEGER,"
+        f"latency REAL,"
+        f"failures INTEGER NOT NULL DEFAULT 0,"
+        f"change_rate REAL,"
+        f"digest TEXT,"
+        f"not_before INTEGER ) WITHOUT ROWID"
+    ]
+
+
+def sweep_table_ddl() -> List[str]:
+    return [
+        f"CREATE TABLE IF NOT EXISTS {SWEEP_TABLE_NAME} ("
+        f"sweep_id INTEGER PRIMARY KEY,"
+        f"started_at INTEGER NOT NULL,"
+        f"finished_at INTEGER )",
+        # status of every port of a sweep, see `tidal.journal`
+        f"CREATE TABLE IF NOT EXISTS {SWEEP_PORT_TABLE_NAME} ("
+        f"sweep_id INTEGER NOT NULL REFERENCES {SWEEP_TABLE_NAME} (sweep_id),"
+        f"port_id TEXT NOT NULL,"
+        f"status TEXT NOT NULL,"
+        f"updated_at INTEGER NOT NULL,"
+        f"PRIMARY KEY (sweep_id, port_id) ) WITHOUT ROWID",
+    ]
+
+
+def partition_table_ddl() -> List[str]:
+    return [
+        # per tide table and month (YYYYMM): the table holding its tides,
+        # and/or the archive file they were compacted into
+        f"CREATE TABLE IF NOT EXISTS {PARTITION_TABLE_NAME} ("
+        f"base_table TEXT NOT NULL,"
+        f"month INTEGER NOT NULL,"
+        f"table_name TEXT,"
+        f"archive TEXT,"
+        f"archived_rows INTEGER,"
+        f"PRIMARY KEY (base_table, month) ) WITHOUT ROWID"
+    ]
+
+
+def daily_stats_table_name(table_name: str) -> str:
+    return f"{table_name}_daily"
+
+
+def daily_stats_table_ddl(table_name: str) -> List[str]:
+    daily_table = daily_stats_table_name(table_name)
+    return [
+        # per port and UTC day (days since the epoch): the lowest low and
+        # highest high tide, their difference, its percentile rank among the
+        # days around it and the spring/neap phase that follows from it
+        f"CREATE TABLE IF NOT EXISTS {daily_table} ("
+        f"port_key INTEGER NOT NULL REFERENCES {LOCATION_TABLE_NAME} (port_key),"
+        f"day INTEGER NOT NULL,"
+        f"num_tides INTEGER NOT NULL,"
+        f"min_low REAL,"
+        f"max_high REAL,"
+        f"tidal_range REAL,"
+        f"range_rank REAL,"
+        f"phase TEXT,"
+        f"PRIMARY KEY (port_key, day) ) WITHOUT ROWID",
+        # threshold queries over all ports for a few days
+        f"CREATE INDEX IF NOT EXISTS {daily_table}_day ON {daily_table} (day)",
+    ]
+
+
+def table_exists(con: sqlite3.Connection, table_name: str) -> bool:
+    row = con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table_name,),
+    ).fetchone()
+    return row is not None
+
+
+def schema_version(con: sqlite3.Connection, table_name: str) -> int:
+    """
+    returns the layout version of the database, 0 for an empty database.
+    a database holding `table_name` but no version is a v1 database.
+    """
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and table_exists(con, table_name):
+        return 1
+    return version
+
+
+def _migrate_v1_to_v2(con: sqlite3.Connection, table_name: str) -> None:
+    v1_table = f"{table_name}_v1"
+    con.execute(f"ALTER TABLE {table_name} RENAME TO {v1_table}")
+    for sql in location_table_ddl() + tide_table_ddl(table_name):
+        con.execute(sql)
+    con.execute(
+        f"INSERT INTO {LOCATION_TABLE_NAME} (port_id, area_id, name) "
+        f"SELECT port_id, MAX(area_id), MAX(location) FROM {v1_table} "
+        f"WHERE port_id IS NOT NULL GROUP BY port_id ORDER BY port_id "
+        f"ON CONFLICT (port_id) DO NOTHING"
+    )
+    con.execute(
+        f"INSERT INTO {table_name} (port_key, ts, tide_type, height) "
+        f"SELECT l.port_key, CAST(strftime('%s', v.utc_datetime) AS INTEGER), "
+        f"CASE v.tide_type WHEN 'High' THEN {TIDE_TYPE_HIGH} ELSE {TIDE_TYPE_LOW} END, "
+        f"v.height "
+        f"FROM {v1_table} v JOIN {LOCATION_TABLE_NAME} l ON l.port_id = v.port_id "
+        f"WHERE v.utc_datetime IS NOT NULL "
+        f"ORDER BY l.port_key, 2 "
+        f"ON CONFLICT (port_key, ts) DO NOTHING"
+    )
+    con.execute(f"DROP TABLE {v1_table}")
+
+
+def _migrate_v2_to_v3(con: sqlite3.Connection, table_name: str) -> None:
+    for sql in meta_table_ddl():
+        con.execute(sql)
+
+
+def _migrate_v3_to_v4(con: sqlite3.Connection, table_name: str) -> None:
+    columns = [row[1] for row in con.execute(f"PRAGMA table_info({table_name})")]
+    # a table created by the v1 -> v2 step already has the column
+    if "version" not in columns:
+        con.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+        )
+    con.execute(tide_version_index_ddl(table_name))
+    for sql in notification_table_ddl():
+        con.execute(sql)
+
+
+def _migrate_v4_to_v5(con: sqlite3.Connection, table_name: str) -> None:
+    for sql in fetch_history_table_ddl():
+        con.execute(sql)
+
+
+def _migrate_v5_to_v6(con: sqlite3.Connection, table_name: str) -> None:
+    for sql in sweep_table_ddl():
+        con.execute(sql)
+
+
+def _migrate_v6_to_v7(con: sqlite3.Connection, table_name: str) -> None:
+    for sql in partition_table_ddl():
+        con.execute(sql)
+
+
+def _migrate_v7_to_v8(con: sqlite3.Connection, table_name: str) -> None:
+    from tidal.partition import PartitionCatalog
+    from tidal.stats import DailyStats
+
+    for sql in daily_stats_table_ddl(table_name):
+        con.execute(sql)
+    num_days = DailyStats(table_name).rebuild(con, PartitionCatalog(table_name))
+    logger.info(f"daily statistics of {num_days} days computed")
+
+
+# MIGRATIONS[n] upgrades a database from version n - 1 to n
+MIGRATIONS: Dict[int, Callable[[sqlite3.Connection, str], None]] = {
+    2: _migrate_v1_to_v2,
+    3: _migrate_v2_to_v3,
+    4: _migrate_v3_to_v4,
+    5: _migrate_v4_to_v5,
+    6: _migrate_v5_to_v6,
+    7: _migrate_v6_to_v7,
+    8: _migrate_v7_to_v8,
+}
+
+
+def migrate(con: sqlite3.Connection, table_name: str, target: int = SCHEMA_VERSION) -> int:
+    """
+    upgrades the database in place, one transaction per version step.
+    returns the version the database ends up at.
+    """
+    version = schema_version(con, table_name)
+    if version == 0:
+        raise ValueError(f'Table "{table_name}" not found, nothing to migrate')
+    if version > target:
+        raise ValueError(
+            f"Database is at version {version}, newer than target version {target}"
+        )
+
+    isolation_level = con.isolation_level
+    con.commit()
+    # manage the transactions explicitly, so DDL and data move together
+    con.isolation_level = None
+    try:
+        while version < target:
+            next_version = version + 1
+            logger.info(f"Migrating database from version {version} to {next_version}")
+            con.execute("BEGIN")
+            try:
+                MIGRATIONS[next_version](con, table_name)
+                con.execute(f"PRAGMA user_version = {next_version}")
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            version = next_version
+    finally:
+        con.isolation_level = isolation_level
+    return version
@@ -1,123 +1,261 @@
-import datetime as dt
+import hashlib
 import http
 import logging
-import random
-import re
+import time
 import urllib
 import urllib.request
-from typing import Iterable, List, NewType, Optional, Tuple
+from typing import (Dict, Iterable, List, NamedTuple, NewType, Optional,
+                    Sequence)
 
-from bs4 import BeautifulSoup
-from tenacity import retry, stop_after_attempt, wait_exponential
-
-from tidal.constant import USER_AGENT_LIST
-from tidal.tide_dto import DailyTideRecord, Tide, TideLocation, TideType
+from tidal.cache import CacheEntry, ResponseCache
+from tidal.metrics import Metrics
+from tidal.providers import TideProvider, provider_name_of
+from tidal.providers.bbc import BBCProvider
+from tidal.tide_dto import DailyTideRecord, PortID, TideLocation
 
 logger = logging.getLogger(__name__)
 
 URL = NewType("URL", str)
 
 
-class BBCTideScraper:
-    def __init__(self, url: URL):
-        self.url = url
+class PageResponse(NamedTuple):
+    status: int
+    body: bytes
+    charset: str
+    etag: Optional[str]
+    last_modified: Optional[str]
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=2, min=2, max=32),
-    )
-    def download_tidal_info(
-        self, location: TideLocation
-    ) -> Tuple[TideLocation, Optional[Iterable[DailyTideRecord]]]:
-        target_url = self.url + location.area_id + "/" + location.port_id
-        try:
-            req = urllib.request.Request(
-                target_url,
-                data=None,
-                headers={
-                    "Content-Type": "application/json; charset=utf-8",
-                    "User-Agent": f"{random.choice(USER_AGENT_LIST)}",
-                },
+
+class FetchResult(NamedTuple):
+    location: TideLocation
+    # None if the fetch failed, empty if the page did not change
+    records: Optional[List[DailyTideRecord]]
+    # HTTP status, None if no response came back
+    status: Optional[int]
+    # seconds until the page, or the error, came back
+    latency: float
+    # worth trying again later: network errors, 429 and 5xx
+    transient: bool = False
+
+
+def is_transient_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def tides_digest(records: Iterable[DailyTideRecord]) -> str:
+    sha1 = hashlib.sha1()
+    for record in records:
+        for tide in record.tides:
+            sha1.update(f"{tide.utc_datetime:%Y%m%d%H%M}{tide.type.value}{tide.height};".encode())
+    return sha1.hexdigest()
+
+
+class TideScraper:
+    """
+    downloads and parses tide tables of the `providers` given, each
+    location from the provider its port_id belongs to (see
+    `tidal.providers`).
+
+    with a `ResponseCache` requests are conditional, and a location whose
+    page is not modified (304, or the same body as last time) yields an
+    empty list of records instead of being parsed again. Failures, and pages
+    without a single tide, yield None.
+    A cached page only counts if its tides are known to be in the database:
+    `stored_digests` has the `tides_digest` of each port's stored tides (see
+    `tidal.scheduler.FetchHistory`), and a cache entry of other tides, e.g.
+    cached before a crash or for a database since deleted, is ignored.
+
+    fetch, parse and cache timings, bytes, outcomes and failures are
+    recorded in `metrics`.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[TideProvider],
+        cache: Optional[ResponseCache] = None,
+        metrics: Optional[Metrics] = None,
+        stored_digests: Optional[Dict[PortID, str]] = None,
+    ):
+        self.providers = {provider.name: provider for provider in providers}
+        self.cache = cache
+        self.stored_digests = stored_digests if stored_digests is not None else dict()
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    def provider(self, location: TideLocation) -> TideProvider:
+        name = provider_name_of(location.port_id)
+        provider = self.providers.get(name)
+        if provider is None:
+            raise ValueError(f"{location} is a {name} port, but {name} is not being scraped")
+        return provider
+
+    def location_url(self, location: TideLocation) -> URL:
+        return URL(self.provider(location).location_url(location))
+
+    def request_headers(self, location: TideLocation) -> Dict[str, str]:
+        return self.provider(location).request_headers()
+
+    def cached_entry(self, location: TideLocation) -> Optional[CacheEntry]:
+        if self.cache is None:
+            return None
+        entry = self.cache.get(location.area_id, location.port_id)
+        if entry is None:
+            return None
+        stored = self.stored_digests.get(location.port_id)
+        if entry.digest is None or entry.digest != stored:
+            # the database may not have these tides, fetch and store them again
+            self.metrics.inc("cache_unconfirmed_total")
+            return None
+        return entry
+
+    def handle_response(
+        self,
+        location: TideLocation,
+        response: PageResponse,
+        cached: Optional[CacheEntry],
+    ) -> List[DailyTideRecord]:
+        self.metrics.inc("fetch_total", status=response.status)
+        self.metrics.inc("fetch_bytes_total", len(response.body))
+        if response.status == 304 and cached is not None:
+            logging.debug(f"{location} not modified")
+            self.cache.touch(location.area_id, location.port_id, cached)
+            self.metrics.inc("pages_total", result="not_modified")
+            return list()
+        if self.cache is None:
+            return self.parse_tidal_info(
+                response.body.decode(response.charset, errors="replace"), location
             )
-            html = urllib.request.urlopen(req)
-            soup = BeautifulSoup(html, features="html.parser")
-            table_tag = "table.wr-c-tide-extremes"
-            tables = soup.select(table_tag)
-
-            if len(tables) == 0:
-                raise ValueError(
-                    f"Unable to parse bbc tide table {table_tag},"
-                    f"please check if {self.url} layout changed."
+
+        body_hash = ResponseCache.hash_body(response.body)
+        if cached is not None and cached.body_hash == body_hash:
+            logging.debug(f"{location} unchanged since last fetch")
+            self.cache.touch(location.area_id, location.port_id, cached)
+            self.metrics.inc("pages_total", result="unchanged")
+            return list()
+        records = self.parse_tidal_info(
+            response.body.decode(response.charset, errors="replace"), location
+        )
+        # only cache pages that parsed, so a bad page is fetched again
+        with self.metrics.stage("cache"):
+            self.cache.put(
+                location.area_id,
+                location.port_id,
+                response.body,
+                etag=response.etag,
+                last_modified=response.last_modified,
+                body_hash=body_hash,
+                digest=tides_digest(records),
+            )
+        return records
+
+    def parse_tidal_info(
+        self, html: str, location: TideLocation
+    ) -> List[DailyTideRecord]:
+        with self.metrics.stage("parse"):
+            records = self.provider(location).parse(html, location, self.metrics)
+        num_tides = sum(len(r.tides) for r in records)
+        if num_tides == 0:
+            # a failure, not an unchanged page, on either engine
+            raise ValueError(f"No tides found in the page of {location}")
+        self.metrics.inc("pages_total", result="parsed")
+        self.metrics.inc("tides_parsed_total", num_tides)
+        return records
+
+    def fetch(self, target_url: URL, headers: Dict[str, str]) -> PageResponse:
+        req = urllib.request.Request(target_url, data=None, headers=headers)
+        try:
+            with urllib.request.urlopen(req) as response:
+                return PageResponse(
+                    status=response.status,
+                    body=response.read(),
+                    charset=response.headers.get_content_charset() or "utf-8",
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
                 )
+        except urllib.error.HTTPError as he:
+            if he.code != 304:
+                raise
+            return PageResponse(
+                status=he.code,
+                body=b"",
+                charset="utf-8",
+                etag=he.headers.get("ETag"),
+                last_modified=he.headers.get("Last-Modified"),
+            )
 
-            logging.info(f"{len(tables)} days predictions found for {location}")
-
-            # TODO: using system's date may cause problem due to time zones?
-            today = dt.datetime.utcnow()
-            multiday_records: List[DailyTideRecord] = list()
-
-            # each table contains tide prediction for 1 day starting 'today'
-            for day_offset, table in enumerate(tables):
-                row_text = table.select_one("caption").text
-                logging.debug(f"{row_text}")
-
-                types = [
-                    [td.text for td in row.find_all("th")] for row in table.select("tr")
-                ]
-                data = [
-                    [td.text for td in row.find_all("td")]
-                    for row in table.select("tr")[1:]
-                ]
-                _, time, height = types.pop(0)
-                high_low = [x[0] for x in types]
-                logging.debug(f"{len(high_low)} {row_text}")
-                # convert BST to UTC
-                time_offset = 1 if "BST" in time else 0
-                tides = list()
-                for tide_type, (time_str, height) in zip(high_low, data):
-                    # Handle BST/GMT time conversion
-                    current_time_offset = time_offset
-                    clean_time_str = time_str.strip()
-                    
-                    if "BST" in clean_time_str:
-                        current_time_offset = 1
-                        clean_time_str = re.sub(r".*(\d\d:\d\d).+", r"\g<1>", clean_time_str)
-                    elif "GMT" in clean_time_str:
-                        current_time_offset = 0
-                        clean_time_str = re.sub(r".*(\d\d:\d\d).+", r"\g<1>", clean_time_str)
-                    
-                    try:
-                        tide_time = dt.datetime.strptime(clean_time_str, "%H:%M").time()
-                        new_datetime = dt.datetime.combine(
-                            today + dt.timedelta(days=day_offset), tide_time
-                        ) - dt.timedelta(hours=current_time_offset)
-                        tide = Tide(
-                            TideType(tide_type),
-                            utc_datetime=new_datetime,
-                            height=float(height),
-                        )
-                        tides.append(tide)
-                    except ValueError as e:
-                        logging.error(f"Failed to parse time: {clean_time_str}, error: {str(e)}")
-                        continue
-
-                multiday_records.append(DailyTideRecord(location=location, tides=tides))
-
-            return location, multiday_records
+    def fetch_location(self, location: TideLocation) -> FetchResult:
+        """
+        one attempt at a location's tides, errors are logged and returned.
+        Transient ones are retried by the sweep, see `tidal.scheduler`.
+        """
+        target_url = self.location_url(location)
+        started = time.perf_counter()
+        status = None
+        try:
+            cached = self.cached_entry(location)
+            headers = self.request_headers(location)
+            headers.update(ResponseCache.conditional_headers(cached))
+            with self.metrics.stage("fetch"):
+                response = self.fetch(target_url, headers)
+            status = response.status
+            latency = time.perf_counter() - started
+            records = self.handle_response(location, response, cached)
+            return FetchResult(location, records, status, latency)
 
         except urllib.error.HTTPError as he:
+            self.metrics.inc("failures_total", error=f"HTTPError {he.code}")
             logging.error(
                 f"HTTP error {he.code} for {target_url}, please check if the area/port id is correct"
             )
-            return location, None
+            return FetchResult(
+                location,
+                None,
+                he.code,
+                time.perf_counter() - started,
+                transient=is_transient_status(he.code),
+            )
         except http.client.IncompleteRead as ine:
+            self.metrics.inc("failures_total", error=type(ine).__name__)
             logging.error(f"Incomplete read error: {str(ine)}")
-            return location, None
+            return FetchResult(
+                location, None, status, time.perf_counter() - started, transient=True
+            )
         except ValueError as ve:
+            self.metrics.inc("failures_total", error=type(ve).__name__)
             logging.error(f"Value error: {str(ve)}")
-            return location, None
+            return FetchResult(location, None, status, time.perf_counter() - started)
         except Exception as e:
+            self.metrics.inc("failures_total", error=type(e).__name__)
             logging.error(f"Unexpected error: {str(e)}")
-            return location, None
+            # URLError, timeouts and dropped connections are all OSErrors
+            return FetchResult(
+                location,
+                None,
+                status,
+                time.perf_counter() - started,
+                transient=isinstance(e, OSError),
+            )
+
+
+class BBCTideScraper(TideScraper):
+    """`TideScraper` of the BBC tide tables only"""
+
+    def __init__(
+        self,
+        url: URL,
+        parser: str = "fast",
+        cache: Optional[ResponseCache] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+        super().__init__([BBCProvider(url, parser=parser)], cache=cache, metrics=metrics)
+        self.url = url
+        self.parser = parser
+
+
+def __getattr__(name: str):
+    # the asyncio scrapers live in their own module so that importing this
+    # one does not pull in aiohttp
+    if name in ("AsyncTideScraper", "AsyncBBCTideScraper"):
+        import tidal.async_scraper
 
-   
\ No newline at end of file
+        return getattr(tidal.async_scraper, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,399 @@
+import bisect
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from tidal.metrics import Metrics
+from tidal.reader import TidalReader
+from tidal.tide_dto import PortID, Tide, TideLocation, TideType
+from tidal.utils.epoch import to_epoch
+
+try:
+    import orjson
+except ImportError:  # optional, see setup.py extras
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+# how far ahead `next_tides` looks when the hot window does not have enough
+NEXT_LOOKAHEAD = datetime.timedelta(days=31)
+
+
+def _dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def tide_json(tide: Tide) -> dict:
+    return {
+        "type": tide.type.value,
+        "utc_datetime": tide.utc_datetime.isoformat(),
+        "height": tide.height,
+    }
+
+
+def location_json(location: TideLocation) -> dict:
+    return {
+        "region_name": location.region_name,
+        "name": location.name,
+        "area_id": location.area_id,
+        "port_id": location.port_id,
+    }
+
+
+class _HotWindow(NamedTuple):
+    version: int
+    start_ts: int
+    end_ts: int
+    # epoch seconds when it was built
+    built_at: float
+    locations: Dict[PortID, dict]
+    # per port, the epoch seconds of its tides, and the tides as JSON
+    ts: Dict[PortID, List[int]]
+    tides: Dict[PortID, List[dict]]
+
+
+class TideService:
+    """
+    the queries of the HTTP service, on top of a `TidalReader`.
+
+    the tides of every port from a day ago to `hot_days` ahead are held in
+    memory, ready to be encoded, so the common lookups never touch SQLite.
+    The first request to notice that the database's data_version moved
+    (checked at most every `refresh_interval` seconds), or that an hour
+    has passed, rebuilds the window while the others are served from the
+    previous one. Anything outside the window goes to the reader and its
+    LRU cache.
+    """
+
+    def __init__(
+        self,
+        reader: TidalReader,
+        hot_days: int = 7,
+        refresh_interval: float = 1.0,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.reader = reader
+        self.hot_days = hot_days
+        self.refresh_interval = refresh_interval
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._hot: Optional[_HotWindow] = None
+        self._checked_at = -float("inf")
+        self._rebuild_lock = threading.Lock()
+
+    def hot_window(self) -> _HotWindow:
+        hot = self._hot
+        now = time.monotonic()
+        if hot is not None and now - self._checked_at < self.refresh_interval:
+            return hot
+        # one thread checks and rebuilds, the others keep the current window
+        if not self._rebuild_lock.acquire(blocking=hot is None):
+            return hot
+        try:
+            hot = self._hot
+            if hot is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+                version = self.reader.data_version()
+                if hot is None or hot.version != version or time.time() - hot.built_at > 3600:
+                    with self.metrics.timer("hot_window_build_seconds"):
+                        hot = self._hot = self._build(version)
+                self._checked_at = time.monotonic()
+            return hot
+        finally:
+            self._rebuild_lock.release()
+
+    def _build(self, version: int) -> _HotWindow:
+        today = _today()
+        start = today - datetime.timedelta(days=1)
+        end = today + datetime.timedelta(days=self.hot_days + 1)
+        locations: Dict[PortID, dict] = dict()
+        ts: Dict[PortID, List[int]] = dict()
+        tides: Dict[PortID, List[dict]] = dict()
+        for location, tide in self.reader.query_tides_by_location(None, start, end):
+            port_id = location.port_id
+            if port_id not in locations:
+                locations[port_id] = location_json(location)
+                ts[port_id] = list()
+                tides[port_id] = list()
+            ts[port_id].append(to_epoch(tide.utc_datetime))
+            tides[port_id].append(tide_json(tide))
+        logger.info(
+            f"hot window {start:%Y-%m-%d} to {end:%Y-%m-%d} loaded, "
+            f"{sum(map(len, ts.values()))} tides of {len(ts)} ports, data_version {version}"
+        )
+        return _HotWindow(
+            version, to_epoch(start), to_epoch(end), time.time(), locations, ts, tides
+        )
+
+    def data_version(self) -> int:
+        return self.hot_window().version
+
+    def location(self, port_id: PortID) -> dict:
+        """raises KeyError for an unknown port"""
+        location = self.hot_window().locations.get(port_id)
+        if location is not None:
+            return location
+        try:
+            return location_json(self.reader.get_location_by_port_id(port_id))
+        except ValueError:
+            raise KeyError(port_id)
+
+    def tides(
+        self, port_id: PortID, start_date: datetime.datetime, end_date: datetime.datetime
+    ) -> List[dict]:
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        hot = self.hot_window()
+        if hot.start_ts <= start_ts and end_ts <= hot.end_ts:
+            self.metrics.inc("hot_window_total", result="hit")
+            port_ts = hot.ts.get(port_id)
+            if port_ts is None:
+                return []
+            first = bisect.bisect_left(port_ts, start_ts)
+            last = bisect.bisect_right(port_ts, end_ts)
+            return hot.tides[port_id][first:last]
+        self.metrics.inc("hot_window_total", result="miss")
+        return [tide_json(tide) for tide in self.reader.query_tide(port_id, start_date, end_date)]
+
+    def batch(
+        self,
+        port_ids: Sequence[PortID],
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+    ) -> Dict[PortID, List[dict]]:
+        return {port_id: self.tides(port_id, start_date, end_date) for port_id in port_ids}
+
+    def next_tides(
+        self,
+        port_id: PortID,
+        after: datetime.datetime,
+        tide_type: Optional[TideType] = None,
+        count: int = 1,
+    ) -> List[dict]:
+        """the first `count` tides, of `tide_type` if given, strictly after `after`"""
+        after_ts = to_epoch(after)
+        hot = self.hot_window()
+        found: List[dict] = list()
+        if hot.start_ts <= after_ts < hot.end_ts:
+            port_ts = hot.ts.get(port_id, [])
+            first = bisect.bisect_right(port_ts, after_ts)
+            port_tides = hot.tides.get(port_id, [])
+            found = [
+                tide
+                for tide in port_tides[first:]
+                if tide_type is None or tide["type"] == tide_type.value
+            ][:count]
+        if len(found) < count:
+            tides = self.tides(
+                port_id, after + datetime.timedelta(seconds=1), after + NEXT_LOOKAHEAD
+            )
+            found = [
+                tide for tide in tides if tide_type is None or tide["type"] == tide_type.value
+            ][:count]
+        return found
+
+
+def _parse_datetime(value: str) -> datetime.datetime:
+    """ISO date or datetime, as naive UTC"""
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class _Request(NamedTuple):
+    params: Dict[str, List[str]]
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.params.get(name)
+        return values[-1] if values else default
+
+    def datetime(self, name: str, default: datetime.datetime) -> datetime.datetime:
+        value = self.get(name)
+        if value is None:
+            return default
+        try:
+            return _parse_datetime(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an ISO date or datetime, not {value!r}")
+
+
+def _today() -> datetime.datetime:
+    return datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _window(request: _Request) -> Tuple[datetime.datetime, datetime.datetime]:
+    start = request.datetime("start", _today())
+    end = request.datetime("end", start + datetime.timedelta(days=1))
+    if end < start:
+        raise ValueError("end must not be before start")
+    return start, end
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    GET /locations/<port_id>
+    GET /tides/<port_id>?start=&end=           (ISO, default today UTC)
+    GET /tides?port_id=..&port_id=..&start=&end=
+    GET /next/<port_id>?type=low|high&after=&count=
+    GET /health, GET /metrics
+
+    every JSON response has an ETag, and is gzipped when asked for.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, Nagle would hold the body
+    # back until the client's delayed ACK
+    disable_nagle_algorithm = True
+    server: "TideServer"
+
+    routes = [
+        ("location", re.compile(r"/locations/([^/]+)")),
+        ("tides", re.compile(r"/tides/([^/]+)")),
+        ("batch", re.compile(r"/tides")),
+        ("next", re.compile(r"/next/([^/]+)")),
+        ("health", re.compile(r"/health")),
+        ("metrics", re.compile(r"/metrics")),
+    ]
+
+    def do_GET(self) -> None:
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        request = _Request(parse_qs(url.query))
+        route = "unknown"
+        try:
+            for route, pattern in self.routes:
+                match = pattern.fullmatch(url.path)
+                if match is not None:
+                    port_id = PortID(match.group(1)) if match.groups() else None
+                    status = self._dispatch(route, port_id, request)
+                    break
+            else:
+                route = "unknown"
+                status = self._send_error(HTTPStatus.NOT_FOUND, f"no such path {url.path}")
+        except KeyError as e:
+            status = self._send_error(HTTPStatus.NOT_FOUND, f"unknown port_id {e.args[0]}")
+        except ValueError as e:
+            status = self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        except Exception as e:
+            logger.exception(f"Failed to serve {self.path}")
+            status = self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+        metrics = self.server.service.metrics
+        metrics.inc("http_requests_total", route=route, status=status)
+        metrics.observe("http_request_seconds", time.perf_counter() - start, route=route)
+
+    def _dispatch(self, route: str, port_id: Optional[PortID], request: _Request) -> int:
+        service = self.server.service
+        if route == "location":
+            return self._send_json(service.location(port_id))
+        if route == "tides":
+            service.location(port_id)
+            start, end = _window(request)
+            return self._send_json(service.tides(port_id, start, end))
+        if route == "batch":
+            port_ids = [
+                PortID(port_id)
+                for value in request.params.get("port_id", [])
+                for port_id in value.split(",")
+            ]
+            if not port_ids:
+                raise ValueError("at least one port_id is required")
+            if len(port_ids) > self.server.max_batch:
+                raise ValueError(f"at most {self.server.max_batch} port_ids per request")
+            start, end = _window(request)
+            return self._send_json(service.batch(port_ids, start, end))
+        if route == "next":
+            service.location(port_id)
+            tide_type = request.get("type")
+            if tide_type is not None:
+                try:
+                    tide_type = TideType(tide_type.capitalize())
+                except ValueError:
+                    raise ValueError(f"type must be low or high, not {tide_type!r}")
+            count = int(request.get("count", "1"))
+            if not 1 <= count <= 100:
+                raise ValueError("count must be between 1 and 100")
+            after = request.datetime("after", datetime.datetime.utcnow())
+            return self._send_json(service.next_tides(port_id, after, tide_type, count))
+        if route == "health":
+            return self._send_json({"status": "ok", "data_version": service.data_version()})
+        # metrics
+        body = service.metrics.prometheus().encode("utf-8")
+        return self._send(HTTPStatus.OK, body, "text/plain; version=0.0.4")
+
+    def _send_json(self, data) -> int:
+        return self._send(HTTPStatus.OK, _dumps(data), "application/json", etag=True)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> int:
+        return self._send(status, _dumps({"error": message}), "application/json")
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str, etag: bool = False) -> int:
+        headers = [("Content-Type", content_type)]
+        if etag:
+            tag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+            headers.append(("ETag", tag))
+            headers.append(("Cache-Control", "no-cache"))
+            if tag in (self.headers.get("If-None-Match") or ""):
+                status, body = HTTPStatus.NOT_MODIFIED, b""
+            elif len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get(
+                "Accept-Encoding", ""
+            ):
+                body = self.server.gzipped(tag, body)
+                headers.append(("Content-Encoding", "gzip"))
+            headers.append(("Vary", "Accept-Encoding"))
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return status.value
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class TideServer(ThreadingHTTPServer):
+    """a thread per connection, each kept alive across requests"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        service: TideService,
+        max_batch: int = 100,
+        gzip_cache_size: int = 1024,
+    ):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.max_batch = max_batch
+        self.gzip_cache_size = gzip_cache_size
+        # ETag -> gzipped body, a response is compressed once
+        self._gzip_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._gzip_lock = threading.Lock()
+
+    def gzipped(self, etag: str, body: bytes) -> bytes:
+        with self._gzip_lock:
+            compressed = self._gzip_cache.get(etag)
+            if compressed is not None:
+                self._gzip_cache.move_to_end(etag)
+                return compressed
+        compressed = gzip.compress(body, compresslevel=5, mtime=0)
+        with self._gzip_lock:
+            self._gzip_cache[etag] = compressed
+            while len(self._gzip_cache) > self.gzip_cache_size:
+                self._gzip_cache.popitem(last=False)
+        return compressed
@@ -0,0 +1,376 @@
+import datetime
+import sqlite3
+from bisect import bisect_left, bisect_right
+from typing import (Dict, Iterable, Iterator, List, NamedTuple, Optional,
+                    Sequence, Tuple)
+
+from tidal.partition import PartitionCatalog, merge_archived, tide_rows_sql
+from tidal.schema import (LOCATION_TABLE_NAME, TIDE_TYPE_HIGH, TIDE_TYPE_LOW,
+                          daily_stats_table_name)
+from tidal.tide_dto import PortID, TidePhase
+from tidal.utils.epoch import EPOCH, to_epoch
+
+SECONDS_PER_DAY = 86400
+# the end of any time range worth asking for
+_END_OF_TIME = to_epoch(datetime.datetime(9999, 1, 1))
+
+# the range between high and low water swings from spring to neap and back
+# about every 14.8 days. A day's range is ranked among those of the days up
+# to RANK_WINDOW_DAYS either side of it; the top of that window is spring,
+# the bottom neap. The last days stored rank among fewer days, their phase
+# settles as the days after them are collected.
+RANK_WINDOW_DAYS = 7
+SPRING_RANK = 0.8
+NEAP_RANK = 0.2
+# fewer days with a range than this around a day leave it unranked
+MIN_RANKED_DAYS = 8
+
+# column and order of each way to pick the best day
+BEST_BY = {
+    "lowest-low": ("min_low", "ASC"),
+    "highest-high": ("max_high", "DESC"),
+    "range": ("tidal_range", "DESC"),
+}
+
+_COLUMNS = "l.port_id, d.day, d.num_tides, d.min_low, d.max_high, d.tidal_range, d.range_rank, d.phase"
+
+
+class DayStats(NamedTuple):
+    port_id: PortID
+    day: datetime.date
+    num_tides: int
+    # None if the day had no low (high) tide
+    min_low: Optional[float]
+    max_high: Optional[float]
+    tidal_range: Optional[float]
+    # 0 for the smallest range around the day, 1 for the largest
+    range_rank: Optional[float]
+    phase: Optional[TidePhase]
+
+
+def day_number(day: datetime.date) -> int:
+    return (day - EPOCH.date()).days
+
+
+def from_day_number(day: int) -> datetime.date:
+    return EPOCH.date() + datetime.timedelta(days=day)
+
+
+def rank_days(
+    days: Sequence[int], ranges: Sequence[float], first: int, last: int
+) -> Iterator[Tuple[int, Optional[float], Optional[str]]]:
+    """
+    (day, range_rank, phase) of the days from first to last, given the
+    sorted `days` with a range and their `ranges`
+    """
+    for i in range(bisect_left(days, first), bisect_right(days, last)):
+        lo = bisect_left(days, days[i] - RANK_WINDOW_DAYS)
+        hi = bisect_right(days, days[i] + RANK_WINDOW_DAYS)
+        if hi - lo < MIN_RANKED_DAYS:
+            yield days[i], None, None
+            continue
+        rank = sum(map(ranges[i].__gt__, ranges[lo:hi])) / (hi - lo - 1)
+        phase = None
+        if rank >= SPRING_RANK:
+            phase = TidePhase.SPRING.value
+        elif rank <= NEAP_RANK:
+            phase = TidePhase.NEAP.value
+        yield days[i], rank, phase
+
+
+class DailyStats:
+    """
+    per port and UTC day aggregates of a tide table, kept in `<table>_daily`.
+    `update` runs in the transaction of every write and recomputes only the
+    days it touched, so threshold and best-day queries read one row per day
+    instead of every tide.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.daily_table = daily_stats_table_name(table_name)
+
+    def update(
+        self,
+        con: sqlite3.Connection,
+        catalog: PartitionCatalog,
+        tables: Iterable[str],
+        version: int,
+    ) -> int:
+        """
+        recomputes the days of the tides `tables` were written with at
+        `version`, returns the num of days stored
+        """
+        spans: Dict[int, Tuple[int, int]] = dict()
+        for table in tables:
+            for port_key, first, last in con.execute(
+                f"SELECT port_key, MIN(ts) / {SECONDS_PER_DAY}, MAX(ts) / {SECONDS_PER_DAY} "
+                f"FROM {table} INDEXED BY {table}_version WHERE version = ? GROUP BY port_key",
+                (version,),
+            ):
+                if port_key in spans:
+                    first, last = min(first, spans[port_key][0]), max(last, spans[port_key][1])
+                spans[port_key] = (first, last)
+        return self._recompute(con, catalog, spans)
+
+    def rebuild(self, con: sqlite3.Connection, catalog: PartitionCatalog) -> int:
+        """recomputes every day of every port, returns the num of days stored"""
+        spans: Dict[int, Tuple[int, int]] = dict()
+        sources = catalog.sources(con, 0, _END_OF_TIME)
+        for table in sources.tables:
+            for port_key, first, last in con.execute(
+                f"SELECT port_key, MIN(ts) / {SECONDS_PER_DAY}, MAX(ts) / {SECONDS_PER_DAY} "
+                f"FROM {table} GROUP BY port_key"
+            ):
+                if port_key in spans:
+                    first, last = min(first, spans[port_key][0]), max(last, spans[port_key][1])
+                spans[port_key] = (first, last)
+        if sources.archives:
+            port_keys = dict(con.execute(f"SELECT port_id, port_key FROM {LOCATION_TABLE_NAME}"))
+            for port_id, ts, _, _ in catalog.archive_rows(sources.archives, 0, _END_OF_TIME):
+                port_key = port_keys.get(port_id)
+                if port_key is None:
+                    continue
+                day = ts // SECONDS_PER_DAY
+                first, last = spans.get(port_key, (day, day))
+                spans[port_key] = (min(first, day), max(last, day))
+        con.execute(f"DELETE FROM {self.daily_table}")
+        return self._recompute(con, catalog, spans)
+
+    def _recompute(
+        self,
+        con: sqlite3.Connection,
+        catalog: PartitionCatalog,
+        spans: Dict[int, Tuple[int, int]],
+    ) -> int:
+        num_days = 0
+        for port_key, (first, last) in spans.items():
+            days = self._aggregate(con, catalog, port_key, first, last)
+            ranges = {
+                day: round(max_high - min_low, 3)
+                for day, (_, min_low, max_high) in days.items()
+                if min_low is not None and max_high is not None
+            }
+            # the days either side rank these, and are ranked among them
+            neighbours = dict(
+                con.execute(
+                    f"SELECT day, tidal_range FROM {self.daily_table} "
+                    f"WHERE port_key = ? AND tidal_range IS NOT NULL "
+                    f"AND (day >= ? AND day < ? OR day > ? AND day <= ?)",
+                    (
+                        port_key,
+                        first - 2 * RANK_WINDOW_DAYS,
+                        first,
+                        last,
+                        last + 2 * RANK_WINDOW_DAYS,
+                    ),
+                )
+            )
+            ranked_days = sorted(ranges.keys() | neighbours.keys())
+            ranks = {
+                day: (rank, phase)
+                for day, rank, phase in rank_days(
+                    ranked_days,
+                    [ranges.get(day, neighbours.get(day)) for day in ranked_days],
+                    first - RANK_WINDOW_DAYS,
+                    last + RANK_WINDOW_DAYS,
+                )
+            }
+
+            con.execute(
+                f"DELETE FROM {self.daily_table} WHERE port_key = ? AND day >= ? AND day <= ?",
+                (port_key, first, last),
+            )
+            con.executemany(
+                f"INSERT INTO {self.daily_table} (port_key, day, num_tides, min_low, "
+                f"max_high, tidal_range, range_rank, phase) VALUES (?,?,?,?,?,?,?,?)",
+                (
+                    (port_key, day, num_tides, min_low, max_high, ranges.get(day))
+                    + ranks.get(day, (None, None))
+                    for day, (num_tides, min_low, max_high) in sorted(days.items())
+                ),
+            )
+            con.executemany(
+                f"UPDATE {self.daily_table} SET range_rank = ?, phase = ? "
+                f"WHERE port_key = ? AND day = ?",
+                (
+                    ranks[day] + (port_key, day)
+                    for day in neighbours
+                    if day in ranks
+                ),
+            )
+            num_days += len(days)
+        return num_days
+
+    def _aggregate(
+        self,
+        con: sqlite3.Connection,
+        catalog: PartitionCatalog,
+        port_key: int,
+        first: int,
+        last: int,
+    ) -> Dict[int, Tuple[int, Optional[float], Optional[float]]]:
+        """day -> (num_tides, min_low, max_high) of a port's days from first to last"""
+        start_ts, end_ts = first * SECONDS_PER_DAY, (last + 1) * SECONDS_PER_DAY - 1
+        sources = catalog.sources(con, start_ts, end_ts)
+        if not sources.archives:
+            # a day is in one table only, sqlite can do the sums
+            return {
+                day: (num_tides, min_low, max_high)
+                for day, num_tides, min_low, max_high in con.execute(
+                    " UNION ALL ".join(
+                        f"SELECT ts / {SECONDS_PER_DAY}, COUNT(*), "
+                        f"MIN(CASE WHEN tide_type = {TIDE_TYPE_LOW} THEN height END), "
+                        f"MAX(CASE WHEN tide_type = {TIDE_TYPE_HIGH} THEN height END) "
+                        f"FROM {table} WHERE port_key = ? AND ts >= ? AND ts <= ? GROUP BY 1"
+                        for table in sources.tables
+                    ),
+                    (port_key, start_ts, end_ts) * len(sources.tables),
+                )
+            }
+
+        rows = con.execute(
+            tide_rows_sql(
+                "t.ts, t.tide_type, t.height",
+                sources.tables,
+                "t.port_key = ? AND t.ts >= ? AND t.ts <= ?",
+            ),
+            (port_key, start_ts, end_ts) * len(sources.tables),
+        ).fetchall()
+        port_id = con.execute(
+            f"SELECT port_id FROM {LOCATION_TABLE_NAME} WHERE port_key = ?", (port_key,)
+        ).fetchone()[0]
+        archived = catalog.archive_rows(sources.archives, start_ts, end_ts, {port_id})
+        rows = merge_archived(
+            rows,
+            [(ts, tide_type, height) for _, ts, tide_type, height in archived],
+            key=lambda row: row[0],
+        )
+        days: Dict[int, Tuple[int, Optional[float], Optional[float]]] = dict()
+        for ts, tide_type, height in rows:
+            num_tides, min_low, max_high = days.get(ts // SECONDS_PER_DAY, (0, None, None))
+            if tide_type == TIDE_TYPE_LOW and (min_low is None or height < min_low):
+                min_low = height
+            elif tide_type == TIDE_TYPE_HIGH and (max_high is None or height > max_high):
+                max_high = height
+            days[ts // SECONDS_PER_DAY] = (num_tides + 1, min_low, max_high)
+        return days
+
+    def _select(
+        self,
+        con: sqlite3.Connection,
+        start_day: datetime.date,
+        end_day: datetime.date,
+        port_ids: Optional[Sequence[PortID]],
+        where: str = "",
+        params: Sequence = (),
+    ) -> List[DayStats]:
+        port_filter = ""
+        port_params: list = []
+        if port_ids is not None:
+            port_params = list(port_ids)
+            port_filter = f"AND l.port_id IN ({','.join('?' * len(port_params))}) "
+        rows = con.execute(
+            f"SELECT {_COLUMNS} FROM {self.daily_table} d "
+            f"JOIN {LOCATION_TABLE_NAME} l ON l.port_key = d.port_key "
+            f"WHERE d.day >= ? AND d.day <= ? {port_filter}{where}"
+            f"ORDER BY l.port_id, d.day",
+            [day_number(start_day), day_number(end_day)] + port_params + list(params),
+        )
+        return [self._day_stats(row) for row in rows]
+
+    @staticmethod
+    def _day_stats(row: tuple) -> DayStats:
+        port_id, day, num_tides, min_low, max_high, tidal_range, range_rank, phase = row
+        return DayStats(
+            port_id=PortID(port_id),
+            day=from_day_number(day),
+            num_tides=num_tides,
+            min_low=min_low,
+            max_high=max_high,
+            tidal_range=tidal_range,
+            range_rank=range_rank,
+            phase=None if phase is None else TidePhase(phase),
+        )
+
+    def days(
+        self,
+        con: sqlite3.Connection,
+        start_day: datetime.date,
+        end_day: datetime.date,
+        port_ids: Optional[Sequence[PortID]] = None,
+    ) -> List[DayStats]:
+        """the days from start_day to end_day of `port_ids` (all if None)"""
+        return self._select(con, start_day, end_day, port_ids)
+
+    def matching_days(
+        self,
+        con: sqlite3.Connection,
+        start_day: datetime.date,
+        end_day: datetime.date,
+        port_ids: Optional[Sequence[PortID]] = None,
+        low_at_most: Optional[float] = None,
+        high_at_least: Optional[float] = None,
+        phase: Optional[TidePhase] = None,
+    ) -> List[DayStats]:
+        """the days with a low tide at or below `low_at_most`, and so on"""
+        conditions, params = list(), list()
+        if low_at_most is not None:
+            conditions.append("d.min_low <= ?")
+            params.append(low_at_most)
+        if high_at_least is not None:
+            conditions.append("d.max_high >= ?")
+            params.append(high_at_least)
+        if phase is not None:
+            conditions.append("d.phase = ?")
+            params.append(phase.value)
+        where = "".join(f"AND {condition} " for condition in conditions)
+        return self._select(con, start_day, end_day, port_ids, where, params)
+
+    def best_days(
+        self,
+        con: sqlite3.Connection,
+        start_day: datetime.date,
+        end_day: datetime.date,
+        port_ids: Optional[Sequence[PortID]] = None,
+        by: str = "lowest-low",
+    ) -> List[DayStats]:
+        """the best day from start_day to end_day of each port, see BEST_BY"""
+        if by not in BEST_BY:
+            raise ValueError(f"by must be one of {tuple(BEST_BY)}")
+        column, order = BEST_BY[by]
+        port_filter = ""
+        port_params: list = []
+        if port_ids is not None:
+            port_params = list(port_ids)
+            port_filter = f"AND l.port_id IN ({','.join('?' * len(port_params))}) "
+        rows = con.execute(
+            f"SELECT * FROM ("
+            f"SELECT {_COLUMNS}, ROW_NUMBER() OVER ("
+            f"PARTITION BY d.port_key ORDER BY d.{column} {order}, d.day) AS n "
+            f"FROM {self.daily_table} d "
+            f"JOIN {LOCATION_TABLE_NAME} l ON l.port_key = d.port_key "
+            f"WHERE d.day >= ? AND d.day <= ? AND d.{column} IS NOT NULL {port_filter}"
+            f") WHERE n = 1 ORDER BY 1",
+            [day_number(start_day), day_number(end_day)] + port_params,
+        )
+        # without the row number
+        return [self._day_stats(row[:-1]) for row in rows]
+
+    def phases(
+        self, con: sqlite3.Connection, days: Iterable[Tuple[PortID, datetime.date]]
+    ) -> Dict[Tuple[PortID, datetime.date], TidePhase]:
+        """the spring/neap phase of each (port_id, day) that has one"""
+        by_port: Dict[PortID, List[datetime.date]] = dict()
+        for port_id, day in days:
+            by_port.setdefault(port_id, list()).append(day)
+        if not by_port:
+            return dict()
+        stats = self._select(
+            con,
+            min(min(port_days) for port_days in by_port.values()),
+            max(max(port_days) for port_days in by_port.values()),
+            list(by_port),
+            "AND d.phase IS NOT NULL ",
+        )
+        return {(day.port_id, day.day): day.phase for day in stats}
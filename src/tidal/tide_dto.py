@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import List, NewType
+from typing import Dict, List, NewType, Tuple, Union
 
 AreaID = NewType("AreaID", str)
 PortID = NewType("PortID", str)
@@ -12,6 +12,13 @@ class TideType(Enum):
     HIGH = "High"
 
 
+class TidePhase(Enum):
+    """days of the largest (spring) and smallest (neap) tidal range"""
+
+    SPRING = "Spring"
+    NEAP = "Neap"
+
+
 @dataclass
 class TideLocation:
     region_name: str
@@ -31,3 +38,84 @@ class Tide:
 class DailyTideRecord:
     location: TideLocation
     tides: List[Tide]
+
+
+# Compact, immutable variants of the DTOs above, for holding many records
+# in memory or shipping them between processes. They have the same
+# attributes, so can be used wherever the plain DTOs are read.
+
+
+@dataclass(frozen=True)
+class FrozenTideLocation:
+    __slots__ = ("region_name", "name", "area_id", "port_id")
+    region_name: str
+    name: str
+    area_id: AreaID
+    port_id: PortID
+
+    def __reduce__(self):
+        # unpickled copies are interned too
+        return _unpickle_location, (self.region_name, self.name, self.area_id, self.port_id)
+
+
+@dataclass(frozen=True)
+class FrozenTide:
+    __slots__ = ("type", "utc_datetime", "height")
+    type: TideType
+    utc_datetime: datetime
+    height: float
+
+    def __reduce__(self):
+        return FrozenTide, (self.type, self.utc_datetime, self.height)
+
+
+@dataclass(frozen=True)
+class FrozenDailyTideRecord:
+    __slots__ = ("location", "tides")
+    location: FrozenTideLocation
+    tides: Tuple[FrozenTide, ...]
+
+    def __reduce__(self):
+        return FrozenDailyTideRecord, (self.location, self.tides)
+
+
+_interned_locations: Dict[PortID, FrozenTideLocation] = dict()
+
+
+def intern_location(
+    location: Union[TideLocation, FrozenTideLocation]
+) -> FrozenTideLocation:
+    """returns the one shared `FrozenTideLocation` equal to `location`"""
+    interned = _interned_locations.get(location.port_id)
+    if (
+        interned is None
+        or interned.name != location.name
+        or interned.area_id != location.area_id
+        or interned.region_name != location.region_name
+    ):
+        interned = FrozenTideLocation(
+            region_name=location.region_name,
+            name=location.name,
+            area_id=location.area_id,
+            port_id=location.port_id,
+        )
+        _interned_locations[location.port_id] = interned
+    return interned
+
+
+def _unpickle_location(
+    region_name: str, name: str, area_id: AreaID, port_id: PortID
+) -> FrozenTideLocation:
+    return intern_location(
+        TideLocation(region_name=region_name, name=name, area_id=area_id, port_id=port_id)
+    )
+
+
+def freeze(record: DailyTideRecord) -> FrozenDailyTideRecord:
+    return FrozenDailyTideRecord(
+        location=intern_location(record.location),
+        tides=tuple(
+            FrozenTide(type=tide.type, utc_datetime=tide.utc_datetime, height=tide.height)
+            for tide in record.tides
+        ),
+    )
@@ -0,0 +1,19 @@
+import datetime
+
+# tide times are naive UTC datetimes throughout, and stored as integer
+# seconds since the unix epoch
+EPOCH = datetime.datetime(1970, 1, 1)
+
+_ONE_SECOND = datetime.timedelta(seconds=1)
+
+
+def to_epoch(utc_datetime: datetime.datetime) -> int:
+    if utc_datetime.tzinfo is not None:
+        utc_datetime = utc_datetime.astimezone(datetime.timezone.utc).replace(
+            tzinfo=None
+        )
+    return (utc_datetime - EPOCH) // _ONE_SECOND
+
+
+def from_epoch(ts: int) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(seconds=ts)
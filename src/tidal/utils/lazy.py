@@ -0,0 +1,43 @@
+import functools
+import importlib
+import inspect
+from types import ModuleType
+from typing import Any, Callable, Dict, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def retry(options: Callable[[ModuleType], Dict[str, Any]]) -> Callable[[F], F]:
+    """
+    tenacity's @retry, but tenacity is only imported the first time the
+    decorated function is called. `options` receives the tenacity module
+    and returns the keyword arguments of `tenacity.retry`, e.g.
+
+        @retry(lambda t: dict(stop=t.stop_after_attempt(3)))
+        def download(...):
+    """
+
+    def decorator(func: F) -> F:
+        retrying = None
+
+        def wrapped() -> Callable[..., Any]:
+            nonlocal retrying
+            if retrying is None:
+                tenacity = importlib.import_module("tenacity")
+                retrying = tenacity.retry(**options(tenacity))(func)
+            return retrying
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await wrapped()(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return wrapped()(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,18 +1,155 @@
-from typing import Type, TypeVar
+import dataclasses
+import datetime
+import enum
+import typing
+from typing import Any, Callable, Dict, List, Sequence, Type, TypeVar, Union
 
-from serde.json import from_json, to_json
+try:
+    import orjson
+except ImportError:  # optional, see setup.py extras
+    orjson = None
 
 T = TypeVar("T")
 
 
 class JSONSerializer:
+    # pyserde is imported on first use, it is slow to import and not needed
+    # when the orjson backend is installed
     @classmethod
     def serialize(
         cls,
         data: T,
     ) -> str:
+        from serde.json import to_json
+
         return to_json(data)
 
     @classmethod
     def deserialize(cls, data: str, dtype: Type[T]) -> T:
+        from serde.json import from_json
+
         return from_json(dtype, data)
+
+    @classmethod
+    def encode(cls, data: T) -> bytes:
+        return cls.serialize(data).encode("utf-8")
+
+    @classmethod
+    def decode_many(cls, lines: Sequence[Union[str, bytes]], dtype: Type[T]) -> List[T]:
+        from serde.json import from_json
+
+        return [
+            from_json(dtype, line.decode("utf-8") if isinstance(line, bytes) else line)
+            for line in lines
+        ]
+
+
+def _build_decoder(tp: Any) -> Callable[[Any], Any]:
+    """
+    a function converting the output of `json.loads` into an instance of
+    `tp`, for the types used by the DTOs. Raises TypeError for anything else.
+    """
+    supertype = getattr(tp, "__supertype__", None)
+    if supertype is not None:  # NewType
+        return _build_decoder(supertype)
+    if tp in (str, int, bool, Any):
+        return lambda value: value
+    if tp is float:
+        return float
+    if tp is datetime.datetime:
+        return datetime.datetime.fromisoformat
+    if tp is datetime.date:
+        return datetime.date.fromisoformat
+    if isinstance(tp, type) and issubclass(tp, enum.Enum):
+        return tp
+
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+    if origin is Union:
+        if len(args) == 2 and type(None) in args:
+            inner = _build_decoder(args[0] if args[1] is type(None) else args[1])
+            return lambda value: None if value is None else inner(value)
+        raise TypeError(f"unsupported type {tp}")
+    if origin is list:
+        item = _build_decoder(args[0] if args else Any)
+        return lambda value: [item(x) for x in value]
+    if origin is tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            item = _build_decoder(args[0])
+            return lambda value: tuple(item(x) for x in value)
+        items = [_build_decoder(arg) for arg in args]
+        return lambda value: tuple(f(x) for f, x in zip(items, value))
+
+    if dataclasses.is_dataclass(tp):
+        hints = typing.get_type_hints(tp)
+        fields = [
+            (field.name, _build_decoder(hints[field.name]))
+            for field in dataclasses.fields(tp)
+            if field.init
+        ]
+
+        def decode_dataclass(value: Dict[str, Any]):
+            return tp(
+                **{name: decode(value[name]) for name, decode in fields if name in value}
+            )
+
+        return decode_dataclass
+    raise TypeError(f"unsupported type {tp}")
+
+
+class OrjsonSerializer:
+    """
+    fast path on top of orjson: dataclasses, enums and datetimes are
+    encoded natively, in the same JSON as pyserde produces, and decoded by
+    a converter compiled once per dtype. dtypes the converter doesn't
+    support are handed to pyserde.
+    """
+
+    _decoders: Dict[Any, Callable[[Any], Any]] = dict()
+
+    @classmethod
+    def _decoder(cls, dtype: Type[T]) -> Callable[[Any], T]:
+        decoder = cls._decoders.get(dtype)
+        if decoder is None:
+            try:
+                decoder = _build_decoder(dtype)
+            except TypeError:
+                def decoder(value, dtype=dtype):
+                    return JSONSerializer.deserialize(orjson.dumps(value).decode(), dtype)
+            cls._decoders[dtype] = decoder
+        return decoder
+
+    @classmethod
+    def serialize(cls, data: T) -> str:
+        return orjson.dumps(data).decode("utf-8")
+
+    @classmethod
+    def deserialize(cls, data: Union[str, bytes], dtype: Type[T]) -> T:
+        return cls._decoder(dtype)(orjson.loads(data))
+
+    @classmethod
+    def encode(cls, data: T) -> bytes:
+        return orjson.dumps(data)
+
+    @classmethod
+    def decode_many(cls, lines: Sequence[Union[str, bytes]], dtype: Type[T]) -> List[T]:
+        decoder = cls._decoder(dtype)
+        loads = orjson.loads
+        return [decoder(loads(line)) for line in lines]
+
+
+SERIALIZERS: Dict[str, type] = {"pyserde": JSONSerializer}
+if orjson is not None:
+    SERIALIZERS["orjson"] = OrjsonSerializer
+
+
+def get_serializer(name: str = None) -> type:
+    """the serializer backend `name`, by default the fastest one installed"""
+    if name is None:
+        return OrjsonSerializer if orjson is not None else JSONSerializer
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown or unavailable serializer {name}, available: {list(SERIALIZERS)}"
+        )
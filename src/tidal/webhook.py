@@ -0,0 +1,221 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# worth retrying, anything else (e.g. 404, invalid payload) fails at once
+RETRY_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """`rate` requests per second on average, bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """takes a token, or returns how many seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class _Delivery:
+    url: str
+    payload: dict
+    on_sent: Optional[Callable[[], None]]
+    attempt: int = 0
+
+
+@dataclass
+class DispatchSummary:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+
+
+class WebhookDispatcher:
+    """
+    posts JSON payloads to webhooks from a pool of `num_workers` threads
+    sharing one pooled `requests.Session`.
+
+    deliveries wait in a heap ordered by the time they may go out, so a
+    delivery backing off after a failure, or held back by its webhook's
+    rate limit (`rate` posts per second, bursts of `burst`), never blocks
+    the others. `submit` blocks while `queue_size` deliveries are pending.
+
+    use as a context manager, leaving it waits for every delivery to be
+    sent or to run out of attempts:
+
+        with WebhookDispatcher() as dispatcher:
+            dispatcher.submit(url, {"text": "..."})
+        print(dispatcher.summary)
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 8,
+        queue_size: int = 256,
+        rate: float = 1.0,
+        burst: float = 1.0,
+        max_attempts: int = 5,
+        max_backoff: float = 60.0,
+        timeout: float = 10.0,
+        session=None,
+    ):
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = session if session is not None else self._new_session()
+        self.summary = DispatchSummary()
+
+        self._cond = threading.Condition()
+        # (ready at, sequence, delivery), the sequence keeps the heap FIFO
+        # among deliveries ready at the same time
+        self._heap: List[Tuple[float, int, _Delivery]] = list()
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._closing = False
+        self._buckets: Dict[str, TokenBucket] = dict()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"webhook-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _new_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # one kept-alive connection per worker and webhook host
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.num_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def submit(
+        self, url: str, payload: dict, on_sent: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        queues `payload` for `url`. `on_sent` is called from a worker thread
+        once it has been delivered.
+        """
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("dispatcher is closed")
+            while self._pending >= self.queue_size:
+                self._cond.wait()
+            self._pending += 1
+            self._push(time.monotonic(), _Delivery(url, payload, on_sent))
+
+    def _push(self, ready_at: float, delivery: _Delivery) -> None:
+        heapq.heappush(self._heap, (ready_at, next(self._sequence), delivery))
+        self._cond.notify()
+
+    def _next_delivery(self) -> Optional[_Delivery]:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if self._closing and self._pending == 0:
+                        return None
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                ready_at, _, delivery = self._heap[0]
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                bucket = self._buckets.get(delivery.url)
+                if bucket is None:
+                    bucket = self._buckets[delivery.url] = TokenBucket(self.rate, self.burst)
+                wait = bucket.take(now)
+                if wait > 0:
+                    self._push(now + wait, delivery)
+                    continue
+                return delivery
+
+    def _post(self, delivery: _Delivery) -> Tuple[bool, Optional[float]]:
+        """(delivered, seconds to wait before retrying or None if not worth it)"""
+        import requests
+
+        try:
+            r = self.session.post(delivery.url, json=delivery.payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.debug(f"HTTP POST to {delivery.url} failed: {e!r}")
+            return False, 0.0
+        if 200 <= r.status_code < 300:
+            logger.debug(f"HTTP POST successful: {r.status_code} {r.reason}")
+            return True, None
+        logger.debug(f"HTTP POST failed: {r.status_code} {r.reason}")
+        if r.status_code not in RETRY_STATUS:
+            return False, None
+        try:
+            return False, float(r.headers.get("Retry-After", 0))
+        except ValueError:
+            return False, 0.0
+
+    def _work(self) -> None:
+        while True:
+            delivery = self._next_delivery()
+            if delivery is None:
+                return
+            delivered, retry_after = self._post(delivery)
+            if delivered and delivery.on_sent is not None:
+                try:
+                    delivery.on_sent()
+                except Exception as e:
+                    logger.error(f"on_sent callback failed: {str(e)}")
+            delivery.attempt += 1
+            with self._cond:
+                if delivered:
+                    self.summary.sent += 1
+                elif retry_after is not None and delivery.attempt < self.max_attempts:
+                    # exponential backoff with jitter, or what the server asked for
+                    backoff = min(self.max_backoff, 2 ** delivery.attempt) * random.uniform(0.5, 1)
+                    self.summary.retried += 1
+                    self._push(time.monotonic() + max(backoff, retry_after), delivery)
+                    continue
+                else:
+                    self.summary.failed += 1
+                    logger.error(
+                        f"Giving up on {delivery.url} after {delivery.attempt} attempt(s): "
+                        f"{delivery.payload}"
+                    )
+                self._pending -= 1
+                self._cond.notify_all()
+
+    def close(self) -> DispatchSummary:
+        """waits for all pending deliveries and stops the workers"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self.session.close()
+        return self.summary
+
+    def __enter__(self) -> "WebhookDispatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,142 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from tidal.db import TidalDatabase
+from tidal.metrics import Metrics
+from tidal.tide_dto import DailyTideRecord
+
+logger = logging.getLogger(__name__)
+
+# tells the writer thread to flush and stop
+_CLOSE = object()
+
+
+class TideWriter:
+    """
+    writes tide records to the database from a thread of its own, so
+    fetching never waits for SQLite to commit.
+
+    records of up to `batch_size` locations go in one transaction, and
+    nothing waits longer than `max_delay` seconds to be written. `add`
+    blocks while `queue_size` locations are waiting, so a slow disk slows
+    the sweep down rather than filling memory. The thread opens its own
+    connection with `open_database`, sqlite3 connections can't be shared
+    between threads. `on_written`, if given, is called on that thread with
+    its database and each batch once committed.
+
+    use as a context manager, leaving it writes whatever is left:
+
+        with TideWriter(lambda: TidalDatabase(path, table)) as writer:
+            writer.add(records)
+    """
+
+    def __init__(
+        self,
+        open_database: Callable[[], TidalDatabase],
+        batch_size: int = 50,
+        max_delay: float = 1.0,
+        queue_size: int = 256,
+        metrics: Optional[Metrics] = None,
+        on_written: Optional[
+            Callable[[TidalDatabase, Sequence[Iterable[DailyTideRecord]]], None]
+        ] = None,
+    ):
+        self.open_database = open_database
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.num_rows = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._work, name="tide-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, records: Iterable[DailyTideRecord], block: bool = True) -> bool:
+        """
+        queues the records of one location. With block=False returns False
+        instead of waiting when the queue is full.
+        """
+        if self._error is not None:
+            raise RuntimeError("tide writer failed") from self._error
+        if self._closed:
+            raise RuntimeError("tide writer is closed")
+        self.metrics.observe("writer_queue_depth", self._queue.qsize())
+        try:
+            self._queue.put(records, block=block)
+        except queue.Full:
+            self.metrics.inc("writer_queue_full_total")
+            return False
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _work(self) -> None:
+        try:
+            tide_database = self.open_database()
+        except Exception as e:
+            logger.error(f"Failed to open the database: {str(e)}")
+            self._error = e
+            while self._queue.get() is not _CLOSE:
+                pass
+            return
+        try:
+            pending: List[Iterable[DailyTideRecord]] = list()
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is not None and item is not _CLOSE and self._error is None:
+                    pending.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.max_delay
+                if pending and (
+                    len(pending) >= self.batch_size
+                    or item is _CLOSE
+                    or time.monotonic() >= deadline
+                ):
+                    self._write(tide_database, pending)
+                    pending = list()
+                    deadline = None
+                if item is _CLOSE:
+                    return
+        finally:
+            tide_database.close()
+
+    def _write(
+        self, tide_database: TidalDatabase, pending: List[Iterable[DailyTideRecord]]
+    ) -> None:
+        try:
+            self.num_rows += tide_database.insert_many(pending)
+            self.metrics.observe("writer_batch_locations", len(pending))
+            if self.on_written is not None:
+                self.on_written(tide_database, pending)
+        except Exception as e:
+            # keep draining the queue, so `add` raises instead of blocking
+            logger.error(f"Failed to write {len(pending)} locations: {str(e)}")
+            self._error = e
+
+    def close(self) -> int:
+        """writes what is queued and stops the thread, returns rows written"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("tide writer failed") from self._error
+        return self.num_rows
+
+    def __enter__(self) -> "TideWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,189 @@
+import configparser
+import datetime
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+import pytest
+
+from tidal.db import TidalDatabase
+from tidal.providers.fake import FixtureServer, fake_locations, fake_tides
+from tidal.tide_dto import DailyTideRecord, PortID, Tide
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _script_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    return env
+
+
+@pytest.fixture
+def run_script() -> Callable[..., subprocess.CompletedProcess]:
+    """runs one of the repo's scripts to the end, as cron would, with tidal from src"""
+
+    def run(script: str, *args: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, script, *args],
+            cwd=ROOT,
+            env=_script_env(),
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+
+    return run
+
+
+@pytest.fixture
+def start_script() -> Iterator[Callable[..., subprocess.Popen]]:
+    """starts one of the repo's scripts in the background, killed at teardown"""
+    processes: List[subprocess.Popen] = list()
+
+    def start(script: str, *args: str) -> subprocess.Popen:
+        process = subprocess.Popen(
+            [sys.executable, script, *args],
+            cwd=ROOT,
+            env=_script_env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+@pytest.fixture
+def fake_records() -> Callable[..., Dict[PortID, List[DailyTideRecord]]]:
+    """port_id -> daily records of the first `num_ports` fake ports, from `start`"""
+
+    def records(
+        num_ports: int, start: datetime.datetime, days: int
+    ) -> Dict[PortID, List[DailyTideRecord]]:
+        ports = dict()
+        for location in fake_locations(num_ports):
+            by_day: Dict[datetime.date, List[Tide]] = dict()
+            for tide_type, when, height in fake_tides(location.port_id, start, days):
+                by_day.setdefault(when.date(), list()).append(Tide(tide_type, when, height))
+            ports[location.port_id] = [
+                DailyTideRecord(location=location, tides=tides) for tides in by_day.values()
+            ]
+        return ports
+
+    return records
+
+
+@pytest.fixture
+def write_config() -> Callable[..., Path]:
+    """writes `settings` as the DEFAULT section of a config file at `path`"""
+
+    def write(path: Path, **settings: str) -> Path:
+        config = configparser.ConfigParser()
+        config["DEFAULT"] = settings
+        with open(path, "w") as f:
+            config.write(f)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def tide_database(tmp_path: Path) -> Iterator[TidalDatabase]:
+    """an empty database at the current schema"""
+    tide_database = TidalDatabase(tmp_path / "tidal.db", "tidal")
+    tide_database.create_table()
+    yield tide_database
+    tide_database.close()
+
+
+@pytest.fixture
+def bbc_pages() -> Dict[str, str]:
+    """file name -> html of the recorded BBC pages of benchmarks/fixtures"""
+    return {
+        path.name: path.read_text("utf-8")
+        for path in sorted((ROOT / "benchmarks" / "fixtures").glob("*.html"))
+    }
+
+
+@pytest.fixture
+def num_ports() -> int:
+    """ports of the fake provider swept by the tests"""
+    return 20
+
+
+@pytest.fixture
+def fixture_server() -> Iterator[FixtureServer]:
+    server = FixtureServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def config_file(
+    tmp_path: Path, fixture_server: FixtureServer, write_config, num_ports: int
+) -> Path:
+    """a config sweeping the fake ports of `fixture_server`, with a response cache"""
+    return write_config(
+        tmp_path / "config.cfg",
+        PROVIDERS="fake",
+        FAKE_BASE_URL=f"http://127.0.0.1:{fixture_server.server_port}/fake/",
+        FAKE_NUM_PORTS=str(num_ports),
+        DATABASE_NAME=str(tmp_path / "tidal.db"),
+        DATABASE_TIDE_TABLE_NAME="tidal",
+        HTTP_CACHE_DIR=str(tmp_path / "cache"),
+        WEBHOOK="",
+    )
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: "WebhookServer"
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.received.append(body)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """accepts every post, and keeps their bodies in `received`"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _WebhookHandler)
+        self.received: List[bytes] = list()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/hook"
+
+
+@pytest.fixture
+def webhooks() -> Iterator[List[WebhookServer]]:
+    servers = [WebhookServer() for _ in range(3)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
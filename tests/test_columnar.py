@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from tidal.schema import TIDE_TYPE_HIGH, TIDE_TYPE_LOW
+from tidal.tide_dto import PortID, TideType
+from tidal.utils.epoch import to_epoch
+
+np = pytest.importorskip("numpy")
+
+START = datetime.datetime(2024, 3, 1)
+END = START + datetime.timedelta(days=3)
+
+
+@pytest.fixture
+def ports(tide_database, fake_records):
+    ports = fake_records(3, START, 3)
+    tide_database.insert_many(ports.values())
+    return ports
+
+
+def test_columns_match_rows(tide_database, ports):
+    columns = tide_database.query_tides_columnar(None, START, END)
+    assert columns.port_ids == list(ports)
+    expected = [
+        (port_id, to_epoch(tide.utc_datetime), tide.type, tide.height)
+        for port_id, records in ports.items()
+        for daily in records
+        for tide in daily.tides
+    ]
+    assert len(columns) == len(expected)
+    for i, (port_id, ts, tide_type, height) in enumerate(expected):
+        assert columns.port_ids[columns.port[i]] == port_id
+        assert columns.ts[i] == ts
+        code = TIDE_TYPE_LOW if tide_type == TideType.LOW else TIDE_TYPE_HIGH
+        assert columns.tide_type[i] == code
+        assert columns.height[i] == pytest.approx(height, abs=1e-5)
+
+
+def test_query_some_ports(tide_database, ports):
+    port_ids = list(ports)
+    columns = tide_database.query_tides_columnar(
+        [port_ids[2], PortID("fake:9999"), port_ids[0]], START, END
+    )
+    # ports unknown to the database are left out
+    assert sorted(columns.port_ids) == sorted([port_ids[0], port_ids[2]])
+    assert set(columns.port_ids[i] for i in columns.port) == {port_ids[0], port_ids[2]}
+    assert len(tide_database.query_tides_columnar([PortID("fake:9999")], START, END)) == 0
+
+
+def test_filters_and_aggregates(tide_database, ports):
+    columns = tide_database.query_tides_columnar(None, START, END)
+    lowest, highest = columns.per_port_min_max()
+    for i, port_id in enumerate(columns.port_ids):
+        heights = [tide.height for daily in ports[port_id] for tide in daily.tides]
+        assert lowest[i] == pytest.approx(min(heights), abs=1e-5)
+        assert highest[i] == pytest.approx(max(heights), abs=1e-5)
+        port = columns.for_port(port_id)
+        assert len(port) == len(heights)
+
+    threshold = float(np.median(columns.height))
+    below = columns.below(threshold)
+    assert len(below) > 0
+    assert np.all(below.height <= threshold)
+    assert np.all(below.tide_type == TIDE_TYPE_LOW)
+    assert np.all(columns.above(threshold, tide_type=None).height >= threshold)
+
+
+def test_daily(tide_database, ports):
+    daily = tide_database.query_tides_columnar(None, START, END).daily()
+    expected = {
+        (port_id, record.tides[0].utc_datetime.date()): record.tides
+        for port_id, records in ports.items()
+        for record in records
+    }
+    assert len(daily) == len(expected)
+    for port, day, min_low, max_high, count in zip(
+        daily.port, daily.dates(), daily.min_low, daily.max_high, daily.count
+    ):
+        tides = expected[(daily.port_ids[port], day)]
+        assert count == len(tides)
+        lows = [tide.height for tide in tides if tide.type == TideType.LOW]
+        highs = [tide.height for tide in tides if tide.type == TideType.HIGH]
+        # NaN where the day has none
+        assert min_low == pytest.approx(min(lows, default=np.nan), abs=1e-5, nan_ok=True)
+        assert max_high == pytest.approx(max(highs, default=np.nan), abs=1e-5, nan_ok=True)
@@ -0,0 +1,92 @@
+import datetime
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from tidal.db import TidalDatabase
+from tidal.schema import SCHEMA_VERSION, migrate, schema_version
+from tidal.tide_dto import DailyTideRecord, Tide
+
+START = datetime.datetime(2024, 3, 1)
+
+
+def create_v1_database(database_file: Path, ports: Dict[str, List[DailyTideRecord]]) -> None:
+    """the table as the first release wrote it, before the schema had a version"""
+    con = sqlite3.connect(database_file)
+    con.execute(
+        "CREATE TABLE tidal (location TEXT, area_id TEXT, port_id TEXT,"
+        "utc_datetime TEXT, tide_type TEXT, height REAL,"
+        "UNIQUE (port_id, utc_datetime) ON CONFLICT REPLACE )"
+    )
+    con.executemany(
+        "INSERT INTO tidal (location, area_id, port_id, utc_datetime, tide_type, height) "
+        "VALUES(?,?,?,?,?,?)",
+        [
+            (
+                daily.location.name,
+                daily.location.area_id,
+                daily.location.port_id,
+                tide.utc_datetime.isoformat(),
+                tide.type.value,
+                tide.height,
+            )
+            for records in ports.values()
+            for daily in records
+            for tide in daily.tides
+        ],
+    )
+    con.commit()
+    con.close()
+
+
+def test_migrate_v1_to_latest(tmp_path, fake_records):
+    database_file = tmp_path / "tidal.db"
+    ports = fake_records(3, START, 3)
+    create_v1_database(database_file, ports)
+
+    tide_database = TidalDatabase(database_file, "tidal")
+    assert schema_version(tide_database.con, "tidal") == 1
+    with pytest.raises(RuntimeError):
+        tide_database.create_table()
+    assert migrate(tide_database.con, "tidal") == SCHEMA_VERSION
+    tide_database.create_table()
+
+    end = START + datetime.timedelta(days=3)
+    for port_id, records in ports.items():
+        assert list(tide_database.query_tide(port_id, START, end)) == [
+            tide for daily in records for tide in daily.tides
+        ]
+        assert tide_database.get_location_by_port_id(port_id).name == records[0].location.name
+    # the daily statistics of the migrated tides were computed
+    (num_days,) = tide_database.con.execute(
+        f"SELECT COUNT(*) FROM {tide_database.stats.daily_table}"
+    ).fetchone()
+    assert num_days == sum(len(records) for records in ports.values())
+    tide_database.close()
+
+
+def test_upsert_without_changes_is_rolled_back(tmp_path, fake_records):
+    tide_database = TidalDatabase(tmp_path / "tidal.db", "tidal")
+    tide_database.create_table()
+    ports = fake_records(2, START, 3)
+    num_tides = sum(len(daily.tides) for records in ports.values() for daily in records)
+
+    assert tide_database.insert_many(ports.values()) == num_tides
+    version = tide_database.data_version()
+    assert tide_database.insert_many(ports.values()) == 0
+    assert tide_database.data_version() == version
+
+    # one height changed: a new version, stamped on that row only
+    port_id, records = next(iter(ports.items()))
+    tide = records[0].tides[0]
+    records[0].tides[0] = Tide(tide.type, tide.utc_datetime, tide.height + 0.5)
+    assert tide_database.insert(records) == 1
+    assert tide_database.data_version() == version + 1
+    now = datetime.datetime.utcnow()
+    changed = list(tide_database.query_tides_by_location(None, START, now, since_version=version))
+    assert [(location.port_id, tide.height) for location, tide in changed] == [
+        (port_id, tide.height + 0.5)
+    ]
+    tide_database.close()
@@ -0,0 +1,130 @@
+import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from tidal.columnar import TideColumns
+from tidal.db import TidalDatabase
+from tidal.export import MANIFEST, TideExport, export_tides, import_tides
+from tidal.partition import compact, enable_partitioning
+from tidal.tide_dto import DailyTideRecord
+from tidal.utils.epoch import to_epoch
+
+START = datetime.datetime(2024, 3, 1)
+END = datetime.datetime(2024, 4, 15)
+
+
+@pytest.fixture
+def ports(fake_records) -> Dict[str, List[DailyTideRecord]]:
+    """six weeks of tides of a few ports, across two months"""
+    return fake_records(5, START, (END - START).days)
+
+
+@pytest.fixture
+def tide_database(tide_database, ports) -> TidalDatabase:
+    tide_database.insert_many(ports.values())
+    return tide_database
+
+
+def database_file(tide_database: TidalDatabase) -> Path:
+    return Path(tide_database.con.execute("PRAGMA database_list").fetchone()[2])
+
+
+def assert_same(columns: TideColumns, expected: TideColumns) -> None:
+    assert columns.port_ids == expected.port_ids
+    np.testing.assert_array_equal(columns.port, expected.port)
+    np.testing.assert_array_equal(columns.ts, expected.ts)
+    np.testing.assert_array_equal(columns.tide_type, expected.tide_type)
+    np.testing.assert_allclose(columns.height, expected.height, atol=1e-3)
+
+
+@pytest.mark.parametrize("fmt", ["npy", "npz"])
+@pytest.mark.parametrize("shard_by", ["port", "month"])
+def test_export_query(tmp_path, tide_database, ports, fmt, shard_by):
+    directory = tmp_path / "export"
+    manifest = export_tides(
+        database_file(tide_database),
+        "tidal",
+        directory,
+        shard_by=shard_by,
+        fmt=fmt,
+        ports_per_shard=2,
+        num_workers=1,
+    )
+    assert (directory / MANIFEST).exists()
+    assert [shard["name"] for shard in manifest["shards"]] == (
+        ["ports-00000", "ports-00001", "ports-00002"]
+        if shard_by == "port"
+        else ["month-202403", "month-202404"]
+    )
+    export = TideExport(directory)
+    assert len(export) == sum(len(d.tides) for records in ports.values() for d in records)
+
+    assert_same(export.query(), tide_database.query_tides_columnar(None, START, END))
+    # a few ports, one repeated and one unknown, and a time range
+    port_ids = list(ports)
+    wanted = [port_ids[0], port_ids[3], port_ids[3], "fake:unknown"]
+    start, end = START + datetime.timedelta(days=20), START + datetime.timedelta(days=40)
+    assert_same(
+        export.query(wanted, start, end), tide_database.query_tides_columnar(wanted, start, end)
+    )
+    assert len(export.query(port_ids, END, END + datetime.timedelta(days=1))) == 0
+
+
+def test_export_time_range_and_workers(tmp_path, tide_database):
+    start, end = START + datetime.timedelta(days=10), START + datetime.timedelta(days=35)
+    manifest = export_tides(
+        database_file(tide_database),
+        "tidal",
+        tmp_path / "export",
+        shard_by="month",
+        num_workers=2,
+        start_date=start,
+        end_date=end,
+    )
+    assert all(
+        to_epoch(start) <= shard["ts_min"] <= shard["ts_max"] <= to_epoch(end)
+        for shard in manifest["shards"]
+    )
+    assert_same(
+        TideExport(tmp_path / "export").query(),
+        tide_database.query_tides_columnar(None, start, end),
+    )
+
+
+def test_export_compacted(tmp_path, tide_database):
+    """archived months are exported with the others"""
+    enable_partitioning(tide_database.con, tide_database.partitions)
+    assert compact(tide_database.con, tide_database.partitions, 202404) == 1
+    export_tides(database_file(tide_database), "tidal", tmp_path / "export", num_workers=1)
+    assert_same(
+        TideExport(tmp_path / "export").query(),
+        tide_database.query_tides_columnar(None, START, END),
+    )
+
+
+def test_import_round_trip(tmp_path, tide_database, ports):
+    export_tides(database_file(tide_database), "tidal", tmp_path / "export", num_workers=1)
+    imported = TidalDatabase(tmp_path / "imported.db", "tidal")
+    imported.create_table()
+    try:
+        num_tides = sum(len(d.tides) for records in ports.values() for d in records)
+        assert import_tides(tmp_path / "export", imported, batch_size=2) == num_tides
+        for port_id, records in ports.items():
+            assert list(imported.query_tide(port_id, START, END)) == [
+                tide for daily in records for tide in daily.tides
+            ]
+            assert imported.get_location_by_port_id(port_id) == records[0].location
+        # imported again, nothing changes
+        assert import_tides(tmp_path / "export", imported) == 0
+    finally:
+        imported.close()
+
+
+def test_export_rejects_bad_options(tmp_path, tide_database):
+    with pytest.raises(ValueError):
+        export_tides(database_file(tide_database), "tidal", tmp_path, shard_by="day")
+    with pytest.raises(ValueError):
+        export_tides(database_file(tide_database), "tidal", tmp_path, fmt="csv")
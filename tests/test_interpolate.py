@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+from tidal.tide_dto import (AreaID, DailyTideRecord, PortID, Tide,
+                            TideLocation, TideType)
+from tidal.utils.epoch import to_epoch
+
+np = pytest.importorskip("numpy")
+from tidal.interpolate import CurveCache, TideCurve  # noqa: E402
+
+DAY = datetime.datetime(2024, 3, 1)
+PORT_ID = PortID("0001")
+# low 1 m at midnight, high 5 m at 6 am, low 1 m at noon
+TIDES = [
+    Tide(TideType.LOW, DAY, 1.0),
+    Tide(TideType.HIGH, DAY + datetime.timedelta(hours=6), 5.0),
+    Tide(TideType.LOW, DAY + datetime.timedelta(hours=12), 1.0),
+]
+
+
+def location(port_id: str) -> TideLocation:
+    return TideLocation("Test", f"Port {port_id}", AreaID("1"), PortID(port_id))
+
+
+def at(hours: float) -> datetime.datetime:
+    return DAY + datetime.timedelta(hours=hours)
+
+
+def test_cosine_heights():
+    curve = TideCurve.from_tides(PORT_ID, TIDES)
+    assert curve.height_at(PORT_ID, at(0)) == 1.0
+    assert curve.height_at(PORT_ID, at(3)) == pytest.approx(3.0)
+    assert curve.height_at(PORT_ID, at(6)) == 5.0
+    assert curve.height_at(PORT_ID, at(8)) == pytest.approx(4.0)
+    assert curve.height_at(PORT_ID, at(12)) == 1.0
+    # only known between the first and last extreme, and for known ports
+    assert np.isnan(curve.height_at(PORT_ID, at(-1)))
+    assert np.isnan(curve.height_at(PORT_ID, at(13)))
+    assert np.isnan(curve.height_at(PortID("9999"), at(3)))
+
+
+def test_rule_of_twelfths():
+    curve = TideCurve.from_tides(PORT_ID, TIDES, method="twelfths")
+    expected = [1.0, 1 + 4 / 12, 1 + 12 / 12, 3.0, 1 + 36 / 12, 1 + 44 / 12, 5.0]
+    ts, heights = curve.sample(PORT_ID, at(0), at(6), step=datetime.timedelta(hours=1))
+    assert len(ts) == 7
+    assert heights == pytest.approx(expected)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        TideCurve.from_tides(PORT_ID, TIDES, method="linear")
+
+
+def test_crossings_and_windows():
+    curve = TideCurve.from_tides(PORT_ID, TIDES)
+    port, ts, falling = curve.crossings(3.0)
+    assert list(ts) == [to_epoch(at(3)), to_epoch(at(9))]
+    assert list(falling) == [False, True]
+
+    # the cosine is at a quarter of the range a third of the way
+    assert curve.windows_below(2.0).for_port(PORT_ID) == [(at(0), at(2)), (at(10), at(12))]
+    assert curve.windows_above(2.0).for_port(PORT_ID) == [(at(2), at(10))]
+    assert curve.windows_below(0.5).for_port(PORT_ID) == []
+
+
+def test_ports_do_not_bleed_into_each_other(tide_database):
+    other = [
+        Tide(tide.type, tide.utc_datetime + datetime.timedelta(days=1), 2 * tide.height)
+        for tide in TIDES
+    ]
+    tide_database.insert_many(
+        [[DailyTideRecord(location("0001"), TIDES)], [DailyTideRecord(location("0002"), other)]]
+    )
+    curve = TideCurve(tide_database.query_tides_columnar(None, at(-24), at(48)))
+    # between the last tide of 0001 and the first of 0002
+    assert np.isnan(curve.height_at(PortID("0001"), at(18)))
+    assert np.isnan(curve.height_at(PortID("0002"), at(18)))
+    assert curve.height_at(PortID("0002"), at(27)) == pytest.approx(6.0)
+
+
+def test_curve_cache(tide_database):
+    tide_database.insert([DailyTideRecord(location("0001"), TIDES)])
+    cache = CurveCache(tide_database)
+    curve = cache.curve(PORT_ID, DAY.date())
+    assert cache.curve(PORT_ID, DAY.date()) is curve
+    ts, heights = cache.sample_day(PORT_ID, DAY.date(), num_points=24)
+    assert heights[3] == pytest.approx(3.0)
+    assert not heights.flags.writeable
+
+    # a write to the database drops what was cached
+    tide_database.insert(
+        [DailyTideRecord(location("0001"), [Tide(TideType.LOW, at(12), 0.5)])]
+    )
+    assert cache.curve(PORT_ID, DAY.date()) is not curve
+    assert cache.sample_day(PORT_ID, DAY.date(), num_points=24)[1][12] == 0.5
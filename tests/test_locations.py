@@ -0,0 +1,122 @@
+import random
+from typing import Dict, List
+
+import pytest
+
+from tidal.locations import Coordinates, LocationSearch, distance_km, load_coordinates
+from tidal.tide_dto import AreaID, PortID, TideLocation
+
+NAMES = [
+    "Aberdeen",
+    "Aberdaron",
+    "Aberystwyth",
+    "Dover",
+    "Port Talbot",
+    "Portsmouth",
+    "Portland Bill",
+    "St Ives",
+    "St Mary's, Isles of Scilly",
+    "Newport",
+]
+
+
+def location(i: int, name: str) -> TideLocation:
+    return TideLocation("Region", name, AreaID(str(i % 7)), PortID(str(i)))
+
+
+@pytest.fixture
+def locations() -> List[TideLocation]:
+    return [location(i, name) for i, name in enumerate(NAMES)] + [
+        location(i, f"Port {i}") for i in range(len(NAMES), 500)
+    ]
+
+
+@pytest.fixture
+def coordinates(locations) -> Dict[PortID, Coordinates]:
+    """anywhere on earth, poles and antimeridian included, for all but a few ports"""
+    rng = random.Random(7)
+    coordinates = {
+        location.port_id: Coordinates(rng.uniform(-90, 90), rng.uniform(-180, 180))
+        for location in locations[:-5]
+    }
+    coordinates[locations[0].port_id] = Coordinates(89.9, 179.9)
+    coordinates[locations[1].port_id] = Coordinates(89.9, -179.9)
+    return coordinates
+
+
+@pytest.fixture
+def search(locations, coordinates) -> LocationSearch:
+    return LocationSearch(locations, coordinates)
+
+
+def by_distance(locations, coordinates, point: Coordinates) -> List[tuple]:
+    """(distance, port_id) of every port with coordinates, nearest first"""
+    return sorted(
+        (distance_km(point, coordinates[location.port_id]), location.port_id)
+        for location in locations
+        if location.port_id in coordinates
+    )
+
+
+@pytest.mark.parametrize("point", [(51.5, -0.1), (-33.9, 151.2), (89.9, 180.0), (0.0, -179.99)])
+def test_nearest(search, locations, coordinates, point):
+    expected = by_distance(locations, coordinates, Coordinates(*point))[:7]
+    found = search.nearest(*point, n=7)
+    assert [location.port_id for location, _ in found] == [port_id for _, port_id in expected]
+    assert [km for _, km in found] == pytest.approx([km for km, _ in expected])
+
+
+def test_nearest_across_antimeridian(search, locations):
+    # the two ports a few kilometres apart either side of it
+    (first, km), (second, _) = search.nearest(89.9, 179.9, n=2)
+    assert {first.port_id, second.port_id} == {locations[0].port_id, locations[1].port_id}
+    assert km == pytest.approx(0.0, abs=1e-6)
+    assert search.nearest(0.0, 0.0, n=0) == []
+
+
+@pytest.mark.parametrize("radius_km", [0.0, 500.0, 2500.0, 20100.0])
+def test_within(search, locations, coordinates, radius_km):
+    point = Coordinates(50.0, -4.0)
+    expected = [
+        port_id
+        for km, port_id in by_distance(locations, coordinates, point)
+        if km <= radius_km
+    ]
+    found = search.within(*point, radius_km)
+    assert [location.port_id for location, _ in found] == expected
+    assert all(km <= radius_km + 1e-6 for _, km in found)
+
+
+def test_search_prefix(search):
+    # every word a prefix of a word of the name, shortest name first
+    assert [location.name for location in search.search("aber", limit=3)] == [
+        "Aberdeen",
+        "Aberdaron",
+        "Aberystwyth",
+    ]
+    assert [location.name for location in search.search("st i", limit=2)] == [
+        "St Ives",
+        "St Mary's, Isles of Scilly",
+    ]
+    assert search.search("PORTS")[0].name == "Portsmouth"
+    assert search.search("  ,, ") == []
+
+
+def test_search_fuzzy(search):
+    # misspelt, so no prefix matches: found by their trigrams
+    assert search.search("Abredeen", limit=1)[0].name == "Aberdeen"
+    assert search.search("Portsmuth", limit=1)[0].name == "Portsmouth"
+    assert search.search("xyzzy") == []
+    # prefix matches fill the limit before any fuzzy one
+    assert len(search.search("port", limit=3)) == 3
+
+
+def test_load_coordinates(tmp_path):
+    csv_file = tmp_path / "coordinates.csv"
+    csv_file.write_text("port_id,latitude,longitude\n1,50.5,-4.25\n", "utf-8")
+    assert load_coordinates(csv_file) == {"1": Coordinates(50.5, -4.25)}
+
+    jsonl_file = tmp_path / "coordinates.jsonl"
+    jsonl_file.write_text('{"port_id": 2, "latitude": 95, "longitude": 0}\n', "utf-8")
+    with pytest.raises(ValueError):
+        load_coordinates(jsonl_file)
@@ -0,0 +1,72 @@
+import datetime
+import sqlite3
+import subprocess
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from tidal.db import TidalDatabase
+from tidal.schema import LEDGER_TABLE_NAME
+
+
+@pytest.fixture
+def database_file(tmp_path: Path, fake_records) -> Path:
+    """a database with the next few days of tides of a few fake ports"""
+    database_file = tmp_path / "tidal.db"
+    tide_database = TidalDatabase(database_file, "tidal")
+    tide_database.create_table()
+    today = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time())
+    tide_database.insert_many(fake_records(3, today, 4).values())
+    tide_database.close()
+    return database_file
+
+
+@pytest.fixture
+def notify(run_script, write_config) -> Callable[[Path, str], subprocess.CompletedProcess]:
+    """runs notify.py over `database_file`, posting to `webhook`"""
+
+    def run(database_file: Path, webhook: str) -> subprocess.CompletedProcess:
+        config_file = write_config(
+            database_file.parent / "notify.cfg",
+            DATABASE_NAME=str(database_file),
+            DATABASE_TIDE_TABLE_NAME="tidal",
+            WEBHOOK=webhook,
+            WEBHOOK_RATE_PER_SEC="100",
+            WEBHOOK_BURST="100",
+        )
+        # every low tide of the next two days is an alert
+        return run_script("notify.py", "-c", str(config_file), "-t", "100", "-d", "2")
+
+    return run
+
+
+def num_recorded(database_file: Path) -> int:
+    con = sqlite3.connect(database_file)
+    (count,) = con.execute(f"SELECT COUNT(*) FROM {LEDGER_TABLE_NAME}").fetchone()
+    con.close()
+    return count
+
+
+def test_notify_without_webhook(notify, database_file):
+    result = notify(database_file, "")
+    assert result.returncode != 0
+    assert "no WEBHOOK" in result.stderr
+    # nothing was sent, so nothing is recorded as delivered
+    assert num_recorded(database_file) == 0
+
+
+def test_notify_every_webhook(notify, database_file, webhooks):
+    result = notify(database_file, ", ".join(webhook.url for webhook in webhooks))
+    assert result.returncode == 0, result.stderr
+    num_messages = len(webhooks[0].received)
+    assert num_messages > 0
+    # the same messages to each of them
+    for webhook in webhooks[1:]:
+        assert sorted(webhook.received) == sorted(webhooks[0].received)
+    assert num_recorded(database_file) > 0
+
+    # delivered everywhere, so not sent again
+    result = notify(database_file, ", ".join(webhook.url for webhook in webhooks))
+    assert result.returncode == 0, result.stderr
+    assert [len(webhook.received) for webhook in webhooks] == [num_messages] * len(webhooks)
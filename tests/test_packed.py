@@ -0,0 +1,55 @@
+import datetime
+import io
+import pickle
+
+import pytest
+
+from tidal.packed import RECORD, PackedArchive, decode_tides, encode_tides, write_archive
+from tidal.tide_dto import freeze
+
+START = datetime.datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def records(fake_records):
+    return [daily for records in fake_records(3, START, 2).values() for daily in records]
+
+
+def test_encode_decode(records):
+    locations = list({daily.location.port_id: daily.location for daily in records}.values())
+    port_index = {location.port_id: i for i, location in enumerate(locations)}
+    buffer = encode_tides(records, port_index)
+    assert len(buffer) == RECORD.size * sum(len(daily.tides) for daily in records)
+    # heights come back as written, not as float32
+    assert decode_tides(buffer, locations) == [freeze(daily) for daily in records]
+
+
+def test_decoded_locations_are_shared(records):
+    locations = [records[0].location]
+    decoded = decode_tides(encode_tides(records[:2], {locations[0].port_id: 0}), locations)
+    assert decoded[0].location is decoded[1].location
+    assert pickle.loads(pickle.dumps(decoded))[0].location is decoded[0].location
+
+
+def test_archive(tmp_path, records):
+    path = tmp_path / "tides.tidp"
+    with open(path, "wb") as f:
+        assert write_archive(f, records, chunk_size=2) == sum(len(d.tides) for d in records)
+    with PackedArchive(path) as archive:
+        assert len(archive) == sum(len(daily.tides) for daily in records)
+        assert archive.decode() == [freeze(daily) for daily in records]
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "tides.tidp"
+    buffer = io.BytesIO()
+    write_archive(buffer, [])
+    path.write_bytes(b"NOPE" + buffer.getvalue()[4:])
+    with pytest.raises(ValueError):
+        PackedArchive(path)
+
+
+def test_packed_does_not_import_the_database(run_script):
+    # it is imported by every pool worker
+    result = run_script("-c", "import sys, tidal.packed; print('tidal.db' in sys.modules)")
+    assert result.stdout.strip() == "False", result.stderr
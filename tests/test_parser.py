@@ -0,0 +1,60 @@
+import pytest
+
+from tidal.metrics import Metrics
+from tidal.parser import extract_tide_tables, parse_time
+from tidal.providers.bbc import BBCProvider
+from tidal.tide_dto import AreaID, PortID, TideLocation
+
+LOCATION = TideLocation("Test", "Test port", AreaID("1"), PortID("0001"))
+
+
+def test_extract_tide_tables(bbc_pages):
+    for html in bbc_pages.values():
+        tables = extract_tide_tables(html)
+        assert tables
+        for table in tables:
+            assert table.caption
+            assert table.rows
+            assert {tide_type for tide_type, _, _ in table.rows} <= {"High", "Low"}
+
+
+def test_extract_skips_other_and_nested_tables():
+    html = (
+        "<table><tr><td>not a tide</td></tr></table>"
+        '<table class="x wr-c-tide-extremes"><caption> Monday </caption>'
+        "<tr><th>Tide</th><th>Time (BST)</th><th>Height</th></tr>"
+        "<tr><td>Low</td><td>01:02</td><td>0.5</td></tr>"
+        "<tr><td>High<table><tr><td>nested</td></tr></table></td>"
+        "<td>07:08</td><td>4.5</td></tr>"
+        "</table>"
+    )
+    (table,) = extract_tide_tables(html)
+    assert table.caption == "Monday"
+    assert table.time_header == "Time (BST)"
+    assert [row[1:] for row in table.rows] == [("01:02", "0.5"), ("07:08", "4.5")]
+
+
+def test_fast_parser_matches_bs4(bbc_pages):
+    fast = BBCProvider("http://test/", parser="fast")
+    bs4 = BBCProvider("http://test/", parser="bs4")
+    for name, html in bbc_pages.items():
+        metrics = Metrics()
+        records = fast.parse(html, LOCATION, metrics)
+        assert records == bs4.parse(html, LOCATION, Metrics()), name
+        assert sum(len(record.tides) for record in records) > 0
+        assert metrics.counter("parser_fallback_total") == 0
+
+
+def test_fast_parser_falls_back_to_bs4():
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        BBCProvider("http://test/").parse("<html><body>moved</body></html>", LOCATION, metrics)
+    assert metrics.counter("parser_fallback_total") == 1
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [("09:12", (9, 12)), (" 23:59 BST ", (23, 59)), ("24:00", None), ("12:60", None), ("", None)],
+)
+def test_parse_time(text, expected):
+    assert parse_time(text) == expected
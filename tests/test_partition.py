@@ -0,0 +1,170 @@
+import datetime
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+import tidal.partition
+from tidal.partition import (compact, drop_before, enable_partitioning, month_bounds,
+                             partition_table_name, read_archive, write_archive)
+from tidal.schema import LOCATION_TABLE_NAME, PARTITION_TABLE_NAME, TIDE_TYPE_CODES
+from tidal.tide_dto import DailyTideRecord, Tide
+from tidal.utils.epoch import to_epoch
+
+START = datetime.datetime(2024, 3, 1)
+APRIL = datetime.datetime(2024, 4, 1)
+END = datetime.datetime(2024, 5, 1)
+
+
+@pytest.fixture
+def ports(fake_records) -> Dict[str, List[DailyTideRecord]]:
+    """tides of March and April 2024"""
+    return fake_records(3, START, (END - START).days)
+
+
+@pytest.fixture
+def partitioned(tide_database, ports):
+    """`tide_database` holding `ports`, partitioned by month"""
+    tide_database.insert_many(ports.values())
+    enable_partitioning(tide_database.con, tide_database.partitions)
+    return tide_database
+
+
+def stored(tide_database, port_id: str) -> List[Tide]:
+    return list(tide_database.query_tide(port_id, START, END))
+
+
+def expected(ports, port_id: str) -> List[Tide]:
+    return [tide for daily in ports[port_id] for tide in daily.tides]
+
+
+def archives(tmp_path: Path) -> List[str]:
+    """archive files of the test database, relative to its directory"""
+    return sorted(str(path.relative_to(tmp_path)) for path in tmp_path.glob("tidal.db.archive/*"))
+
+
+def test_archive_round_trip(tmp_path):
+    rows = [("A", 100, 0, 1.25), ("A", 160, 1, -0.5), ("B", 50, 1, 3.001)]
+    assert write_archive(tmp_path / "a.tidc", rows) == len(rows)
+    assert read_archive(tmp_path / "a.tidc") == rows
+    assert [path.name for path in tmp_path.iterdir()] == ["a.tidc"]
+
+
+def test_enable_partitioning_moves_rows(tide_database, ports):
+    num_tides = tide_database.insert_many(ports.values())
+    assert enable_partitioning(tide_database.con, tide_database.partitions) == num_tides
+    assert [p.month for p in tide_database.partitions.partitions(tide_database.con)] == [
+        202403,
+        202404,
+    ]
+    (left,) = tide_database.con.execute("SELECT COUNT(*) FROM tidal").fetchone()
+    assert left == 0
+    for port_id in ports:
+        assert stored(tide_database, port_id) == expected(ports, port_id)
+
+
+def test_compact(tmp_path, partitioned, ports):
+    con, catalog = partitioned.con, partitioned.partitions
+    assert compact(con, catalog, 202404) == 1
+    march, april = catalog.partitions(con)
+    assert march.table is None and march.archive is not None
+    assert april.table is not None and april.archive is None
+    assert archives(tmp_path) == [march.archive]
+    for port_id in ports:
+        assert stored(partitioned, port_id) == expected(ports, port_id)
+    # nothing left to compact
+    assert compact(con, catalog, 202404) == 0
+
+
+def test_compact_written_again(tmp_path, partitioned, ports):
+    con, catalog = partitioned.con, partitioned.partitions
+    compact(con, catalog, 202404)
+    # a height changed after March was compacted
+    port_id = next(iter(ports))
+    tide = ports[port_id][0].tides[0]
+    ports[port_id][0].tides[0] = Tide(tide.type, tide.utc_datetime, tide.height + 0.5)
+    # the month's table is new, so the whole day is written to it
+    assert partitioned.insert(ports[port_id][:1]) == len(ports[port_id][0].tides)
+    assert catalog.partitions(con)[0].table is not None
+    assert stored(partitioned, port_id) == expected(ports, port_id)
+
+    # merged into a new archive, the old one is removed
+    assert compact(con, catalog, 202404) == 1
+    march = catalog.partitions(con)[0]
+    assert march.table is None
+    assert archives(tmp_path) == [march.archive]
+    assert stored(partitioned, port_id) == expected(ports, port_id)
+
+
+def test_failed_compact_leaves_no_archive(tmp_path, partitioned, ports, monkeypatch):
+    con, catalog = partitioned.con, partitioned.partitions
+
+    def fail(con):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(tidal.partition, "_bump_data_version", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        compact(con, catalog, 202404)
+    assert archives(tmp_path) == []
+    # rolled back: March is still in its table
+    assert catalog.partitions(con)[0].table == partition_table_name("tidal", 202403)
+    for port_id in ports:
+        assert stored(partitioned, port_id) == expected(ports, port_id)
+
+
+def test_compact_waits_for_writers(partitioned, ports):
+    """a tide written while compaction starts is archived, not dropped"""
+    con, catalog = partitioned.con, partitioned.partitions
+    database_file = con.execute("PRAGMA database_list").fetchone()[2]
+    port_id = next(iter(ports))
+    (port_key,) = con.execute(
+        f"SELECT port_key FROM {LOCATION_TABLE_NAME} WHERE port_id = ?", (port_id,)
+    ).fetchone()
+    tide = ports[port_id][0].tides[0]
+    when = START + datetime.timedelta(seconds=1)
+    locked, done = threading.Event(), threading.Event()
+
+    def write():
+        writer = sqlite3.connect(database_file, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute(
+            f"INSERT INTO {partition_table_name('tidal', 202403)} "
+            f"(port_key, ts, tide_type, height, version) VALUES (?,?,?,?,?)",
+            (port_key, to_epoch(when), TIDE_TYPE_CODES[tide.type], 9.0, 1),
+        )
+        locked.set()
+        done.wait(0.5)
+        writer.execute("COMMIT")
+        writer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    locked.wait()
+    try:
+        assert compact(con, catalog, 202404) == 1
+    finally:
+        done.set()
+        thread.join()
+    assert Tide(tide.type, when, 9.0) in stored(partitioned, port_id)
+
+
+def test_drop_before(tmp_path, partitioned, ports):
+    con, catalog = partitioned.con, partitioned.partitions
+    compact(con, catalog, 202404)
+    assert drop_before(con, catalog, 202404) == 1
+    assert [p.month for p in catalog.partitions(con)] == [202404]
+    assert archives(tmp_path) == []
+    (num_rows,) = con.execute(
+        f"SELECT COUNT(*) FROM {PARTITION_TABLE_NAME} WHERE month = 202403"
+    ).fetchone()
+    assert num_rows == 0
+    (first_day,) = con.execute(
+        f"SELECT MIN(day) FROM {partitioned.stats.daily_table}"
+    ).fetchone()
+    assert first_day == month_bounds(202404)[0] // 86400
+    for port_id in ports:
+        assert stored(partitioned, port_id) == [
+            tide for tide in expected(ports, port_id) if tide.utc_datetime >= APRIL
+        ]
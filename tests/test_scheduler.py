@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+from tidal.scheduler import AIMDLimiter, FetchHistory, PortHistory, SweepScheduler
+from tidal.scraper import FetchResult
+from tidal.tide_dto import AreaID, DailyTideRecord, PortID, TideLocation
+
+
+def location(port_id: str) -> TideLocation:
+    return TideLocation("Test", f"Port {port_id}", AreaID("1"), PortID(port_id))
+
+
+def fetched(location: TideLocation, latency: float = 0.05) -> FetchResult:
+    return FetchResult(location, [DailyTideRecord(location, [])], 200, latency)
+
+
+def failed(location: TideLocation, transient: bool = True) -> FetchResult:
+    return FetchResult(location, None, 503 if transient else 404, 0.05, transient=transient)
+
+
+@pytest.fixture
+def history(tide_database) -> FetchHistory:
+    return FetchHistory(tide_database.con)
+
+
+def test_limiter_slow_start_then_additive_increase():
+    limiter = AIMDLimiter(maximum=64, initial=2)
+    # a round of 2 successes doubles it
+    for _ in range(2):
+        limiter.on_success(0.05, now=0.0)
+    assert limiter.concurrency == 4
+    limiter.on_congestion(now=1.0)
+    assert limiter.concurrency == 2
+    assert not limiter.slow_start
+    # then one more per round
+    for _ in range(2):
+        limiter.on_success(0.05, now=2.0)
+    assert limiter.concurrency == 2
+    limiter.on_success(0.05, now=2.0)
+    assert limiter.concurrency == 3
+
+
+def test_limiter_backs_off_once_per_round_trip():
+    limiter = AIMDLimiter(maximum=64, initial=16)
+    limiter.on_success(1.0, now=0.0)
+    limiter.on_congestion(now=10.0)
+    # every request in flight then sees the same congestion
+    limiter.on_congestion(now=10.5)
+    assert limiter.concurrency == 8
+    limiter.on_congestion(now=11.5)
+    assert limiter.concurrency == 4
+
+
+def test_limiter_backs_off_on_latency():
+    limiter = AIMDLimiter(maximum=64, initial=8, latency_floor=0.1)
+    limiter.on_success(0.2, now=0.0)
+    limiter.on_success(3.0, now=1.0)
+    limiter.on_success(3.0, now=5.0)
+    assert limiter.concurrency < 8
+
+    # a fast host's jitter is not congestion
+    limiter = AIMDLimiter(maximum=64, initial=8, latency_floor=0.1)
+    limiter.on_success(0.001, now=0.0)
+    limiter.on_success(0.05, now=1.0)
+    assert limiter.concurrency == 10
+
+
+def test_limiter_bounds():
+    limiter = AIMDLimiter(maximum=3, minimum=2, initial=2)
+    for _ in range(10):
+        limiter.on_success(0.05, now=0.0)
+    assert limiter.concurrency == 3
+    for now in range(10):
+        limiter.on_congestion(now=float(now))
+    assert limiter.concurrency == 2
+
+
+def test_order(history):
+    stale, failing, fresh, new = (location(port_id) for port_id in "abcd")
+    now = time.time()
+    history.save(
+        [
+            PortHistory(stale.port_id, fetched_at=now - 7200, latency=0.1, change_rate=0.5),
+            PortHistory(failing.port_id, fetched_at=now - 7200, latency=0.1, failures=1),
+            PortHistory(fresh.port_id, fetched_at=now - 60, latency=0.1, change_rate=0.5),
+        ]
+    )
+    scheduler = SweepScheduler(history, AIMDLimiter(maximum=4, initial=4))
+    scheduler.plan([failing, fresh, stale, new])
+    # never fetched first, failed last, the most stale first in between
+    assert [scheduler.next_location() for _ in range(4)] == [new, stale, fresh, failing]
+
+
+def test_transient_failures_are_retried(history):
+    port = location("a")
+    scheduler = SweepScheduler(
+        history, AIMDLimiter(maximum=4, initial=4), max_attempts=3, retry_delay=2.0
+    )
+    scheduler.plan([port])
+    now = time.monotonic()
+    assert scheduler.next_location(now) == port
+    assert not scheduler.done(failed(port), now)
+    assert scheduler.wait_time(now) == pytest.approx(2.0)
+    assert scheduler.next_location(now + 1.0) is None
+    assert scheduler.next_location(now + 2.0) == port
+    assert not scheduler.done(failed(port), now + 2.0)
+    # the delay doubles, and the last attempt is final
+    assert scheduler.next_location(now + 5.0) is None
+    assert scheduler.next_location(now + 6.0) == port
+    assert scheduler.done(failed(port), now + 6.0)
+    assert scheduler.finished
+    assert scheduler.metrics.counter("scheduler_requeued_total") == 2
+
+
+def test_failing_ports_are_deferred(history):
+    port = location("a")
+    for _ in range(2):
+        scheduler = SweepScheduler(history, AIMDLimiter(maximum=1), max_failures=2)
+        assert scheduler.plan([port]) == []
+        scheduler.next_location()
+        scheduler.done(failed(port, transient=False))
+        scheduler.save()
+
+    scheduler = SweepScheduler(history, AIMDLimiter(maximum=1), max_failures=2)
+    assert scheduler.plan([port]) == [port]
+    assert scheduler.finished
+    # unless asked for
+    scheduler.plan([port], include_deferred=True)
+    assert scheduler.next_location() == port
+    scheduler.done(fetched(port))
+    scheduler.save()
+    assert FetchHistory(history.con).load()[port.port_id].not_before is None
+
+
+def test_host_limiters(history):
+    ports = [location(f"{host}{i}") for host in "ab" for i in range(4)]
+    scheduler = SweepScheduler(
+        history,
+        AIMDLimiter(maximum=4, initial=4),
+        host_of=lambda location: location.port_id[0],
+        host_limiters={"a": AIMDLimiter(maximum=1), "b": AIMDLimiter(maximum=2, initial=2)},
+    )
+    scheduler.plan(ports)
+    started = []
+    while True:
+        next_location = scheduler.next_location()
+        if next_location is None:
+            break
+        started.append(next_location.port_id[0])
+    # each host within its own limit, the overall one not reached
+    assert sorted(started) == ["a", "b", "b"]
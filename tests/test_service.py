@@ -0,0 +1,157 @@
+import datetime
+import gzip
+import http.client
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+from tidal.db import TidalDatabase
+from tidal.reader import TidalReader
+from tidal.service import GZIP_MIN_BYTES, TideServer, TideService, tide_json
+from tidal.tide_dto import DailyTideRecord, Tide, TideType
+
+TODAY = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time())
+DAY = datetime.timedelta(days=1)
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+@pytest.fixture
+def ports(fake_records) -> Dict[str, List[DailyTideRecord]]:
+    """tides of a few fake ports, from yesterday to a week ahead"""
+    return fake_records(3, TODAY - DAY, 9)
+
+
+@pytest.fixture
+def database_file(tmp_path: Path, ports) -> Path:
+    database_file = tmp_path / "tidal.db"
+    tide_database = TidalDatabase(database_file, "tidal")
+    tide_database.create_table()
+    tide_database.insert_many(ports.values())
+    tide_database.close()
+    return database_file
+
+
+@pytest.fixture
+def service(database_file: Path) -> Iterator[TideService]:
+    """checks the data_version on every request"""
+    reader = TidalReader(database_file, "tidal")
+    yield TideService(reader, refresh_interval=0)
+    reader.close()
+
+
+@pytest.fixture
+def server(service: TideService) -> Iterator[TideServer]:
+    server = TideServer(("127.0.0.1", 0), service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(
+    server: TideServer, path: str, headers: Optional[Dict[str, str]] = None
+) -> Tuple[int, Dict[str, str], bytes]:
+    """status, headers and body of GET `path`"""
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    try:
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def expected(ports, port_id: str, start: datetime.datetime, end: datetime.datetime) -> List[dict]:
+    return [
+        tide_json(tide)
+        for daily in ports[port_id]
+        for tide in daily.tides
+        if start <= tide.utc_datetime <= end
+    ]
+
+
+def test_hot_window(service, ports):
+    port_id = next(iter(ports))
+    today = expected(ports, port_id, TODAY, TODAY + DAY)
+    assert service.tides(port_id, TODAY, TODAY + DAY) == today
+    assert service.metrics.counter("hot_window_total", result="hit") == 1
+    assert service.tides("fake:unknown", TODAY, TODAY + DAY) == []
+
+    # outside the window, read from the database
+    start = TODAY - 30 * DAY
+    assert service.tides(port_id, start, TODAY) == expected(ports, port_id, start, TODAY)
+    assert service.metrics.counter("hot_window_total", result="miss") == 1
+
+
+def test_hot_window_follows_writes(service, database_file, ports):
+    port_id = next(iter(ports))
+    version = service.data_version()
+    records = ports[port_id][1:2]
+    tide = records[0].tides[0]
+    records[0].tides[0] = Tide(tide.type, tide.utc_datetime, tide.height + 0.5)
+    tide_database = TidalDatabase(database_file, "tidal")
+    tide_database.insert(records)
+    tide_database.close()
+
+    assert service.data_version() == version + 1
+    today = expected(ports, port_id, TODAY, TODAY + DAY)
+    assert service.tides(port_id, TODAY, TODAY + DAY) == today
+
+
+def test_next_tides(service, ports):
+    port_id = next(iter(ports))
+    tides = expected(ports, port_id, TODAY - DAY, TODAY + 8 * DAY)
+    after = datetime.datetime.fromisoformat(tides[2]["utc_datetime"])
+    assert service.next_tides(port_id, after, count=2) == tides[3:5]
+    lows = [tide for tide in tides[3:] if tide["type"] == TideType.LOW.value]
+    assert service.next_tides(port_id, after, TideType.LOW, count=3) == lows[:3]
+    # past the end of the window, and of the tides
+    assert service.next_tides(port_id, TODAY + 30 * DAY) == []
+
+
+def test_etag(server, ports):
+    port_id = next(iter(ports))
+    status, headers, body = get(server, f"/tides/{port_id}")
+    assert status == 200
+    assert json.loads(body) == expected(ports, port_id, TODAY, TODAY + DAY)
+    etag = headers["ETag"]
+
+    status, headers, body = get(server, f"/tides/{port_id}", {"If-None-Match": etag})
+    assert (status, body) == (304, b"")
+    assert headers["ETag"] == etag
+    # another window, another tag
+    status, headers, _ = get(server, f"/tides/{port_id}?start={TODAY.date() + DAY}")
+    assert status == 200 and headers["ETag"] != etag
+
+
+def test_gzip(server, ports):
+    path = f"/tides?port_id={','.join(ports)}&end={(TODAY + 7 * DAY).date()}"
+    status, headers, body = get(server, path)
+    assert status == 200 and "Content-Encoding" not in headers
+    assert len(body) >= GZIP_MIN_BYTES
+
+    status, gzipped_headers, gzipped = get(server, path, GZIP)
+    assert status == 200
+    assert gzipped_headers["Content-Encoding"] == "gzip"
+    assert gzipped_headers["ETag"] == headers["ETag"]
+    assert gzip.decompress(gzipped) == body
+    # compressed once, then served from the cache
+    assert get(server, path, GZIP)[2] == gzipped
+    assert len(server._gzip_cache) == 1
+
+    # too small to be worth it
+    port_id = next(iter(ports))
+    status, headers, _ = get(server, f"/locations/{port_id}", GZIP)
+    assert status == 200 and "Content-Encoding" not in headers
+
+
+def test_errors(server, ports):
+    assert get(server, "/tides/fake:unknown")[0] == 404
+    assert get(server, "/nowhere")[0] == 404
+    port_id = next(iter(ports))
+    status, _, body = get(server, f"/tides/{port_id}?start=tomorrow")
+    assert status == 400 and b"start" in body
+    assert get(server, f"/next/{port_id}?type=middle")[0] == 400
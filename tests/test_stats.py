@@ -0,0 +1,132 @@
+import datetime
+import math
+from typing import Dict, List
+
+import pytest
+
+from tidal.partition import compact, enable_partitioning
+from tidal.stats import (MIN_RANKED_DAYS, NEAP_RANK, RANK_WINDOW_DAYS, SPRING_RANK, DayStats,
+                         day_number, from_day_number, rank_days)
+from tidal.tide_dto import DailyTideRecord, TidePhase, TideType
+
+START = datetime.datetime(2024, 3, 1)
+NUM_DAYS = 45
+FIRST_DAY, LAST_DAY = START.date(), START.date() + datetime.timedelta(days=NUM_DAYS - 1)
+
+
+@pytest.fixture
+def ports(fake_records) -> Dict[str, List[DailyTideRecord]]:
+    """three spring/neap cycles of a few ports"""
+    return fake_records(3, START, NUM_DAYS)
+
+
+@pytest.fixture
+def tide_database(tide_database, ports):
+    tide_database.insert_many(ports.values())
+    return tide_database
+
+
+def all_days(tide_database) -> List[DayStats]:
+    return tide_database.stats.days(tide_database.con, FIRST_DAY, LAST_DAY)
+
+
+def test_day_number():
+    assert day_number(datetime.date(1970, 1, 2)) == 1
+    assert from_day_number(day_number(LAST_DAY)) == LAST_DAY
+
+
+def test_rank_days():
+    # the range peaks every 14 days, at days 0, 14, 28 ...
+    days = list(range(42))
+    ranges = [2 + math.cos(2 * math.pi * day / 14) for day in days]
+    ranked = {day: (rank, phase) for day, rank, phase in rank_days(days, ranges, 0, 41)}
+    assert list(ranked) == days
+    assert ranked[14] == (1.0, TidePhase.SPRING.value)
+    assert ranked[21] == (0.0, TidePhase.NEAP.value)
+    assert ranked[17][1] is None
+    # at the edges, too few days around to rank
+    assert ranked[0] == (1.0, TidePhase.SPRING.value)
+    few = days[: MIN_RANKED_DAYS - 1]
+    assert [rank for _, rank, _ in rank_days(few, ranges, 0, 41)] == [None] * len(few)
+    # only the days asked for
+    assert [day for day, _, _ in rank_days(days, ranges, 10, 12)] == [10, 11, 12]
+
+
+def test_daily_aggregates(tide_database, ports):
+    stats = {(day.port_id, day.day): day for day in all_days(tide_database)}
+    for port_id, records in ports.items():
+        for daily in records:
+            lows = [tide.height for tide in daily.tides if tide.type == TideType.LOW]
+            highs = [tide.height for tide in daily.tides if tide.type == TideType.HIGH]
+            day = stats[(port_id, daily.tides[0].utc_datetime.date())]
+            assert day.num_tides == len(daily.tides)
+            assert (day.min_low, day.max_high) == (min(lows), max(highs))
+            assert day.tidal_range == pytest.approx(max(highs) - min(lows))
+
+
+def test_spring_and_neap(tide_database, ports):
+    for port_id in ports:
+        days = [day for day in all_days(tide_database) if day.port_id == port_id]
+        # a window clear of the edges holds one spring and one neap
+        middle = days[RANK_WINDOW_DAYS: NUM_DAYS - RANK_WINDOW_DAYS]
+        spring = max(middle, key=lambda day: day.tidal_range)
+        neap = min(middle, key=lambda day: day.tidal_range)
+        # days with an equal range share the top (bottom) rank
+        assert spring.phase == TidePhase.SPRING and spring.range_rank >= SPRING_RANK
+        assert neap.phase == TidePhase.NEAP and neap.range_rank <= NEAP_RANK
+        assert {day.phase for day in middle} == {TidePhase.SPRING, TidePhase.NEAP, None}
+
+
+def test_incremental_update_matches_rebuild(tide_database, fake_records):
+    """days written later rank, and re-rank, the days before them"""
+    ports = fake_records(3, START, NUM_DAYS)
+    split = START + datetime.timedelta(days=20)
+    # written again from empty, in two halves
+    tide_database.drop_table()
+    tide_database.create_table()
+    for records in ports.values():
+        tide_database.insert([d for d in records if d.tides[0].utc_datetime < split])
+    for records in ports.values():
+        tide_database.insert([d for d in records if d.tides[0].utc_datetime >= split])
+    updated = all_days(tide_database)
+
+    with tide_database.con:
+        tide_database.stats.rebuild(tide_database.con, tide_database.partitions)
+    assert all_days(tide_database) == updated
+
+
+def test_rebuild_from_archives(tide_database):
+    before = all_days(tide_database)
+    enable_partitioning(tide_database.con, tide_database.partitions)
+    compact(tide_database.con, tide_database.partitions, 202404)
+    with tide_database.con:
+        num_days = tide_database.stats.rebuild(tide_database.con, tide_database.partitions)
+    assert num_days == len(before)
+    assert all_days(tide_database) == before
+
+
+def test_queries(tide_database, ports):
+    con, stats = tide_database.con, tide_database.stats
+    days = all_days(tide_database)
+    port_id = next(iter(ports))
+
+    low = sorted(day.min_low for day in days)[len(days) // 4]
+    assert stats.matching_days(con, FIRST_DAY, LAST_DAY, low_at_most=low) == [
+        day for day in days if day.min_low <= low
+    ]
+    assert stats.matching_days(con, FIRST_DAY, LAST_DAY, [port_id], phase=TidePhase.NEAP) == [
+        day for day in days if day.port_id == port_id and day.phase == TidePhase.NEAP
+    ]
+
+    best = stats.best_days(con, FIRST_DAY, LAST_DAY, by="range")
+    assert [day.port_id for day in best] == sorted(ports)
+    for day in best:
+        assert day.tidal_range == max(d.tidal_range for d in days if d.port_id == day.port_id)
+    with pytest.raises(ValueError):
+        stats.best_days(con, FIRST_DAY, LAST_DAY, by="prettiest")
+
+    wanted = [(day.port_id, day.day) for day in days]
+    assert stats.phases(con, wanted) == {
+        (day.port_id, day.day): day.phase for day in days if day.phase is not None
+    }
+    assert stats.phases(con, []) == {}
@@ -0,0 +1,52 @@
+import gzip
+
+import pytest
+
+from tidal.tide_dto import AreaID, PortID, TideLocation
+from tidal.utils.serialization import SERIALIZERS
+from tidal.utils.store import JSONStore, iter_gzip_lines
+
+LOCATIONS = [
+    TideLocation(f"Région {i % 3}", f"Port {i}", AreaID(str(i % 10)), PortID(f"{i:04d}"))
+    for i in range(50)
+]
+
+
+@pytest.mark.parametrize("serializer", sorted(SERIALIZERS))
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_lines_round_trip(tmp_path, serializer, suffix):
+    path = tmp_path / f"locations{suffix}"
+    assert JSONStore.save_lines(LOCATIONS, path, serializer=serializer, batch_size=7) == 50
+    for threaded_gzip in (True, False):
+        loaded = JSONStore.load_lines(
+            path, TideLocation, serializer=serializer, batch_size=7, threaded_gzip=threaded_gzip
+        )
+        assert list(loaded) == LOCATIONS
+
+
+def test_serializers_write_the_same_json(tmp_path):
+    written = set()
+    for serializer in SERIALIZERS:
+        path = tmp_path / f"{serializer}.jsonl"
+        JSONStore.save_lines(LOCATIONS, path, serializer=serializer)
+        written.add(path.read_bytes())
+    assert len(written) == 1
+
+
+def test_gzip_lines_of_concatenated_members(tmp_path):
+    path = tmp_path / "lines.gz"
+    path.write_bytes(gzip.compress(b"a\nb") + gzip.compress(b"c\n" * 100_000))
+    lines = list(iter_gzip_lines(path, block_size=1024, prefetch=1))
+    assert lines == [b"a", b"bc"] + [b"c"] * 99_999
+
+
+def test_only_utf8(tmp_path):
+    path = tmp_path / "locations.jsonl"
+    JSONStore.save_lines(LOCATIONS, path, encoding="UTF8")
+    assert list(JSONStore.load_lines(path, TideLocation, encoding="utf_8")) == LOCATIONS
+    with pytest.raises(ValueError):
+        JSONStore.save_lines(LOCATIONS, path, encoding="latin-1")
+    with pytest.raises(ValueError):
+        JSONStore.load_lines(path, TideLocation, encoding="latin-1")
+    with pytest.raises(ValueError):
+        JSONStore.load_lines(path, TideLocation, encoding="no-such-codec")
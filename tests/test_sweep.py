@@ -0,0 +1,131 @@
+import datetime
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, Set
+
+import pytest
+
+from tidal.db import TidalDatabase
+from tidal.journal import DONE, PENDING
+
+ENGINES = ["async", "process"]
+
+
+@pytest.fixture
+def sweep(run_script) -> Callable[..., dict]:
+    """runs collect_tides_info.py to the end, returns its metrics report"""
+
+    def run(config_file: Path, engine: str, *options: str) -> dict:
+        report_file = config_file.parent / "report.json"
+        workers = ["-k", "4"] if engine == "async" else ["-n", "2"]
+        result = run_script(
+            "collect_tides_info.py",
+            "-c",
+            str(config_file),
+            "--engine",
+            engine,
+            *workers,
+            "--metrics-file",
+            str(report_file),
+            *options,
+        )
+        assert result.returncode == 0, result.stderr
+        return json.loads(report_file.read_text())
+
+    return run
+
+
+def stored_ports(database_file: Path) -> Set[str]:
+    """port_ids with tides in the database"""
+    tide_database = TidalDatabase(database_file, "tidal")
+    now = datetime.datetime.utcnow()
+    tides = tide_database.query_tides_by_location(
+        None, now - datetime.timedelta(days=2), now + datetime.timedelta(days=10)
+    )
+    port_ids = {location.port_id for location, _ in tides}
+    tide_database.close()
+    return port_ids
+
+
+def journal_statuses(database_file: Path) -> Dict[str, str]:
+    """port_id -> status in the latest sweep of the journal"""
+    con = sqlite3.connect(database_file)
+    try:
+        rows = con.execute(
+            "SELECT port_id, status FROM sweep_ports "
+            "WHERE sweep_id = (SELECT MAX(sweep_id) FROM sweeps)"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # not created yet
+        rows = []
+    finally:
+        con.close()
+    return dict(rows)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_sweep_stores_every_port(sweep, config_file, fixture_server, num_ports, engine):
+    report = sweep(config_file, engine)
+    assert report["num_success"] == num_ports
+    assert report["failed_port_ids"] == []
+    assert len(stored_ports(config_file.parent / "tidal.db")) == num_ports
+    assert sum(fixture_server.requests.values()) == num_ports
+
+    # the pages are cached and their tides stored, nothing to write again
+    report = sweep(config_file, engine)
+    assert report["num_unchanged"] == num_ports
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_cache_refills_fresh_database(sweep, config_file, num_ports, engine):
+    database_file = config_file.parent / "tidal.db"
+    sweep(config_file, engine)
+    for path in database_file.parent.glob("tidal.db*"):
+        path.unlink()
+
+    # a warm cache must not pass the ports off as unchanged
+    report = sweep(config_file, engine)
+    assert report["num_unchanged"] == 0
+    assert len(stored_ports(database_file)) == num_ports
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_resume_after_crash(sweep, start_script, config_file, fixture_server, num_ports, engine):
+    database_file = config_file.parent / "tidal.db"
+    # slow enough to be killed halfway
+    fixture_server.latency = 0.1
+    process = start_script(
+        "collect_tides_info.py",
+        "-c",
+        str(config_file),
+        "--engine",
+        engine,
+        "--fixed",
+        "-k",
+        "1",
+        "-n",
+        "1",
+        "-b",
+        "1",
+    )
+    deadline = time.monotonic() + 60
+    while list(journal_statuses(database_file).values()).count(DONE) < 3:
+        assert process.poll() is None, "the sweep ended before it could be killed"
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    process.kill()
+    process.wait()
+
+    statuses = journal_statuses(database_file)
+    pending = {port_id for port_id, status in statuses.items() if status == PENDING}
+    assert pending
+
+    fixture_server.latency = 0.0
+    report = sweep(config_file, engine, "--resume")
+    # only the ports not done before the crash are fetched again
+    assert report["num_locations"] == len(pending)
+    assert report["failed_port_ids"] == []
+    assert len(stored_ports(database_file)) == num_ports
+    assert PENDING not in journal_statuses(database_file).values()
@@ -0,0 +1,135 @@
+import configparser
+import datetime
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import click
+
+from tidal.db import TidalDatabase
+from tidal.stats import BEST_BY
+from tidal.tide_dto import PortID, TidePhase
+
+
+def _height(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+@click.command()
+@click.option("-c", "--config-file", default="config.cfg", help="path to config file")
+@click.option(
+    "-p",
+    "--port-id",
+    "port_ids",
+    multiple=True,
+    type=PortID,
+    help="port-ids to show, if not specified all ports in the database are shown.",
+)
+@click.option(
+    "--start-date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    default=None,
+    help="first UTC day, default today",
+)
+@click.option("-d", "--days", type=int, default=7, help="num of days to show, default 7")
+@click.option(
+    "--best",
+    type=click.Choice(list(BEST_BY)),
+    default=None,
+    help="only the best day of each port",
+)
+@click.option(
+    "-t", "--low-at-most", type=float, default=None, help="only days with a low tide this low"
+)
+@click.option(
+    "-T",
+    "--high-at-least",
+    type=float,
+    default=None,
+    help="only days with a high tide this high",
+)
+@click.option(
+    "--phase",
+    type=click.Choice([phase.value.lower() for phase in TidePhase]),
+    default=None,
+    help="only spring or neap days",
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="recompute the statistics of every day from the tides first",
+)
+@click.option("-v", "--verbose", is_flag=True, help="increase output verbosity")
+def main(
+    config_file: str,
+    port_ids: List[PortID],
+    start_date: Optional[datetime.datetime],
+    days: int,
+    best: Optional[str],
+    low_at_most: Optional[float],
+    high_at_least: Optional[float],
+    phase: Optional[str],
+    rebuild: bool,
+    verbose: bool,
+):
+    config = configparser.ConfigParser()
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
+        datefmt="%d-%m-%Y:%H:%M:%S",
+        level=log_level,
+    )
+    try:
+        with open(config_file) as f:
+            config.read_file(f)
+    except IOError:
+        logging.error(f"config file {config_file} not found!")
+        exit(-1)
+
+    tide_database = TidalDatabase(
+        Path(config["DEFAULT"].get("DATABASE_NAME")),
+        config["DEFAULT"].get("DATABASE_TIDE_TABLE_NAME"),
+    )
+    try:
+        tide_database.create_table(drop_existing=False)
+    except RuntimeError as e:
+        logging.error(str(e))
+        exit(-1)
+    stats = tide_database.stats
+    if rebuild:
+        with tide_database.con:
+            num_days = stats.rebuild(tide_database.con, tide_database.partitions)
+        logging.info(f"daily statistics of {num_days} days computed")
+
+    start_day = (start_date or datetime.datetime.utcnow()).date()
+    end_day = start_day + datetime.timedelta(days=days - 1)
+    if best is not None:
+        rows = stats.best_days(
+            tide_database.con, start_day, end_day, port_ids=port_ids or None, by=best
+        )
+    else:
+        rows = stats.matching_days(
+            tide_database.con,
+            start_day,
+            end_day,
+            port_ids=port_ids or None,
+            low_at_most=low_at_most,
+            high_at_least=high_at_least,
+            phase=None if phase is None else TidePhase(phase.capitalize()),
+        )
+    tide_database.close()
+
+    click.echo(f"{'port':>8} {'day':>10} {'tides':>5} {'low':>6} {'high':>6} {'range':>6}  phase")
+    for day in rows:
+        click.echo(
+            f"{day.port_id:>8} {day.day.isoformat():>10} {day.num_tides:>5} "
+            f"{_height(day.min_low):>6} {_height(day.max_high):>6} "
+            f"{_height(day.tidal_range):>6}  {day.phase.value if day.phase else ''}"
+        )
+
+
+if __name__ == "__main__":
+    main()